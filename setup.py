@@ -21,7 +21,12 @@ setup(
         "src/somatic/add_mapping_tags.py",
         "src/somatic/make_panel_of_normals_cleaner.sh",
     ],
-    entry_points={"console_scripts": ["cuddlySV=cuddlySV:cuddlySV.run"]},
+    entry_points={
+        "console_scripts": [
+            "cuddlySV=cuddlySV:cuddlySV.run",
+            "cuddlySV-merge=cuddlySV.merge:run",
+        ]
+    },
     # long_description = LONG_DESCRIPTION,
     long_description=readme,
     long_description_content_type="text/markdown",
@@ -36,7 +41,6 @@ setup(
     install_requires=[
         "pysam",
         "ncls",
-        "Cigar",
         "numpy",
         "pyfastx",
         "scipy",
@@ -1,9 +1,43 @@
 import argparse
+import functools
 import sys
 import logging
-from typing import Dict, Iterable, List, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 from pathlib import Path
 
+from .columns import (
+    COLUMN_INDEX,
+    COLUMNS_DIR,
+    build_columns,
+    column_records,
+    load_columns,
+    parse_record,
+    read_column_index,
+    slice_columns,
+)
+from .read_names import PROBED_NAMES, ProbedIds, ReadId, load_probed, parse_read_id
+from .alignment_stream import is_stream
+from .thread_budget import AUTO, htslib_threads_arg
+from .reads_store import (
+    READS_STORE,
+    iter_reads,
+    load_reads_columns,
+    read_reads_header,
+)
+from .signatures import (
+    SHARD_INDEX,
+    COMPRESSED_SUFFIX,
+    SIDECAR_SUFFIX,
+    SORT_KEYS,
+    index_sigs_file,
+    merge_unique,
+    range_bytes,
+    read_shard_index,
+    shard_lines,
+    shard_offsets,
+    write_shard_index,
+)
+
 if sys.version_info >= (3, 8):
     from importlib import metadata
 else:
@@ -19,20 +53,64 @@ class WorkDir:
         if not self.temporary_dir.is_dir:
             raise FileNotFoundError("[Errno 2] No such directory: '%s'" % temporary_dir)
 
+    def __reduce__(self):
+        # Pickled by path, so that tasks do not carry the loaded indices. Worker
+        # processes share one instance per path and state of the indexed files.
+        return (open_work_dir, (str(self.temporary_dir), self.index_stamp()))
+
+    def index_stamp(self) -> Tuple[Optional[int], ...]:
+        "Modification times of the index files cached by the instance"
+        stamp = list()
+        for name in (SHARD_INDEX, READS_STORE, Path(COLUMNS_DIR) / COLUMN_INDEX):
+            try:
+                stamp.append((self.temporary_dir / name).stat().st_mtime_ns)
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
     @property
     def path(self):
         return self.temporary_dir
 
     @property
-    def idx(self) -> Dict[str, Dict[Union[str, Tuple[str, str]], int]]:
-        """Return starting file positions of chr or (chr1,chr2) in signature files. First level of
-        indexing is the signature type
+    def sharded(self) -> bool:
+        "True if the signatures are in per task shards instead of merged TYPE.sigs"
+        return (self.temporary_dir / SHARD_INDEX).exists()
+
+    @property
+    def shard_dir(self) -> Path:
+        "Directory of the signature files named in idx"
+        return self.temporary_dir / "signatures" if self.sharded else self.temporary_dir
+
+    @property
+    def columnar(self) -> bool:
+        "True if the signatures are also in the binary columnar store"
+        return (self.temporary_dir / COLUMNS_DIR / COLUMN_INDEX).exists()
+
+    @property
+    def reads_stored(self) -> bool:
+        "True if the read coordinates are in the binary reads store"
+        return (self.temporary_dir / READS_STORE).exists()
+
+    @property
+    def idx(self) -> Dict[str, Dict[Union[str, Tuple[str, str]], Any]]:
+        """Return byte ranges of chr or (chr1,chr2) in signature files. First level of
+        indexing is the signature file TYPE.sigs. The ranges are lists of
+        (file name in shard_dir, start, end).
 
         Returns:
-            Dict[svtype,Dict[Union[chrom,Tuple[chrom1,chrom2]],int]]: _description_
+            Dict[str,Dict[Union[chrom,Tuple[chrom1,chrom2]],List[Tuple[str,int,int]]]]
         """
         if not hasattr(self, "_index"):
-            self._index = self.index_temp_files()
+            if self.sharded:
+                self._index = {
+                    f"{svtype}.sigs": chrd
+                    for svtype, chrd in read_shard_index(
+                        self.temporary_dir / SHARD_INDEX
+                    ).items()
+                }
+            else:
+                self._index = self.index_temp_files()
         return self._index
 
     def temp_dir_empty(self) -> bool:
@@ -44,6 +122,8 @@ class WorkDir:
         Returns:
             bool: True if any necessary file in the workdir is empty or missing
         """
+        if self.sharded:
+            return False
         for kind in ["DEL", "DUP", "INS", "INV", "TRA", "reads"]:
             f = self.temporary_dir / f"{kind}.sigs"
             if not f.exists():
@@ -68,6 +148,8 @@ class WorkDir:
         v = {}
         for svtype, chrd in self.idx.items():
             svtype = svtype.split(".")[0]
+            if svtype == "reads":
+                continue
             if svtype == "TRA":
                 v[svtype] = {}
                 for chr1, chr2 in chrd.keys():
@@ -93,55 +175,212 @@ class WorkDir:
         Yields:
             Iterator[Iterable[str]]: _description_
         """
-        fpath = self.path / f"{svtype}.sigs"
-        with fpath.open("rt") as f:
-            end_pos = sys.maxsize
-            k = chrom if chrom2 is None else (chrom, chrom2)
-            try:
-                pos = self.idx[fpath.name][k]
-                greater_end_pos = [x for x in self.idx[fpath.name].values() if x > pos]
-                if len(greater_end_pos) > 0:
-                    end_pos = min(greater_end_pos)
-                f.seek(pos)
-            except KeyError:
-                logging.warning("Couldn't find %s from %s", str(k), str(fpath))
-
-            line = f.readline()
-            while line != "" and f.tell() <= end_pos:
-                yield line
-                line = f.readline()
+        k = chrom if chrom2 is None else (chrom, chrom2)
+        yield from self.merged_shard_lines(svtype, k)
 
-    def index_temp_files(self):
-        """Find the start positions in the sig files
+    def merged_shard_lines(
+        self, svtype: str, k: Union[str, Tuple[str, str]]
+    ) -> Iterable[str]:
+        """Generate lines of chromosome k from its byte ranges in the signature files.
 
-        Raises:
-            IOError: _description_
+        Signatures are merged from the sorted ranges, read lines are concatenated.
         """
-        idxs = {}
-        for sigfile in self.temporary_dir.glob("*.sigs"):
-            if sigfile.name == "reads.sigs":
-                continue
+        try:
+            ranges = self.idx[f"{svtype}.sigs"][k]
+        except KeyError:
+            if svtype != "reads":
+                logging.warning("Couldn't find %s from %s shards", str(k), svtype)
+            return
+        shards = self.shard_dir
+        runs = [shard_lines(shards / name, start, end) for name, start, end in ranges]
+        if svtype == "reads":
+            for run in runs:
+                yield from run
+        else:
+            yield from merge_unique(runs, SORT_KEYS[svtype])
+
+    def signature_bytes(self, svtype: str, chrom: str, chrom2=None) -> int:
+        """Return the size of the lines of chrom (and chrom2 for TRA) in the svtype files.
+
+        The size of compressed lines is an estimate, see signatures.range_bytes.
+        """
+        k = chrom if chrom2 is None else (chrom, chrom2)
+        ranges = self.idx.get(f"{svtype}.sigs", {}).get(k, [])
+        return sum(range_bytes(name, start, end) for name, start, end in ranges)
+
+    def column_dir(
+        self, svtype: str, chrom: str, chrom2=None
+    ) -> Optional[Tuple[Path, int]]:
+        """Return the column directory of chrom (and chrom2 for TRA).
+
+        Returns:
+            Optional[Tuple[Path, int]]: The directory and its number of signatures, None
+                if the work dir has no columnar store or no such signatures.
+        """
+        if not hasattr(self, "_column_index"):
+            self._column_index = (
+                read_column_index(self.temporary_dir / COLUMNS_DIR / COLUMN_INDEX)
+                if self.columnar
+                else {}
+            )
+        k = chrom if chrom2 is None else (chrom, chrom2)
+        try:
+            name, count = self._column_index[svtype][k]
+        except KeyError:
+            return None
+        return self.temporary_dir / COLUMNS_DIR / name, count
+
+    def columns(
+        self, svtype: str, chrom: str, chrom2=None
+    ) -> Optional[Dict[str, Any]]:
+        """Return memory-mapped signature columns of chrom (and chrom2 for TRA).
+
+        Returns:
+            Optional[Dict[str, Any]]: Arrays by column name (see columns.py), None if the
+                work dir has no columnar store or no such signatures.
+        """
+        column_dir = self.column_dir(svtype, chrom, chrom2)
+        if column_dir is None:
+            return None
+        return load_columns(column_dir[0], svtype)
+
+    def signature_columns(
+        self,
+        svtype: str,
+        chrom: str,
+        chrom2=None,
+        piece: Optional[Tuple[int, int]] = None,
+    ) -> Dict[str, Any]:
+        """Return the signature columns of chrom (and chrom2 for TRA) in the order of lines.
+
+        The columns are memory-mapped from the columnar store if there is one, otherwise
+        parsed from lines. See columns.load_columns.
 
-            idxs[sigfile.name] = {}
-            prev_chrom = None
+        Args:
+            piece (Optional[Tuple[int, int]]): Index range [start, end) of the
+                signatures to return, None for all.
+        """
+        columns = self.columns(svtype, chrom, chrom2)
+        if columns is None:
+            columns = build_columns(svtype, self.lines(svtype, chrom, chrom2))
+        if piece is not None:
+            columns = slice_columns(svtype, columns, *piece)
+        return columns
+
+    def signatures(self, svtype: str, chrom: str, chrom2=None) -> Iterable[tuple]:
+        """Generate parsed signatures of chrom (and chrom2 for TRA) in the order of lines.
+
+        The records are from the columnar store if there is one, otherwise parsed from
+        lines. See columns.COLUMNS for the fields of each type.
+        """
+        columns = self.columns(svtype, chrom, chrom2)
+        if columns is not None:
+            yield from column_records(svtype, columns)
+        else:
+            for line in self.lines(svtype, chrom, chrom2):
+                yield parse_record(svtype, line)
+
+    def reads_header(self):
+        "Return the data offset and chromosome blocks of the reads store, read once"
+        if not hasattr(self, "_reads_header"):
+            self._reads_header = read_reads_header(self.temporary_dir / READS_STORE)
+        return self._reads_header
+
+    def probed_ids(self) -> ProbedIds:
+        "Return the read IDs that differ from the hash of the name, read once"
+        if not hasattr(self, "_probed_ids"):
+            self._probed_ids = load_probed(self.temporary_dir / PROBED_NAMES)
+        return self._probed_ids
+
+    def reads(
+        self, chrom: str, region: Optional[Tuple[float, float]] = None
+    ) -> Iterable[Tuple[int, int, int, ReadId]]:
+        """Generate the (start, end, primary, read ID) of the alignments on chrom.
+
+        The reads are memory-mapped from the reads store if there is one, otherwise
+        parsed from reads.sigs, or the read shards.
 
-            logging.info("Starting to index %s", str(sigfile))
-            with sigfile.open("rt") as inf:
-                while True:
-                    f_line = inf.readline()
-                    if f_line == "":
-                        break
+        Args:
+            region (Optional[Tuple[float, float]]): Only the reads overlapping the open
+                interval (start, end), None for all.
+        """
+        if self.reads_stored:
+            data_start, blocks = self.reads_header()
+            columns = load_reads_columns(
+                self.temporary_dir / READS_STORE, chrom, data_start, blocks
+            )
+            if region is not None:
+                overlap = (columns["start"] < region[1]) & (columns["end"] > region[0])
+                columns = {name: column[overlap] for name, column in columns.items()}
+            yield from iter_reads(columns)
+        else:
+            for line in self.lines("reads", chrom):
+                seq = line.rstrip("\n").split("\t")
+                start, end = int(seq[1]), int(seq[2])
+                if region is None or (start < region[1] and end > region[0]):
+                    yield start, end, int(seq[3]), parse_read_id(seq[4])
+
+    def read_counts(self) -> Dict[str, int]:
+        "Return the number of alignments on each chromosome"
+        if self.reads_stored:
+            return {chrom: n for chrom, (n, _) in self.reads_header()[1].items()}
+        counts: Dict[str, int] = dict()
+        for line in self.all_reads():
+            chrom = line.split("\t", 1)[0]
+            counts[chrom] = counts.get(chrom, 0) + 1
+        return counts
+
+    def all_reads(self) -> Iterable[str]:
+        "Generate lines of reads.sigs, or the read shards or store, of all chromosomes"
+        if self.reads_stored:
+            for chrom in self.reads_header()[1]:
+                for read in self.reads(chrom):
+                    yield "%s\t%d\t%d\t%d\t%s\n" % ((chrom,) + read)
+        elif self.sharded:
+            for chrom in self.idx.get("reads.sigs", {}):
+                yield from self.merged_shard_lines("reads", chrom)
+        else:
+            reads_path = self.path / "reads.sigs"
+            if not reads_path.exists():
+                reads_path = reads_path.with_name(reads_path.name + COMPRESSED_SUFFIX)
+            for _, _, line in shard_offsets(reads_path):
+                yield line.decode()
 
-                    if sigfile.name in ("INS.sigs", "DUP.sigs", "DEL.sigs", "INV.sigs"):
-                        cur_chrom = f_line.split("\t")[1]
-                    elif sigfile.name in ("TRA.sigs"):
-                        parts = f_line.split("\t")
-                        cur_chrom = parts[1], parts[4]
+    def index_temp_files(self):
+        """Find the ranges of chromosomes in the merged .sigs (or BGZF .sigs.gz) files.
 
-                    if prev_chrom != cur_chrom:
-                        c_pos = inf.tell() - len(f_line)
-                        idxs[sigfile.name][cur_chrom] = c_pos
-                        prev_chrom = cur_chrom
+        The ranges are loaded from the sidecar index TYPE.sigs(.gz).idx unless the file
+        has changed after it was written. Otherwise the file is scanned and the sidecar
+        index written, if the work dir is writable.
+        """
+        idxs = {}
+        sigfiles = list(self.temporary_dir.glob("*.sigs"))
+        sigfiles += self.temporary_dir.glob("*.sigs" + COMPRESSED_SUFFIX)
+        for sigfile in sigfiles:
+            svtype = sigfile.name.split(".")[0]
+            compressed = sigfile.name.endswith(COMPRESSED_SUFFIX)
+            sidecar = sigfile.with_name(sigfile.name + SIDECAR_SUFFIX)
+            sigs_stat = sigfile.stat()
+            ranges = None
+            if sidecar.exists() and sidecar.stat().st_mtime >= sigs_stat.st_mtime:
+                ranges = read_shard_index(sidecar).get(svtype, {})
+                indexed_size = max(
+                    (end for chrd in ranges.values() for _, _, end in chrd), default=0
+                )
+                if not compressed and indexed_size != sigs_stat.st_size:
+                    logging.info("Index %s is stale.", str(sidecar))
+                    ranges = None
+            if ranges is None:
+                logging.info("Starting to index %s", str(sigfile))
+                entries = index_sigs_file(sigfile, svtype)
+                try:
+                    write_shard_index(sidecar, entries)
+                except OSError as exc:
+                    logging.warning("Couldn't write index %s: %s", str(sidecar), exc)
+                ranges = {}
+                for _, key, name, start, end in entries:
+                    ranges.setdefault(key, list()).append((name, start, end))
+            idxs[f"{svtype}.sigs"] = ranges
 
         logging.info("Indexing done!")
         return idxs
@@ -189,6 +428,12 @@ class cuddlySVdp(object):
     # MinSizeDel = 'For current version of cuteSV, it can detect deletions larger than this size.'
 
 
+@functools.lru_cache(maxsize=None)
+def open_work_dir(temporary_dir: str, _index_stamp=None) -> WorkDir:
+    "Return the WorkDir of a path, shared by the tasks of a worker process"
+    return WorkDir(temporary_dir)
+
+
 def parseArgs(argv):
     parser = argparse.ArgumentParser(
         prog="cuddlySV",
@@ -208,7 +453,9 @@ def parseArgs(argv):
         "input",
         metavar="[BAM]",
         type=str,
-        help="Sorted .bam file from NGMLR or Minimap2.",
+        help="Sorted .bam file from NGMLR or Minimap2, or '-' for SAM/BAM sorted by "
+        "coordinate from standard input. Translocations from standard input are "
+        "genotyped from the stored alignments with at least --min_mapq.",
     )
     parser.add_argument(
         "reference", type=str, help="The reference genome in fasta format."
@@ -226,6 +473,13 @@ def parseArgs(argv):
         default=16,
         type=int,
     )
+    parser.add_argument(
+        "--htslib_threads",
+        help="Size of the htslib thread pool decompressing alignments in each worker, "
+        "taken from --threads. 'auto' chooses by the input format.[%(default)s]",
+        default=AUTO,
+        type=htslib_threads_arg,
+    )
     parser.add_argument(
         "--verbose",
         help="Verbose output.[%(default)s]",
@@ -235,7 +489,7 @@ def parseArgs(argv):
     parser.add_argument(
         "-b",
         "--batches",
-        help="Batch of genome segmentation interval.[%(default)s]",
+        help="Maximum length of genome segmentation interval. Intervals are shorter in regions with many alignments.[%(default)s]",
         default=10000000,
         type=int,
     )
@@ -249,6 +503,22 @@ def parseArgs(argv):
         help="Enable to retain temporary folder and files.",
         action="store_true",
     )
+    parser.add_argument(
+        "--compress_signatures",
+        help="Write signatures BGZF compressed with virtual offsets in the work dir index.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--columnar_signatures",
+        help="Store signatures also in binary columns which are memory-mapped for clustering.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cluster_piece_size",
+        help="Split the clustering of chromosomes with more signatures in the columnar store to tasks of at least this many signatures, at gaps no cluster crosses. 0 to cluster whole chromosomes.[%(default)s]",
+        default=100000,
+        type=int,
+    )
 
     parser.add_argument(
         "--report_readid",
@@ -310,6 +580,17 @@ def parseArgs(argv):
         default=None,
         type=str,
     )
+    GroupSignaturesCollect.add_argument(
+        "--two_pass_ins_seq",
+        help="Store only read coordinates of inserted sequences when collecting signatures. \
+			Sequences of the called insertions are fetched from the alignment file.",
+        action="store_true",
+    )
+    GroupSignaturesCollect.add_argument(
+        "--decode_all_fields",
+        help="Decode all fields of CRAM records. By default only the fields needed for signature collection are decoded.",
+        action="store_true",
+    )
     # The min_read_len in last version is 2000.
     # signatures with overlap need to be filtered
 
@@ -466,6 +747,11 @@ def parseArgs(argv):
     # 	default = 20, type = int)
 
     args = parser.parse_args(argv)
+    if is_stream(args.input) and args.two_pass_ins_seq:
+        parser.error(
+            "--two_pass_ins_seq fetches sequences from the alignment file and can not "
+            "be used with input from standard input."
+        )
     return args
 
 
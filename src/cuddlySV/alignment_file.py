@@ -0,0 +1,114 @@
+"""Opening alignment files so that only the fields cuddlySV uses are decoded.
+
+htslib can skip decoding of unneeded fields from CRAM records. The fields are given as
+a bitmask of the SAM_* values below (as in htslib/sam.h). The option has no effect on
+BAM or SAM input.
+"""
+import functools
+import logging
+from typing import Optional
+
+import pysam
+
+from .read_names import ProbedIds, probed_read_id, read_id
+
+SAM_QNAME = 0x00000001
+SAM_FLAG = 0x00000002
+SAM_RNAME = 0x00000004
+SAM_POS = 0x00000008
+SAM_MAPQ = 0x00000010
+SAM_CIGAR = 0x00000020
+SAM_RNEXT = 0x00000040
+SAM_PNEXT = 0x00000080
+SAM_TLEN = 0x00000100
+SAM_SEQ = 0x00000200
+SAM_QUAL = 0x00000400
+SAM_AUX = 0x00000800
+SAM_RGAUX = 0x00001000
+
+# Fields for signature extraction: SA tag is in AUX, read group in RGAUX
+SIGNATURE_FIELDS = (
+    SAM_QNAME | SAM_FLAG | SAM_RNAME | SAM_POS | SAM_MAPQ | SAM_CIGAR | SAM_AUX | SAM_RGAUX
+)
+
+
+def signature_fields(need_sequence: bool = True) -> int:
+    """Return the fields needed for collecting SV signatures.
+
+    Args:
+        need_sequence (bool): Whether the inserted sequences are reported.
+
+    Returns:
+        int: Bitmask of SAM_* fields.
+    """
+    if need_sequence:
+        return SIGNATURE_FIELDS | SAM_SEQ
+    return SIGNATURE_FIELDS
+
+
+def open_alignment_file(
+    path, fields: Optional[int] = None, htslib_threads: int = 0
+) -> pysam.AlignmentFile:
+    """Open alignment file decoding only the given fields.
+
+    Args:
+        path: Path to BAM/CRAM/SAM file.
+        fields (Optional[int]): Bitmask of SAM_* fields to decode. All fields are decoded if None.
+        htslib_threads (int): Size of the htslib decompression thread pool, 0 for none.
+
+    Returns:
+        pysam.AlignmentFile: Opened alignment file.
+    """
+    # pysam starts a pool for more than one thread
+    threads = max(htslib_threads, 1)
+    if fields is None:
+        return pysam.AlignmentFile(path, threads=threads)
+    logging.debug("Opening %s with required_fields=0x%x", path, fields)
+    return pysam.AlignmentFile(
+        path, format_options=[b"required_fields=%d" % fields], threads=threads
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def cached_alignment_file(path, htslib_threads: int = 0) -> pysam.AlignmentFile:
+    "Open alignment file once per process, for many short queries"
+    return open_alignment_file(path, htslib_threads=htslib_threads)
+
+
+def get_query_name(read: pysam.AlignedSegment) -> str:
+    """Get aligned read name annotated with source of th read
+
+    Args:
+        read (pysam.AlignedSegment): Alignment info from pysam/bam/cram
+
+    Returns:
+        str: Read name in format 'query_name:read_group:haplotype:phase_set
+    """
+    rg = get_read_group(read)
+    # try:
+    #     hp = str(read.get_tag("HP"))
+    # except KeyError:
+    #     hp = ""
+    # try:
+    #     ps = str(read.get_tag("PS"))
+    # except KeyError:
+    #     ps = ""
+    read_name = ":".join([read.query_name, rg])
+    return read_name
+
+
+def get_read_group(read: pysam.AlignedSegment) -> str:
+    "Get read group of the read, empty if it has none"
+    try:
+        return read.get_tag("RG")
+    except KeyError:
+        return ""
+
+
+def get_read_id(
+    read: pysam.AlignedSegment, probed: Optional[ProbedIds] = None
+) -> int:
+    "Get the integer ID of the read name annotated with its read group"
+    if probed:
+        return probed_read_id(read.query_name, get_read_group(read), probed)
+    return read_id(read.query_name, get_read_group(read))
@@ -0,0 +1,117 @@
+"""Signature collection from a coordinate sorted alignment stream.
+
+With input '-' the alignments are read in one pass from SAM or BAM sorted by coordinate
+on standard input, e.g. from `minimap2 ... | samtools sort`, without an index. The main
+process cuts the stream into tasks along windows of --batches bp on each contig. A task
+ends early, at the start of an alignment, when its alignments exceed STREAM_TASK_BYTES
+of SAM text, so deep regions do not make large tasks. The alignments of a task are sent
+to a worker as SAM lines, which it parses with the header saved in the work directory.
+
+Each alignment belongs to the task containing its start, as with indexed input, so the
+work directory has the same signatures and reads as one from the indexed file. Only the
+tasks, i.e. the shard boundaries, differ. A stream can not be read again, so its tasks
+are not resumed, and translocations are not genotyped from the alignments.
+"""
+import functools
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import pysam
+
+STREAM = "-"
+STREAM_HEADER = "stream_header.sam"
+# SAM text of the alignments of a task before it is cut
+STREAM_TASK_BYTES = 1 << 26
+
+
+def is_stream(path: str) -> bool:
+    "True if the alignments are read from standard input"
+    return path == STREAM
+
+
+def write_stream_header(path: Path, header: pysam.AlignmentHeader):
+    "Save the header of the stream for the workers"
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wt") as f:
+        f.write(str(header))
+    tmp_path.replace(path)
+
+
+@functools.lru_cache(maxsize=4)
+def load_stream_header(path: Path) -> pysam.AlignmentHeader:
+    "Load the saved header of the stream, once per worker process"
+    with open(path, "rt") as f:
+        return pysam.AlignmentHeader.from_text(f.read())
+
+
+def parse_alignments(
+    header: pysam.AlignmentHeader, lines: List[str]
+) -> Iterator[pysam.AlignedSegment]:
+    "Generate the alignments of SAM lines"
+    for line in lines:
+        yield pysam.AlignedSegment.fromstring(line, header)
+
+
+def stream_tasks(
+    alignments: pysam.AlignmentFile,
+    batch_length: int,
+    task_bytes: int = STREAM_TASK_BYTES,
+) -> Iterator[Tuple[List, List[str]]]:
+    """Cut a coordinate sorted alignment stream to tasks.
+
+    Args:
+        alignments (pysam.AlignmentFile): The opened stream.
+        batch_length (int): Length of the windows of the tasks, --batches.
+        task_bytes (int): SAM text of the alignments of a task before it is cut.
+
+    Raises:
+        ValueError: If the stream is not sorted by coordinate.
+
+    Yields:
+        Iterator[Tuple[List, List[str]]]: Task [chrom, start, end] and the SAM lines of
+            the alignments starting in it. Tasks without alignments are not generated.
+    """
+    lengths = alignments.lengths
+    task = None
+    lines: List[str] = list()
+    size = 0
+    prev = (-1, -1)
+    for read in alignments.fetch(until_eof=True):
+        tid = read.reference_id
+        pos = read.reference_start
+        if tid < 0:
+            # Unplaced reads are last
+            break
+        if (tid, pos) < prev:
+            raise ValueError(
+                "Alignments are not sorted by coordinate: %s:%d after %s:%d."
+                % (
+                    read.reference_name,
+                    pos,
+                    alignments.get_reference_name(prev[0]),
+                    prev[1],
+                )
+            )
+        if task is not None and (
+            tid != task[0] or pos >= task[2] or (size >= task_bytes and pos > prev[1])
+        ):
+            start = task[1]
+            if tid == task[0] and pos < task[2]:
+                # Cut the task at the start of the alignment
+                yield [read.reference_name, start, pos], lines
+                task = (tid, pos, task[2])
+            else:
+                yield [alignments.get_reference_name(task[0]), start, task[2]], lines
+                task = None
+            lines = list()
+            size = 0
+        prev = (tid, pos)
+        if task is None:
+            window = pos // batch_length
+            end = min((window + 1) * batch_length, max(lengths[tid], pos + 1))
+            task = (tid, window * batch_length, end)
+        line = read.to_string()
+        lines.append(line)
+        size += len(line)
+    if task is not None:
+        yield [alignments.get_reference_name(task[0]), task[1], task[2]], lines
@@ -0,0 +1,171 @@
+"""Checkpoints of the signature collection tasks.
+
+A run records the parameters of signature collection and its partition of the genome to
+tasks in tasks.manifest of the work directory. Each finished task records its outputs in
+signatures/_{chrom}_{start}_{end}.task: the digest of the parameters, the byte ranges of
+its shards and a checksum of each of its files. The record is written after the outputs,
+so that a task interrupted while writing has no record.
+
+When a run with the same parameters finds a work directory without the shard index,
+i.e. one of an interrupted run, it takes the tasks from the manifest and runs only those
+without a valid record. The read names, reads store and shard index of the work
+directory are then rebuilt from the records of all tasks.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .read_names import ProbedIds
+from .signatures import ShardEntry
+
+TASK_MANIFEST = "tasks.manifest"
+TASK_SUFFIX = ".task"
+# Task prefix of a file name. Chromosome names may contain dots.
+PREFIX_RE = re.compile(r"^(_.*_\d+_\d+)\.")
+
+# {"task": shard prefix, "params": digest, "entries": shard ranges,
+#  "files": {file name: checksum}, "metrics": see metrics.py,
+#  "probed": probed read IDs of the task, see read_names.py}
+TaskRecord = Dict[str, Any]
+
+
+def task_prefix(task) -> str:
+    "Prefix of the output files of task [chrom, start, end]"
+    return "_%s_%d_%d" % (task[0], task[1], task[2])
+
+
+def params_digest(params: Dict[str, Any]) -> str:
+    "Digest of JSON serializable parameters"
+    return hashlib.blake2b(
+        json.dumps(params, sort_keys=True).encode(), digest_size=16
+    ).hexdigest()
+
+
+def file_checksum(path: Path) -> str:
+    "blake2b checksum of the file contents"
+    checksum = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def write_json(path: Path, data):
+    "Write data to path through a temporary file"
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wt") as f:
+        json.dump(data, f)
+    tmp_path.replace(path)
+
+
+def read_json(path: Path) -> Optional[Any]:
+    "Read JSON file, None if it is missing or unreadable"
+    try:
+        with open(path, "rt") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path: Path, params: Dict[str, Any], batches: List[List]):
+    "Write the parameters and the task batches of the run"
+    write_json(path, {"params": params, "batches": batches})
+
+
+def read_manifest(path: Path, params: Dict[str, Any]) -> Optional[List[List]]:
+    "Return the task batches of the manifest, None if missing or for other parameters"
+    manifest = read_json(path)
+    if manifest is None or manifest.get("params") != params:
+        return None
+    return manifest["batches"]
+
+
+def write_task_record(
+    signatures_path: Path,
+    task,
+    digest: str,
+    entries: List[ShardEntry],
+    files: Iterable[str] = (),
+    metrics: Optional[Dict[str, Any]] = None,
+    probed: Optional[ProbedIds] = None,
+) -> TaskRecord:
+    """Record the outputs of a finished task.
+
+    Args:
+        signatures_path (Path): The signatures/ directory of the work dir.
+        task (List): Region [chrom, start, end] of the task.
+        digest (str): Digest of the parameters of the run.
+        entries (List[ShardEntry]): Ranges of the shards written by the task.
+        files (Iterable[str]): Other files written by the task, if they exist.
+        metrics (Optional[Dict[str, Any]]): Counters and timers of the task.
+        probed (Optional[ProbedIds]): IDs of the reads of the task that are not their
+            hash.
+
+    Returns:
+        TaskRecord: The written record.
+    """
+    prefix = task_prefix(task)
+    names = set(entry[2] for entry in entries)
+    names.update(name for name in files if (signatures_path / name).exists())
+    record = {
+        "task": prefix,
+        "params": digest,
+        "entries": [list(entry) for entry in entries],
+        "files": {
+            name: file_checksum(signatures_path / name) for name in sorted(names)
+        },
+        "metrics": metrics,
+        "probed": [[name, rg, rid] for (name, rg), rid in (probed or {}).items()],
+    }
+    write_json(signatures_path / (prefix + TASK_SUFFIX), record)
+    return parse_task_record(record)
+
+
+def parse_task_record(record: TaskRecord) -> TaskRecord:
+    "Restore the shard entries and probed read IDs of a record read from JSON"
+    record["entries"] = [
+        (svtype, tuple(key) if isinstance(key, list) else key, name, start, end)
+        for svtype, key, name, start, end in record["entries"]
+    ]
+    record["probed"] = {
+        (name, rg): rid for name, rg, rid in record.get("probed", ())
+    }
+    return record
+
+
+def load_task_record(signatures_path: Path, task, digest: str) -> Optional[TaskRecord]:
+    """Return the record of a finished task.
+
+    Returns:
+        Optional[TaskRecord]: None if the task has no record, it was run with other
+            parameters or any of its files is missing or changed.
+    """
+    prefix = task_prefix(task)
+    record = read_json(signatures_path / (prefix + TASK_SUFFIX))
+    if record is None or record.get("params") != digest:
+        return None
+    for name, checksum in record["files"].items():
+        path = signatures_path / name
+        if not path.exists() or file_checksum(path) != checksum:
+            logging.info("Output %s of task %s has changed.", name, prefix)
+            return None
+    return parse_task_record(record)
+
+
+def remove_task_outputs(signatures_path: Path, prefixes: Set[str]):
+    "Remove the files, and records, of the tasks with the prefixes"
+    for name in os.listdir(signatures_path):
+        match = PREFIX_RE.match(name)
+        if match is not None and match.group(1) in prefixes:
+            os.unlink(signatures_path / name)
+
+
+def record_files(records: Iterable[TaskRecord], suffix: str) -> List[str]:
+    "Names of the files ending with suffix in the records"
+    return [
+        name for record in records for name in record["files"] if name.endswith(suffix)
+    ]
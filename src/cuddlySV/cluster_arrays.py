@@ -0,0 +1,453 @@
+"""Clustering of the signatures of a chromosome as NumPy arrays.
+
+The signatures are clustered from their columns (see WorkDir.signature_columns) instead
+of lists of records. Runs of consecutive elements, e.g. the signatures of a cluster or
+an allele, are segments given by their start offsets followed by the total length, and
+are reduced with ufunc.reduceat. The medians and means of the segments are rounded as
+int(np.median()) and np.mean() of the lists were, so the calls do not change.
+"""
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .columns import load_columns
+
+# Columns whose gaps over max_cluster_bias, and columns whose changes, between
+# consecutive signatures break the clusters of each type
+CLUSTER_BREAKS = {
+    "DEL": (("pos",), ()),
+    "INS": (("pos",), ()),
+    "DUP": (("pos_1",), ()),
+    "INV": (("bp_1", "bp_2"), ("strand",)),
+    "TRA": (("pos_1",), ("bnd_type",)),
+}
+
+# Called alleles of insertions or deletions in the order of calling. The signatures of
+# allele i, one per read and sorted by length, are members[bounds[i]:bounds[i + 1]].
+# Medians are rounded down and the offsets of the extremes are relative to them.
+IndelAlleles = namedtuple(
+    "IndelAlleles",
+    (
+        "members",
+        "bounds",
+        "pos_median",
+        "pos_low",
+        "pos_high",
+        "len_median",
+        "len_low",
+        "len_high",
+    ),
+)
+
+
+def cluster_breaks(
+    gaps: List[np.ndarray], changes: List[np.ndarray], max_cluster_bias: int
+) -> np.ndarray:
+    """True between consecutive signatures of different clusters.
+
+    Args:
+        gaps (List[np.ndarray]): Columns whose gaps over max_cluster_bias break clusters.
+        changes (List[np.ndarray]): Columns whose changes break clusters.
+    """
+    breaks = np.zeros(max(len(gaps[0]) - 1, 0), dtype=bool)
+    for values in gaps:
+        breaks |= np.diff(values) > max_cluster_bias
+    for values in changes:
+        breaks |= values[1:] != values[:-1]
+    return breaks
+
+
+def cluster_ids(
+    gaps: List[np.ndarray], changes: List[np.ndarray], max_cluster_bias: int
+) -> np.ndarray:
+    "Cluster of each signature, see cluster_breaks"
+    cluster = np.zeros(len(gaps[0]), dtype=np.int64)
+    np.cumsum(cluster_breaks(gaps, changes, max_cluster_bias), out=cluster[1:])
+    return cluster
+
+
+def run_bounds(*keys: np.ndarray) -> np.ndarray:
+    "Start offsets of the runs of equal consecutive keys, followed by their length"
+    n = len(keys[0])
+    starts = np.zeros(n, dtype=bool)
+    starts[:1] = True
+    for key in keys:
+        starts[1:] |= key[1:] != key[:-1]
+    return np.append(np.flatnonzero(starts), n)
+
+
+def segment_medians(values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    "int(np.median()) of the non-empty segments of values, sorted within the segments"
+    sizes = np.diff(bounds)
+    lower = values[bounds[:-1] + (sizes - 1) // 2].astype(np.float64)
+    upper = values[bounds[:-1] + sizes // 2]
+    return ((lower + upper) / 2).astype(np.int64)
+
+
+def segment_indices(starts: np.ndarray, sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    "Concatenated indices of the segments starting at starts, and their new bounds"
+    bounds = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=bounds[1:])
+    indices = np.arange(bounds[-1]) + np.repeat(starts - bounds[:-1], sizes)
+    return indices, bounds
+
+
+def closest_mean(values: np.ndarray, center: int, k: int) -> Tuple[float, int]:
+    """Mean of the k values closest to center and the closest value.
+
+    Ties are broken by the order of the values, as with a stable sort by the distance.
+    """
+    n = len(values)
+    key = np.abs(values - center) * n + np.arange(n)
+    if k < n:
+        nearest = np.argpartition(key, k - 1)[:k]
+    else:
+        nearest = np.arange(n)
+    return np.float64(values[nearest].sum()) / len(nearest), values[key.argmin()]
+
+
+def empty_indel_alleles() -> IndelAlleles:
+    empty = np.zeros(0, dtype=np.int64)
+    return IndelAlleles(empty, np.zeros(1, dtype=np.int64), *[empty] * 6)
+
+
+def indel_alleles(
+    pos: np.ndarray,
+    lens: np.ndarray,
+    reads: np.ndarray,
+    read_count: int,
+    max_cluster_bias: int,
+    threshold_gloab: float,
+    minimum_support_reads: int,
+) -> IndelAlleles:
+    """Cluster the insertion or deletion signatures of a chromosome to alleles.
+
+    The signatures are clustered at gaps over max_cluster_bias between consecutive
+    positions. Each read of a cluster keeps its first longest signature. The clusters of
+    at least read_count reads are split to alleles at gaps over threshold_gloab times the
+    mean length of the cluster between the sorted lengths. The alleles of at least
+    minimum_support_reads reads are called, by their number of reads within each cluster.
+
+    Args:
+        pos (np.ndarray): Positions of the signatures in the order of lines.
+        lens (np.ndarray): Lengths of the signatures.
+        reads (np.ndarray): Integer codes of the read IDs of the signatures.
+
+    Returns:
+        IndelAlleles: The called alleles.
+    """
+    pos = np.asarray(pos, dtype=np.int64)
+    lens = np.asarray(lens, dtype=np.int64)
+    reads = np.asarray(reads)
+    cluster = cluster_ids([pos], [], max_cluster_bias)
+    sizes = np.diff(run_bounds(cluster))
+    index = np.flatnonzero(np.repeat(sizes >= read_count, sizes))
+    if len(index) == 0:
+        return empty_indel_alleles()
+
+    # The first longest signature of each read of a cluster, and its first signature
+    order = index[np.lexsort((-lens[index], reads[index], cluster[index]))]
+    read_bounds = run_bounds(cluster[order], reads[order])
+    first = np.minimum.reduceat(order, read_bounds[:-1])
+    kept = order[read_bounds[:-1]]
+    sizes = np.diff(run_bounds(cluster[kept]))
+    enough = np.repeat(sizes >= read_count, sizes)
+    kept, first = kept[enough], first[enough]
+    if len(kept) == 0:
+        return empty_indel_alleles()
+
+    # Sorted by length and the first signatures of the reads, split to alleles
+    kept = kept[np.lexsort((first, lens[kept], cluster[kept]))]
+    length = lens[kept]
+    bounds = run_bounds(cluster[kept])
+    sizes = np.diff(bounds)
+    mean = np.add.reduceat(length, bounds[:-1]).astype(np.float64) / sizes
+    threshold = np.repeat(threshold_gloab * mean, sizes)
+    allele_start = np.zeros(len(kept), dtype=bool)
+    allele_start[1:] = np.diff(length) > threshold[1:]
+    allele_start[bounds[:-1]] = True
+    allele_bounds = np.append(np.flatnonzero(allele_start), len(kept))
+    allele_sizes = np.diff(allele_bounds)
+    allele_cluster = cluster[kept[allele_bounds[:-1]]]
+
+    called = np.flatnonzero(allele_sizes >= minimum_support_reads)
+    if len(called) == 0:
+        return empty_indel_alleles()
+    called = called[
+        np.lexsort((called, allele_sizes[called], allele_cluster[called]))
+    ]
+    indices, bounds = segment_indices(allele_bounds[called], allele_sizes[called])
+    members = kept[indices]
+
+    allele = np.repeat(np.arange(len(called)), allele_sizes[called])
+    positions = pos[members]
+    positions = positions[np.lexsort((positions, allele))]
+    pos_median = segment_medians(positions, bounds)
+    length = lens[members]
+    len_median = segment_medians(length, bounds)
+    return IndelAlleles(
+        members,
+        bounds,
+        pos_median,
+        np.minimum.reduceat(positions, bounds[:-1]) - pos_median,
+        np.maximum.reduceat(positions, bounds[:-1]) - pos_median,
+        len_median,
+        np.minimum.reduceat(length, bounds[:-1]) - len_median,
+        np.maximum.reduceat(length, bounds[:-1]) - len_median,
+    )
+
+
+# Called segments of signatures with two breakpoints, inversions or duplications, in the
+# order of calling. The signatures of segment i are members[bounds[i]:bounds[i + 1]].
+BreakpointSegments = namedtuple(
+    "BreakpointSegments", ("members", "bounds", "bp_1", "bp_2")
+)
+
+
+def segment_distinct(segment: np.ndarray, reads: np.ndarray, n: int) -> np.ndarray:
+    "Number of distinct reads of each of n segments from the segment IDs of the reads"
+    pairs = np.unique(np.stack([segment, reads.astype(np.int64)]), axis=1)
+    return np.bincount(pairs[0], minlength=n)
+
+
+def first_occurrences(values: np.ndarray) -> np.ndarray:
+    "Distinct values in the order of their first occurrence"
+    distinct, first = np.unique(values, return_index=True)
+    return distinct[np.argsort(first)]
+
+
+def split_sorted(
+    cluster: np.ndarray,
+    bp_2: np.ndarray,
+    read_count: int,
+    max_cluster_bias: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sort the signatures of the clusters of at least read_count signatures by bp_2 and
+    split them at gaps over max_cluster_bias between consecutive bp_2.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Indices of the signatures in the order of the
+            segments and the segment bounds.
+    """
+    sizes = np.diff(run_bounds(cluster))
+    index = np.flatnonzero(np.repeat(sizes >= read_count, sizes))
+    # Stable, so equal bp_2 stay in the order of lines
+    order = index[np.lexsort((bp_2[index], cluster[index]))]
+    starts = np.zeros(len(order), dtype=bool)
+    starts[1:] = np.diff(bp_2[order]) > max_cluster_bias
+    starts[run_bounds(cluster[order])[:-1]] = True
+    return order, np.append(np.flatnonzero(starts), len(order))
+
+
+def empty_segments() -> BreakpointSegments:
+    empty = np.zeros(0, dtype=np.int64)
+    return BreakpointSegments(empty, np.zeros(1, dtype=np.int64), empty, empty)
+
+
+def called_segments(
+    order: np.ndarray,
+    bounds: np.ndarray,
+    called: np.ndarray,
+    bp_1: np.ndarray,
+    bp_2: np.ndarray,
+) -> BreakpointSegments:
+    "The called segments of the signatures order split at bounds, and their breakpoints"
+    indices, called_bounds = segment_indices(bounds[called], np.diff(bounds)[called])
+    return BreakpointSegments(
+        order[indices], called_bounds, bp_1[called], bp_2[called]
+    )
+
+
+def inv_segments(
+    strand: np.ndarray,
+    bp_1: np.ndarray,
+    bp_2: np.ndarray,
+    reads: np.ndarray,
+    read_count: int,
+    max_cluster_bias: int,
+) -> BreakpointSegments:
+    """Cluster the inversion signatures of a chromosome.
+
+    The signatures, grouped by strand and sorted by bp_1 in the order of lines, are
+    clustered at strand changes and at gaps over max_cluster_bias between consecutive
+    bp_1 or bp_2. The clusters are sorted by bp_2 and split at its gaps. The segments of
+    at least read_count signatures and reads are called at the rounded means of their
+    breakpoints.
+    """
+    bp_1 = np.asarray(bp_1, dtype=np.int64)
+    bp_2 = np.asarray(bp_2, dtype=np.int64)
+    strand = np.asarray(strand)
+    reads = np.asarray(reads)
+    cluster = cluster_ids([bp_1, bp_2], [strand], max_cluster_bias)
+    order, bounds = split_sorted(cluster, bp_2, read_count, max_cluster_bias)
+    if len(order) == 0:
+        return empty_segments()
+
+    sizes = np.diff(bounds)
+    distinct = segment_distinct(
+        np.repeat(np.arange(len(sizes)), sizes), reads[order], len(sizes)
+    )
+    called = np.flatnonzero((sizes >= read_count) & (distinct >= read_count))
+    means = [
+        np.rint(np.add.reduceat(bp[order], bounds[:-1]) / sizes).astype(np.int64)
+        for bp in (bp_1, bp_2)
+    ]
+    return called_segments(order, bounds, called, *means)
+
+
+def dup_segments(
+    pos_1: np.ndarray,
+    pos_2: np.ndarray,
+    reads: np.ndarray,
+    read_count: int,
+    max_cluster_bias: int,
+) -> BreakpointSegments:
+    """Cluster the duplication signatures of a chromosome.
+
+    The signatures are clustered at gaps over max_cluster_bias between consecutive
+    pos_1. The clusters are sorted by pos_2 and split at its gaps. The segments of at
+    least read_count reads are called at the truncated means of the breakpoints of their
+    signatures from 40% to 60% in the order of pos_2.
+    """
+    pos_1 = np.asarray(pos_1, dtype=np.int64)
+    pos_2 = np.asarray(pos_2, dtype=np.int64)
+    reads = np.asarray(reads)
+    cluster = cluster_ids([pos_1], [], max_cluster_bias)
+    order, bounds = split_sorted(cluster, pos_2, read_count, max_cluster_bias)
+    if len(order) == 0:
+        return empty_segments()
+
+    sizes = np.diff(bounds)
+    distinct = segment_distinct(
+        np.repeat(np.arange(len(sizes)), sizes), reads[order], len(sizes)
+    )
+    called = np.flatnonzero(distinct >= read_count)
+    low = bounds[:-1] + (sizes * 0.4).astype(np.int64)
+    up = bounds[:-1] + (sizes * 0.6).astype(np.int64)
+    breakpoints = list()
+    for bp in (pos_1, pos_2):
+        values = bp[order]
+        cumulative = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(values, out=cumulative[1:])
+        means = (cumulative[up] - cumulative[low]) / np.maximum(up - low, 1)
+        breakpoints.append(np.where(low == up, values[low], means).astype(np.int64))
+    return called_segments(order, bounds, called, *breakpoints)
+
+
+def tra_segments(
+    bnd_type: np.ndarray,
+    pos_1: np.ndarray,
+    pos_2: np.ndarray,
+    reads: np.ndarray,
+    read_count: int,
+    max_cluster_bias: int,
+    overlap_size: float,
+) -> BreakpointSegments:
+    """Cluster the translocation signatures of a chromosome pair.
+
+    The signatures, grouped by breakend type and sorted by pos_1 in the order of lines,
+    are clustered at type changes and at gaps over max_cluster_bias between consecutive
+    pos_1. The clusters of at least read_count signatures and reads are sorted by pos_2
+    and split at its gaps. The segment with the most reads, and the second one if it has
+    at least half of read_count reads, are called if they have together at least
+    overlap_size reads per signature of the cluster. The breakpoints are the truncated
+    means of the segments, with the first signature of each cluster counted twice as the
+    list based clustering did.
+    """
+    pos_1 = np.asarray(pos_1, dtype=np.int64)
+    pos_2 = np.asarray(pos_2, dtype=np.int64)
+    bnd_type = np.asarray(bnd_type)
+    reads = np.asarray(reads)
+    cluster = cluster_ids([pos_1], [bnd_type], max_cluster_bias)
+    order, bounds = split_sorted(cluster, pos_2, read_count, max_cluster_bias)
+    if len(order) == 0:
+        return empty_segments()
+
+    cluster_bounds = run_bounds(cluster[order])
+    cluster_sizes = np.diff(cluster_bounds)
+    n_clusters = len(cluster_sizes)
+    cluster_distinct = segment_distinct(
+        np.repeat(np.arange(n_clusters), cluster_sizes), reads[order], n_clusters
+    )
+    sizes = np.diff(bounds)
+    distinct = segment_distinct(
+        np.repeat(np.arange(len(sizes)), sizes), reads[order], len(sizes)
+    )
+    first_segments = np.searchsorted(bounds, cluster_bounds[:-1])
+    cluster_segments = np.diff(first_segments, append=len(sizes))
+    segment_cluster = np.repeat(np.arange(n_clusters), cluster_segments)
+
+    # The two segments with the most reads of each cluster
+    ranked = np.lexsort((np.arange(len(sizes)), -distinct, segment_cluster))
+    best = ranked[first_segments]
+    has_second = cluster_segments > 1
+    second = ranked[np.where(has_second, first_segments + 1, first_segments)]
+    pair = has_second & (distinct[second] >= 0.5 * read_count)
+    enough = cluster_distinct >= read_count
+    call_best = enough & np.where(
+        pair,
+        distinct[best] + distinct[second] >= cluster_sizes * overlap_size,
+        distinct[best] >= cluster_sizes * overlap_size,
+    )
+    called = np.column_stack((best, second))[
+        np.column_stack((call_best, call_best & pair))
+    ]
+
+    counts = sizes.copy()
+    counts[first_segments] += 1
+    breakpoints = list()
+    for bp in (pos_1, pos_2):
+        sums = np.add.reduceat(bp[order], bounds[:-1])
+        sums[first_segments] += bp[order[cluster_bounds[:-1]]]
+        breakpoints.append((sums / counts).astype(np.int64))
+    return called_segments(order, bounds, called, *breakpoints)
+
+
+def split_pieces(
+    svtype: str, columns: Dict[str, np.ndarray], max_cluster_bias: int, piece_size: int
+) -> List[Tuple[int, int]]:
+    """Split signatures to pieces of at least piece_size signatures between clusters.
+
+    Returns:
+        List[Tuple[int, int]]: Index ranges [start, end) of the pieces in line order.
+    """
+    gaps, changes = CLUSTER_BREAKS[svtype]
+    breaks = cluster_breaks(
+        [columns[i] for i in gaps], [columns[i] for i in changes], max_cluster_bias
+    )
+    starts = np.flatnonzero(breaks) + 1
+    pieces = list()
+    start = 0
+    while True:
+        i = np.searchsorted(starts, start + piece_size)
+        if i == len(starts):
+            break
+        pieces.append((start, int(starts[i])))
+        start = int(starts[i])
+    pieces.append((start, len(columns[gaps[0]])))
+    return pieces
+
+
+def clustering_pieces(
+    work_dir, svtype: str, key, max_cluster_bias: int, piece_size: int
+) -> List[Optional[Tuple[int, int]]]:
+    """Pieces of the signatures of a chromosome key clustered as separate tasks.
+
+    A chromosome with more than piece_size signatures in the columnar store is split
+    where its clusters break, so the pieces give the same calls as the chromosome.
+
+    Returns:
+        List[Optional[Tuple[int, int]]]: Index ranges of the pieces, [None] for the
+            whole chromosome.
+    """
+    if piece_size <= 0:
+        return [None]
+    keys = key if isinstance(key, tuple) else (key,)
+    column_dir = work_dir.column_dir(svtype, *keys)
+    if column_dir is None or column_dir[1] <= piece_size:
+        return [None]
+    gaps, changes = CLUSTER_BREAKS[svtype]
+    columns = load_columns(column_dir[0], svtype, gaps + changes)
+    pieces = split_pieces(svtype, columns, max_cluster_bias, piece_size)
+    return pieces if len(pieces) > 1 else [None]
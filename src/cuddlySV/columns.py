@@ -0,0 +1,269 @@
+"""Binary columnar signature store of the work directory.
+
+The signatures of each type and chromosome (chromosome pair for TRA) are stored in
+columns/{TYPE}_{n}/ as typed NumPy arrays in the order of WorkDir.lines: integer
+positions and lengths as int64, strands and breakend types as fixed width bytes and read
+IDs as int32 codes to the read_names.txt table of the directory. Insertion sequences are
+concatenated to seq.bin with their int64 offsets in seq_offsets.npy.
+
+The directories are listed in columns/columns.idx (svtype, directory, number of
+signatures, chrom[, chrom2]), which is written last, so that an interrupted build is not
+used. The arrays are memory-mapped on load.
+"""
+import functools
+import logging
+import shutil
+from multiprocessing.pool import Pool
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .read_names import ReadId, parse_read_id
+from .signatures import SIGNATURE_TYPES, ChromKey
+from .worker_pool import ordered_results, run_tasks, task_pool
+
+COLUMNS_DIR = "columns"
+COLUMN_INDEX = "columns.idx"
+READ_NAMES = "read_names.txt"
+
+# Columns of each type: name, field of the signature line and kind
+# (int: int64, str: fixed width bytes, read: read ID code, seq: insertion sequence)
+COLUMNS: Dict[str, Tuple[Tuple[str, int, str], ...]] = {
+    "DEL": (("pos", 2, "int"), ("len", 3, "int"), ("read", 4, "read")),
+    "DUP": (("pos_1", 2, "int"), ("pos_2", 3, "int"), ("read", 4, "read")),
+    "INS": (
+        ("pos", 2, "int"),
+        ("len", 3, "int"),
+        ("read", 4, "read"),
+        ("seq", 5, "seq"),
+    ),
+    "INV": (
+        ("strand", 2, "str"),
+        ("bp_1", 3, "int"),
+        ("bp_2", 4, "int"),
+        ("read", 5, "read"),
+    ),
+    "TRA": (
+        ("bnd_type", 2, "str"),
+        ("pos_1", 3, "int"),
+        ("pos_2", 5, "int"),
+        ("read", 6, "read"),
+    ),
+}
+
+
+def parse_record(svtype: str, line: str) -> tuple:
+    """Parse the column values of a signature line.
+
+    Returns:
+        tuple: Values in the order of COLUMNS[svtype], a missing insertion sequence as "".
+    """
+    seq = line.rstrip("\n").split("\t")
+    record = list()
+    for _, field, kind in COLUMNS[svtype]:
+        if kind == "int":
+            record.append(int(seq[field]))
+        elif kind == "read":
+            record.append(parse_read_id(seq[field]))
+        elif kind == "seq" and field >= len(seq):
+            record.append("")
+        else:
+            record.append(seq[field])
+    return tuple(record)
+
+
+def build_columns(svtype: str, lines: Iterator[str]) -> Dict[str, Any]:
+    """Parse signature lines of one chromosome key to columns in memory.
+
+    Returns:
+        Dict[str, Any]: Arrays by column name as from load_columns.
+    """
+    spec = COLUMNS[svtype]
+    values: List[tuple] = list(zip(*(parse_record(svtype, line) for line in lines)))
+    if not values:
+        values = [()] * len(spec)
+    read_codes: Dict[ReadId, int] = dict()
+
+    columns: Dict[str, Any] = dict()
+    for (name, _, kind), column in zip(spec, values):
+        if kind == "read":
+            column = [read_codes.setdefault(i, len(read_codes)) for i in column]
+        if kind == "int":
+            columns[name] = np.array(column, dtype=np.int64)
+        elif kind == "str":
+            columns[name] = np.array([i.encode() for i in column], "S")
+        elif kind == "read":
+            columns[name] = np.array(column, dtype=np.int32)
+        elif kind == "seq":
+            data = [i.encode() for i in column]
+            offsets = np.zeros(len(data) + 1, dtype=np.int64)
+            np.cumsum([len(i) for i in data], out=offsets[1:])
+            columns[name] = np.frombuffer(b"".join(data), dtype=np.uint8)
+            columns[f"{name}_offsets"] = offsets
+    columns["read_names"] = list(read_codes)
+    return columns
+
+
+def write_key_columns(path: Path, svtype: str, lines: Iterator[str]) -> int:
+    """Write the signature lines of one chromosome key as columns to directory path.
+
+    Returns:
+        int: Number of signatures written.
+    """
+    columns = build_columns(svtype, lines)
+    path.mkdir(parents=True)
+    for name, _, kind in COLUMNS[svtype]:
+        if kind == "seq":
+            with open(path / f"{name}.bin", "wb") as f:
+                f.write(columns[name].tobytes())
+            np.save(path / f"{name}_offsets.npy", columns[f"{name}_offsets"])
+        else:
+            np.save(path / f"{name}.npy", columns[name])
+    with open(path / READ_NAMES, "wt") as f:
+        f.writelines("%s\n" % name for name in columns["read_names"])
+    return len(columns[COLUMNS[svtype][0][0]])
+
+
+def write_key_columns_wrapper(job) -> int:
+    work_dir, svtype, key, path = job
+    keys = key if isinstance(key, tuple) else (key,)
+    return write_key_columns(path, svtype, work_dir.lines(svtype, *keys))
+
+
+def write_columns(work_dir, threads: int = 1, pool: Optional[Pool] = None) -> int:
+    """Build the columnar store of all signatures of the work dir, replacing any old one.
+
+    Args:
+        work_dir (WorkDir): Work directory with text signatures.
+        threads (int): Number of chromosomes converted in parallel.
+        pool (Optional[Pool]): Worker pool of the run, None to start one.
+
+    Returns:
+        int: Number of signatures stored.
+    """
+    columns_path = work_dir.path / COLUMNS_DIR
+    remove_columns(work_dir.path)
+    columns_path.mkdir()
+    jobs = list()
+    for svtype in SIGNATURE_TYPES:
+        for key in work_dir.idx.get(f"{svtype}.sigs", {}):
+            path = columns_path / ("%s_%d" % (svtype, len(jobs)))
+            jobs.append((work_dir, svtype, key, path))
+    logging.info("Storing signatures of %d chromosomes in columns.", len(jobs))
+    tasks = [(write_key_columns_wrapper, job) for job in jobs]
+    with task_pool(pool, threads) as columns_pool:
+        counts = ordered_results(run_tasks(columns_pool, tasks, threads))
+
+    tmp_index = columns_path / (COLUMN_INDEX + ".tmp")
+    with open(tmp_index, "wt") as index:
+        for (_, svtype, key, path), count in zip(jobs, counts):
+            chroms = "\t".join(key) if isinstance(key, tuple) else key
+            index.write("%s\t%s\t%d\t%s\n" % (svtype, path.name, count, chroms))
+    tmp_index.replace(columns_path / COLUMN_INDEX)
+    return sum(counts)
+
+
+def remove_columns(work_dir_path: Path):
+    "Remove the columnar store, e.g. when it is stale"
+    shutil.rmtree(work_dir_path / COLUMNS_DIR, ignore_errors=True)
+
+
+def read_column_index(path: Path) -> Dict[str, Dict[ChromKey, Tuple[str, int]]]:
+    """Read the column index.
+
+    Returns:
+        Dict[str, Dict[ChromKey, Tuple[str, int]]]: From svtype and chromosome key to the
+            column directory and the number of signatures.
+    """
+    index: Dict[str, Dict[ChromKey, Tuple[str, int]]] = dict()
+    with open(path, "rt") as f:
+        for line in f:
+            seq = line.rstrip("\n").split("\t")
+            key = seq[3] if len(seq) == 4 else (seq[3], seq[4])
+            index.setdefault(seq[0], dict())[key] = (seq[1], int(seq[2]))
+    return index
+
+
+def load_columns(
+    path: Path, svtype: str, names: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """Memory-map the columns of a column directory.
+
+    Args:
+        names (Optional[Sequence[str]]): Columns to load, None for all and read names.
+
+    Returns:
+        Dict[str, Any]: Arrays by column name, "read_names" list for the read codes and
+            "seq_offsets" for the uint8 "seq" array.
+    """
+    columns: Dict[str, Any] = dict()
+    for name, _, kind in COLUMNS[svtype]:
+        if names is not None and name not in names:
+            continue
+        if kind == "seq":
+            columns[f"{name}_offsets"] = np.load(
+                path / f"{name}_offsets.npy", mmap_mode="r"
+            )
+            if (path / f"{name}.bin").stat().st_size > 0:
+                columns[name] = np.memmap(path / f"{name}.bin", dtype=np.uint8, mode="r")
+            else:
+                columns[name] = np.zeros(0, dtype=np.uint8)
+        else:
+            columns[name] = np.load(path / f"{name}.npy", mmap_mode="r")
+    if names is None:
+        stat = (path / READ_NAMES).stat()
+        columns["read_names"] = load_read_names(
+            path / READ_NAMES, stat.st_mtime_ns, stat.st_size
+        )
+    return columns
+
+
+@functools.lru_cache(maxsize=2)
+def load_read_names(path: Path, mtime_ns: int, size: int) -> List[ReadId]:
+    "Read the read ID table of a column directory, once for the pieces of a chromosome"
+    with open(path, "rt") as f:
+        return [parse_read_id(line.rstrip("\n")) for line in f]
+
+
+def slice_columns(
+    svtype: str, columns: Dict[str, Any], start: int, end: int
+) -> Dict[str, Any]:
+    "Columns of the signatures [start, end) of loaded columns, with the same read codes"
+    sliced = {"read_names": columns["read_names"]}
+    for name, _, kind in COLUMNS[svtype]:
+        if kind == "seq":
+            sliced[name] = columns[name]
+            sliced[f"{name}_offsets"] = columns[f"{name}_offsets"][start : end + 1]
+        else:
+            sliced[name] = columns[name][start:end]
+    return sliced
+
+
+def column_seq(columns: Dict[str, Any], i: int, name: str = "seq") -> str:
+    "The sequence of signature i in loaded columns"
+    offsets = columns[f"{name}_offsets"]
+    return bytes(columns[name][offsets[i] : offsets[i + 1]]).decode()
+
+
+def column_records(svtype: str, columns: Dict[str, Any]) -> Iterator[tuple]:
+    "Generate the records of parse_record from loaded columns"
+    values = list()
+    for name, _, kind in COLUMNS[svtype]:
+        if kind == "int":
+            values.append(columns[name].tolist())
+        elif kind == "str":
+            values.append([i.decode() for i in columns[name]])
+        elif kind == "read":
+            names = columns["read_names"]
+            values.append([names[i] for i in columns[name].tolist()])
+        elif kind == "seq":
+            data = columns[name]
+            offsets = columns[f"{name}_offsets"].tolist()
+            values.append(
+                [
+                    bytes(data[offsets[i] : offsets[i + 1]]).decode()
+                    for i in range(len(offsets) - 1)
+                ]
+            )
+    return zip(*values)
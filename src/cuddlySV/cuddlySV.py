@@ -1,77 +1,138 @@
 #!/usr/bin/env python
 
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
 import pysam
+from pysam import CSOFT_CLIP, CHARD_CLIP, CMATCH, CINS, CDEL, CEQUAL, CDIFF
 import pyfastx
-from .Description import WorkDir, parseArgs, setupLogging
-from multiprocessing import Pool
+from .Description import VERSION, WorkDir, parseArgs, setupLogging
+from multiprocessing.pool import Pool
 from .CommandRunner import exe
-from .split_signal import organize_split_signal
+from .columns import COLUMNS_DIR, remove_columns, write_columns
+from .alignment_file import (
+    SAM_SEQ,
+    get_read_group,
+    get_read_id,
+    open_alignment_file,
+    signature_fields,
+)
+from .alignment_stream import (
+    STREAM,
+    STREAM_HEADER,
+    is_stream,
+    load_stream_header,
+    parse_alignments,
+    stream_tasks,
+    write_stream_header,
+)
+from .insert_sequence import DeferredQuery
+from .read_names import (
+    NAMES_SUFFIX,
+    PROBED_NAMES,
+    READ_GROUPS,
+    READ_NAMES,
+    NamesWriter,
+    ProbedIds,
+    ReadIdCollision,
+    lookup_names,
+    merge_names,
+    probe_collisions,
+    rnames_ids,
+    write_names,
+    write_read_groups,
+)
+from .checkpoint import (
+    TASK_MANIFEST,
+    TaskRecord,
+    file_checksum,
+    load_task_record,
+    params_digest,
+    read_manifest,
+    remove_task_outputs,
+    task_prefix,
+    write_manifest,
+    write_task_record,
+)
+from .metrics import METRICS_FILE, TaskMetrics, peak_rss_kb, task_metrics, write_metrics
+from .partition import partition_tasks
+from .thread_budget import ThreadSplit, split_threads
+from .worker_pool import (
+    run_largest_first,
+    run_tasks,
+    start_pool,
+    task_pool,
+)
+from .reads_store import (
+    READS_PART_SUFFIX,
+    READS_STORE,
+    ReadsWriter,
+    merge_reads_parts,
+)
+from .signatures import (
+    SHARD_INDEX,
+    ShardEntry,
+    ShardWriter,
+    remap_shard,
+    write_shard_index,
+)
+from .split_signal import SupplementaryAlignment, decode_sa_tag, organize_split_signal
 
 # from resolution_type import *
 from .resolveINV import run_inv
 from .resolveTRA import run_tra
 from .resolveINDEL import run_ins, run_del
 from .resolveDUP import run_dup
+from .cluster_arrays import clustering_pieces
+from .task_costs import clustering_cost, log_task_times, read_counts, task_label
 from .genotype import (
     generate_output,
     generate_pvcf,
     load_bed,
+    load_bed_index,
+    task_bed_regions,
 )
 from .forcecalling import force_calling_chrom
 import os
 import logging
+import shutil
 import sys
 import time
-import gc
 
 
-def get_cigar_ref_length(cigar: str) -> int:
-    "Return the length of reference consumed by the cigar string"
-    import re
-
-    cig_parts = re.findall(r"(\d+)(\D)", cigar)
-
-    consumed_ref = sum(int(length) for length, op in cig_parts if op in "MDN=X")
-
-    return consumed_ref
-
-
-def is_1d2_read(aligned_segment: pysam.AlignedSegment, overlap_threshold=0.95) -> bool:
+def is_1d2_read(
+    aligned_segment: pysam.AlignedSegment,
+    overlap_threshold=0.95,
+    supplementary: Optional[Sequence[SupplementaryAlignment]] = None,
+) -> bool:
     """Check if the aligned_segment is false 1d2 read, i.e. aligned in two parts, overlapping, in
     opposite strands.
 
     Return True, if aligned_segment has supplementary alignment which is shorter, opposite strand
-    and overlapping for over overlap_threshold"""
+    and overlapping for over overlap_threshold. The SA tag is decoded unless already decoded
+    supplementary alignments are given."""
     # Extract the reference name, start, and end coordinates of the aligned segment
     ref_name = aligned_segment.reference_name
     start = aligned_segment.reference_start
     end = aligned_segment.reference_end
 
-    # Extract the SA tag and split it into supplementary alignments
-    try:
-        sa_tag = aligned_segment.get_tag("SA").rstrip(";").split(";")
-    except KeyError:
-        return False
+    if supplementary is None:
+        try:
+            supplementary = decode_sa_tag(aligned_segment.get_tag("SA"))
+        except KeyError:
+            return False
 
     # Check for each supplementary alignment if it overlaps with the aligned segment
-    for sa_entry in sa_tag:
-        fields = sa_entry.split(",")
-        sa_ref_name = fields[0]
-        sa_start = int(fields[1]) - 1  # to zero based like pysam
-        sa_is_forward = 1 if fields[2] == "+" else 0
-        sa_cigar = fields[3]
-        _sa_mapq = int(fields[4])
-
-        if sa_ref_name != ref_name:
+    for sa_entry in supplementary:
+        if sa_entry.chrom != ref_name:
             # Different contig
             continue
-        if sa_is_forward == aligned_segment.is_forward:
+        if (sa_entry.strand == "+") == aligned_segment.is_forward:
             # Same strand.
             continue
 
-        sa_ref_len = get_cigar_ref_length(sa_cigar)
+        sa_start = sa_entry.start - 1  # to zero based like pysam
+        sa_ref_len = sa_entry.ref_length
         sa_end = sa_start + sa_ref_len
 
         if aligned_segment.reference_length > sa_ref_len:
@@ -91,31 +152,6 @@ def is_1d2_read(aligned_segment: pysam.AlignedSegment, overlap_threshold=0.95) -
     return False
 
 
-def get_query_name(read: pysam.AlignedSegment) -> str:
-    """Get aligned read name annotated with source of th read
-
-    Args:
-        read (pysam.AlignedSegment): Alignment info from pysam/bam/cram
-
-    Returns:
-        str: Read name in format 'query_name:read_group:haplotype:phase_set
-    """
-    try:
-        rg = read.get_tag("RG")
-    except KeyError:
-        rg = ""
-    # try:
-    #     hp = str(read.get_tag("HP"))
-    # except KeyError:
-    #     hp = ""
-    # try:
-    #     ps = str(read.get_tag("PS"))
-    # except KeyError:
-    #     ps = ""
-    read_name = ":".join([read.query_name, rg])
-    return read_name
-
-
 def analysis_inv(ele_1, ele_2, read_name, candidate, SV_size):
     if ele_1[5] == "+":
         # +-
@@ -639,57 +675,74 @@ def analysis_split_read(
                     candidate.append([ele_2[2], ele_1[3], read_name, "DUP", ele_2[4]])
 
 
-def generate_combine_sigs(sigs, Chr_name, read_name, svtype, candidate, merge_dis):
-    # for i in sigs:
-    # 	print(svtype,i, len(sigs))
-    if len(sigs) == 0:
-        pass
-    elif len(sigs) == 1:
-        if svtype == "INS":
-            candidate.append(
-                [sigs[0][0], sigs[0][1], read_name, sigs[0][2], svtype, Chr_name]
-            )
-        else:
-            candidate.append([sigs[0][0], sigs[0][1], read_name, svtype, Chr_name])
-    else:
-        temp_sig = sigs[0]
-        if svtype == "INS":
-            temp_sig += [sigs[0][0]]
-            for i in sigs[1:]:
-                if i[0] - temp_sig[3] <= merge_dis:
-                    temp_sig[1] += i[1]
-                    temp_sig[2] += i[2]
-                    temp_sig[3] = i[0]
-                else:
-                    candidate.append(
-                        [
-                            temp_sig[0],
-                            temp_sig[1],
-                            read_name,
-                            temp_sig[2],
-                            svtype,
-                            Chr_name,
-                        ]
-                    )
-                    temp_sig = i
-                    temp_sig.append(i[0])
-            candidate.append(
-                [temp_sig[0], temp_sig[1], read_name, temp_sig[2], svtype, Chr_name]
-            )
-        else:
-            temp_sig += [sum(sigs[0])]
-            # merge_dis_bias = max([i[1]] for i in sigs)
-            for i in sigs[1:]:
-                if i[0] - temp_sig[2] <= merge_dis:
-                    temp_sig[1] += i[1]
-                    temp_sig[2] = sum(i)
-                else:
-                    candidate.append(
-                        [temp_sig[0], temp_sig[1], read_name, svtype, Chr_name]
-                    )
-                    temp_sig = i
-                    temp_sig.append(i[0])
-            candidate.append([temp_sig[0], temp_sig[1], read_name, svtype, Chr_name])
+def cigar_arrays(aligned: pysam.AlignedSegment) -> Tuple[np.ndarray, np.ndarray]:
+    "Return the CIGAR of the aligned segment as arrays of operations and lengths"
+    cigar = np.array(aligned.cigartuples or (), dtype=np.int64).reshape(-1, 2)
+    return cigar[:, 0], cigar[:, 1]
+
+
+def scan_cigar_indels(ops: np.ndarray, lens: np.ndarray, pos_start: int, min_siglength: int):
+    """Locate deletion and insertion signatures of at least min_siglength in a CIGAR.
+
+    Reference offsets count M, D, = and X operations. Query offsets count all but D
+    operations, i.e. they include a leading hard clip which the caller must subtract.
+
+    Returns:
+        tuple: (del_pos, del_len, ins_pos, ins_len, ins_query_end) arrays.
+    """
+    consumes_ref = (ops == CMATCH) | (ops == CDEL) | (ops == CEQUAL) | (ops == CDIFF)
+    ref_shift = np.cumsum(np.where(consumes_ref, lens, 0)) - np.where(consumes_ref, lens, 0)
+    long_op = lens >= min_siglength
+    is_del = (ops == CDEL) & long_op
+    is_ins = (ops == CINS) & long_op
+    query_end = np.cumsum(np.where(ops != CDEL, lens, 0))
+    return (
+        pos_start + ref_shift[is_del],
+        lens[is_del],
+        pos_start + ref_shift[is_ins],
+        lens[is_ins],
+        query_end[is_ins],
+    )
+
+
+def combine_del_sigs(pos: np.ndarray, lens: np.ndarray, merge_dis: int) -> np.ndarray:
+    """Group deletions of a read closer than merge_dis to each other.
+
+    A deletion is merged to the previous one if it starts within merge_dis from the
+    end of the previous deletion. If the previous deletion started a new group (other than
+    the first one), the distance is taken from its start instead.
+
+    Returns:
+        np.ndarray: Indices of the first deletion of each group.
+    """
+    if len(pos) < 2:
+        return np.zeros(len(pos), dtype=np.int64)
+    gap_to_end = pos[1:] - (pos[:-1] + lens[:-1]) <= merge_dis
+    gap_to_start = pos[1:] - pos[:-1] <= merge_dis
+    # Merging depends on the previous decision only if the two distances disagree.
+    decided = np.r_[True, gap_to_start | ~gap_to_end]
+    last_decided = np.maximum.accumulate(np.where(decided, np.arange(len(pos)), 0))
+    merged = np.r_[True, gap_to_end][last_decided]
+    merged[0] = False
+    return np.flatnonzero(~merged)
+
+
+def combine_ins_sigs(pos: np.ndarray, merge_dis: int) -> np.ndarray:
+    """Group insertions of a read closer than merge_dis to the previous insertion.
+
+    Returns:
+        np.ndarray: Indices of the first insertion of each group.
+    """
+    return np.flatnonzero(np.r_[True, np.diff(pos) > merge_dis][: len(pos)])
+
+
+def read_query(aligned, Chr_name, query_length, with_sequence, defer_sequence):
+    "Return query sequence of the alignment, its DeferredQuery, or '' if sequence is not decoded"
+    if defer_sequence:
+        return DeferredQuery(Chr_name, aligned.reference_start, aligned.flag, query_length)
+    if with_sequence:
+        return aligned.query_sequence
+    return ""
 
 
 def parse_read(
@@ -703,96 +756,96 @@ def parse_read(
     merge_del_threshold,
     merge_ins_threshold,
     MaxSize,
+    read_name=None,
+    with_sequence=True,
+    defer_sequence=False,
+    counts: Optional[Dict[str, int]] = None,
 ):
-    if aligned.query_length < min_read_len:
+    if with_sequence:
+        query_length = aligned.query_length
+    else:
+        # Sequence is not decoded, take the length from CIGAR
+        query_length = aligned.infer_query_length()
+    if query_length < min_read_len:
+        if counts is not None:
+            counts["min_read_len"] += 1
         return []
-    is_1d2_chimera = is_1d2_read(aligned)
+    ops, lens = cigar_arrays(aligned)
+    has_indel_sig = aligned.mapping_quality >= min_mapq and bool(
+        (((ops == CINS) | (ops == CDEL)) & (lens >= min_siglength)).any()
+    )
+    try:
+        supplementary = decode_sa_tag(aligned.get_tag("SA"))
+    except KeyError:
+        supplementary = None
+    if not has_indel_sig and supplementary is None:
+        # Nothing in this read can give a signature
+        if counts is not None:
+            counts["no_signal"] += 1
+        return []
+    is_1d2_chimera = supplementary is not None and is_1d2_read(
+        aligned, supplementary=supplementary
+    )
 
     if is_1d2_chimera:
+        if counts is not None:
+            counts["chimera_1d2"] += 1
         return []
     candidate = list()
-    Combine_sig_in_same_read_ins = list()
-    Combine_sig_in_same_read_del = list()
-    from pysam import CSOFT_CLIP, CHARD_CLIP, CMATCH, CINS, CDEL, CEQUAL, CDIFF
+    if read_name is None:
+        read_name = get_read_id(aligned)
 
     if aligned.mapq >= min_mapq:
         pos_start = aligned.reference_start  # 0-based
         pos_end = aligned.reference_end
-        shift_del = 0
-        shift_ins = 0
         softclip_left = 0
         softclip_right = 0
-        hardclip_left = 0
-        hardclip_right = 0
-        shift_ins_read = 0
-        if aligned.cigar[0][0] == CSOFT_CLIP:
-            softclip_left = aligned.cigar[0][1]
-        if aligned.cigar[0][0] == CHARD_CLIP:
-            hardclip_left = aligned.cigar[0][1]
-
-        for element in aligned.cigar:
-            if element[0] in [CMATCH, CEQUAL, CDIFF]:
-                shift_del += element[1]
-            if (
-                element[0] == CDEL and element[1] < min_siglength
-            ):  ## changed SV_size to min_siglength
-                shift_del += element[1]
-            if (
-                element[0] == CDEL and element[1] >= min_siglength
-            ):  ## changed SV_size to min_siglength
-                Combine_sig_in_same_read_del.append([pos_start + shift_del, element[1]])
-                shift_del += element[1]
-
-            # calculate offset of an ins sig in read
-            if element[0] != CDEL:
-                shift_ins_read += element[1]
-
-            if element[0] in [CMATCH, CDEL, CEQUAL, CDIFF]:
-                shift_ins += element[1]
-            if (
-                element[0] == CINS and element[1] >= min_siglength
-            ):  ## changed SV_size to min_siglength
-                Combine_sig_in_same_read_ins.append(
-                    [
-                        pos_start + shift_ins,
-                        element[1],
-                        str(
-                            aligned.query_sequence[
-                                shift_ins_read
-                                - element[1]
-                                - hardclip_left : shift_ins_read - hardclip_left
-                            ]
-                        ),
-                    ]
-                )
+        if ops[0] in (CSOFT_CLIP, CHARD_CLIP):
+            softclip_left = int(lens[0])
+        if ops[-1] in (CSOFT_CLIP, CHARD_CLIP):
+            softclip_right = int(lens[-1])
+        hardclip_left = int(lens[0]) if ops[0] == CHARD_CLIP else 0
+
+        if has_indel_sig:
+            del_pos, del_len, ins_pos, ins_len, ins_query_end = scan_cigar_indels(
+                ops, lens, pos_start, min_siglength
+            )
 
-        if aligned.cigar[-1][0] == CSOFT_CLIP:
-            softclip_right = aligned.cigar[-1][1]
-        if aligned.cigar[-1][0] == CHARD_CLIP:
-            hardclip_right = aligned.cigar[-1][1]
-
-        if hardclip_left != 0:
-            softclip_left = hardclip_left
-        if hardclip_right != 0:
-            softclip_right = hardclip_right
-
-    # ************Combine signals in same read********************
-    generate_combine_sigs(
-        Combine_sig_in_same_read_ins,
-        Chr_name,
-        get_query_name(aligned),
-        "INS",
-        candidate,
-        merge_ins_threshold,
-    )
-    generate_combine_sigs(
-        Combine_sig_in_same_read_del,
-        Chr_name,
-        get_query_name(aligned),
-        "DEL",
-        candidate,
-        merge_del_threshold,
-    )
+            # ************Combine signals in same read********************
+            if len(ins_pos) > 0:
+                query = read_query(
+                    aligned, Chr_name, query_length, with_sequence, defer_sequence
+                )
+                ins_query_end = (ins_query_end - hardclip_left).tolist()
+                ins_seqs = [
+                    str(query[q_end - ins_l : q_end])
+                    for q_end, ins_l in zip(ins_query_end, ins_len.tolist())
+                ]
+                group_starts = combine_ins_sigs(ins_pos, merge_ins_threshold)
+                group_bounds = group_starts.tolist() + [len(ins_pos)]
+                for g_pos, g_len, g_start, g_end in zip(
+                    ins_pos[group_starts].tolist(),
+                    np.add.reduceat(ins_len, group_starts).tolist(),
+                    group_bounds[:-1],
+                    group_bounds[1:],
+                ):
+                    candidate.append(
+                        [
+                            g_pos,
+                            g_len,
+                            read_name,
+                            "".join(ins_seqs[g_start:g_end]),
+                            "INS",
+                            Chr_name,
+                        ]
+                    )
+            if len(del_pos) > 0:
+                group_starts = combine_del_sigs(del_pos, del_len, merge_del_threshold)
+                for g_pos, g_len in zip(
+                    del_pos[group_starts].tolist(),
+                    np.add.reduceat(del_len, group_starts).tolist(),
+                ):
+                    candidate.append([g_pos, g_len, read_name, "DEL", Chr_name])
 
     if aligned.flag == 0 or aligned.flag == pysam.FREVERSE:
         # Exclude duplicate, supplementary, secondary, qcfail, paired etc. reads.
@@ -800,7 +853,7 @@ def parse_read(
             if not aligned.is_reverse:
                 primary_info = [
                     softclip_left,
-                    aligned.query_length - softclip_right,
+                    query_length - softclip_right,
                     pos_start,
                     pos_end,
                     Chr_name,
@@ -809,7 +862,7 @@ def parse_read(
             else:
                 primary_info = [
                     softclip_right,
-                    aligned.query_length - softclip_left,
+                    query_length - softclip_left,
                     pos_start,
                     pos_end,
                     Chr_name,
@@ -820,23 +873,20 @@ def parse_read(
 
         if not is_1d2_chimera:
             # Ignore the false chimeric alignment for the false 1d2 reads
-            try:
-                SAtag = aligned.get_tag("SA")
-            except KeyError:
-                SAtag = None
-            if SAtag is not None:
-                Supplementary_info = SAtag.split(";")[:-1]
+            if supplementary is not None:
                 organize_split_signal(
                     primary_info,
-                    Supplementary_info,
-                    aligned.query_length,
+                    supplementary,
+                    query_length,
                     SV_size,
                     min_mapq,
                     max_split_parts,
-                    get_query_name(aligned),
+                    read_name,
                     candidate,
                     MaxSize,
-                    aligned.query_sequence,
+                    read_query(
+                        aligned, Chr_name, query_length, with_sequence, defer_sequence
+                    ),
                 )
     return candidate
 
@@ -848,37 +898,175 @@ def single_pipe(
     max_split_parts,
     min_read_len,
     temp_dir: Path,
-    task,
+    tasks,
     min_siglength,
     merge_del_threshold,
     merge_ins_threshold,
     MaxSize,
     bed_regions,
     verbose,
+    fields=None,
+    defer_ins_seq=False,
+    compress=False,
+    digest="",
+    htslib_threads=0,
+    task_lines=None,
 ):
-    candidate = list()
-    reads_info_list = list()
+    """Collect signatures of a batch of regions.
+
+    Small contigs are batched to a single call to avoid opening the alignment file and
+    its index for each of them. The signatures of each region are written to their own
+    sorted shards, and the outputs of each finished region to its task record.
+
+    Args:
+        sam_path (str): Alignment file, or the saved header of a stream.
+        tasks (List[List]): Regions [chr, start, end] of the batch.
+        bed_regions (Optional[List[IntervalIndex]]): Included BED regions for each task.
+        digest (str): Digest of the collection parameters for the task records.
+        htslib_threads (int): Size of the htslib thread pool decompressing alignments.
+        task_lines (Optional[List[List[str]]]): SAM lines of the alignments of each
+            task of a stream, None to fetch the alignments from sam_path.
+
+    Returns:
+        List[TaskRecord]: Records of the tasks.
+    """
+    if task_lines is None:
+        samfile = open_alignment_file(sam_path, fields, htslib_threads)
+    else:
+        samfile = None
+        header = load_stream_header(sam_path)
+    signatures_path = temp_dir / "signatures"
+    records = list()
+    for i, task in enumerate(tasks):
+        prefix = task_prefix(task)
+        probed: ProbedIds = dict()
+        while True:
+            metrics = task_metrics(task)
+            try:
+                shard_entries = region_signatures(
+                    samfile,
+                    min_length,
+                    min_mapq,
+                    max_split_parts,
+                    min_read_len,
+                    temp_dir,
+                    task,
+                    min_siglength,
+                    merge_del_threshold,
+                    merge_ins_threshold,
+                    MaxSize,
+                    None if bed_regions is None else bed_regions[i],
+                    fields,
+                    defer_ins_seq,
+                    compress,
+                    metrics,
+                    None
+                    if task_lines is None
+                    else parse_alignments(header, task_lines[i]),
+                    probed,
+                )
+                break
+            except ReadIdCollision as exc:
+                # Run again with distinct IDs for the reads
+                logging.info("%s Running %s again.", str(exc), prefix)
+                remove_task_outputs(signatures_path, {prefix})
+                probed.update(probe_collisions(exc.names))
+        metrics["peak_rss_kb"] = peak_rss_kb()
+        records.append(
+            write_task_record(
+                signatures_path,
+                task,
+                digest,
+                shard_entries,
+                (prefix + NAMES_SUFFIX, prefix + READS_PART_SUFFIX),
+                metrics,
+                probed,
+            )
+        )
+    if samfile is not None:
+        samfile.close()
+    return records
+
+
+def region_signatures(
+    samfile: Optional[pysam.AlignmentFile],
+    min_length,
+    min_mapq,
+    max_split_parts,
+    min_read_len,
+    temp_dir: Path,
+    task,
+    min_siglength,
+    merge_del_threshold,
+    merge_ins_threshold,
+    MaxSize,
+    bed_regions,
+    fields=None,
+    defer_ins_seq=False,
+    compress=False,
+    metrics: Optional[TaskMetrics] = None,
+    alignments: Optional[Iterable[pysam.AlignedSegment]] = None,
+    probed: Optional[ProbedIds] = None,
+):
+    """Collect the signatures of a region and write them to the shards of its task.
+
+    The signatures, read names and read coordinates are streamed to their writers while
+    the alignments are fetched, so the memory of a task does not grow with its region.
+    The alignments of a stream are given in alignments instead of fetched from samfile.
+    Reads in probed get the IDs given there instead of their hashes.
+
+    Raises:
+        ReadIdCollision: If reads of the region have the same ID.
+
+    Returns:
+        List[ShardEntry]: Ranges of the chromosomes in the shards, empty if the region
+            has no signatures.
+    """
+    if metrics is None:
+        metrics = task_metrics(task)
+    reads = metrics["reads"]
+    seconds = metrics["seconds"]
     Chr_name = task[0]
-    samfile = pysam.AlignmentFile(sam_path)
+    with_sequence = fields is None or bool(fields & SAM_SEQ)
+    if bed_regions is not None and len(bed_regions) == 0:
+        logging.info("Skip %s:%d-%d outside BED regions." % (Chr_name, task[1], task[2]))
+        return []
 
-    for read in samfile.fetch(Chr_name, task[1], task[2]):
+    signatures_path = temp_dir / "signatures"
+    shard_prefix = task_prefix(task)
+    shard_writer = ShardWriter(signatures_path, shard_prefix, compress)
+    # Names of the reads with signatures or stored coordinates by read ID
+    names_writer = NamesWriter(
+        signatures_path / (shard_prefix + NAMES_SUFFIX), probed=probed
+    )
+    reads_writer = ReadsWriter(
+        signatures_path / (shard_prefix + READS_PART_SUFFIX), Chr_name
+    )
+    fetch_start = time.perf_counter()
+    if alignments is None:
+        alignments = samfile.fetch(Chr_name, task[1], task[2])
+    for read in alignments:
+        reads["fetched"] += 1
         if read.is_secondary:
             # Skip secondary alignments
+            reads["secondary"] += 1
             continue
         pos_start = read.reference_start  # 0-based
         pos_end = read.reference_end
-        in_bed = False
         if bed_regions is not None:
-            for bed_region in bed_regions:
-                if pos_end <= bed_region[0] or pos_start >= bed_region[1]:
-                    continue
-                else:
-                    in_bed = True
-                    break
+            in_bed = bed_regions.overlaps(pos_start, pos_end)
         else:
             in_bed = True
 
-        if read.reference_start >= task[1] and in_bed:
+        if read.reference_start < task[1]:
+            # Fetched by the task of the start too
+            reads["before_task"] += 1
+        elif not in_bed:
+            reads["outside_bed"] += 1
+        else:
+            parse_start = time.perf_counter()
+            read_group = get_read_group(read)
+            read_name = names_writer.read_id(read.query_name, read_group)
             read_candidate = parse_read(
                 read,
                 Chr_name,
@@ -890,73 +1078,93 @@ def single_pipe(
                 merge_del_threshold,
                 merge_ins_threshold,
                 MaxSize,
+                read_name,
+                with_sequence,
+                defer_ins_seq,
+                reads,
             )
-            candidate.extend(read_candidate)
-            if read.mapq >= min_mapq:
+            write_start = time.perf_counter()
+            seconds["parse"] += write_start - parse_start
+            if len(read_candidate) > 0:
+                reads["with_signatures"] += 1
+                names_writer.add(read_name, read.query_name, read_group)
+                for ele in read_candidate:
+                    shard_writer.add(signature_line(ele))
+            if read.mapq < min_mapq:
+                reads["low_mapq"] += 1
+            else:
+                names_writer.add(read_name, read.query_name, read_group)
                 is_primary = 0
                 if read.flag in [0, pysam.FREVERSE]:
                     # Read is primary if not paired, secondary supplementary, duplicated or qcfailed.
                     is_primary = 1
 
-                reads_info_list.append(
-                    [pos_start, pos_end, is_primary, get_query_name(read)]
-                )
-    samfile.close()
-    # print('finish %s:%d-%d in %f seconds.'%(task[0], task[1], len(reads_info_list), time.time() - start_time))
+                reads_writer.add(pos_start, pos_end, is_primary, read_name)
+            seconds["write"] += time.perf_counter() - write_start
+    seconds["fetch"] += (
+        time.perf_counter() - fetch_start - seconds["parse"] - seconds["write"]
+    )
 
-    if len(candidate) == 0:
+    if len(shard_writer.counts) == 0:
+        # The reads are kept for genotyping the signatures of the adjacent tasks, so
+        # that the work dir does not depend on the partition to tasks
+        write_start = time.perf_counter()
+        names_writer.close()
+        reads_writer.close()
+        seconds["write"] += time.perf_counter() - write_start
         logging.info("Skip %s:%d-%d." % (Chr_name, task[1], task[2]))
-        return
-
-    output = temp_dir / ("signatures/_%s_%d_%d.bed" % (Chr_name, task[1], task[2]))
-    file = open(output, "w")
-    for ele in candidate:
-        if len(ele) == 5:
-            assert ele[-2] in (
-                "DUP",
-                "DEL",
-            )
-            file.write(
-                "%s\t%s\t%d\t%d\t%s\n" % (ele[-2], ele[-1], ele[0], ele[1], ele[2])
-            )
-        elif len(ele) == 7:
-            assert ele[-2] == "TRA"
-            file.write(
-                "%s\t%s\t%s\t%d\t%s\t%d\t%s\n"
-                % (ele[-2], ele[-1], ele[0], ele[1], ele[2], ele[3], ele[4])
-            )
-        elif len(ele) == 6:
-            try:
-                file.write(
-                    "%s\t%s\t%s\t%d\t%d\t%s\n"
-                    % (ele[-2], ele[-1], ele[0], ele[1], ele[2], ele[3])
-                )
-                assert ele[-2] == "INV"
-                # INV chr strand pos1 pos2 read_ID
-            except Exception:
-                assert ele[-2] == "INS"
-                file.write(
-                    "%s\t%s\t%d\t%d\t%s\t%s\n"
-                    % (ele[-2], ele[-1], ele[0], ele[1], ele[2], ele[3])
-                )
-                # INS chr pos len read_ID seq
-    file.close()
-    reads_output = temp_dir / (
-        "signatures/_%s_%d_%d.reads"
-        % (
-            Chr_name,
-            task[1],
-            task[2],
+        return []
+
+    write_start = time.perf_counter()
+    metrics["signatures"].update(shard_writer.counts)
+    names_writer.close()
+    shard_entries = shard_writer.close()
+    reads_writer.close()
+    seconds["write"] += time.perf_counter() - write_start
+    logging.info("Finished %s:%d-%d." % (Chr_name, task[1], task[2]))
+    return shard_entries
+
+
+def signature_line(ele) -> str:
+    "Format a signature of parse_read as a line of its signature shard"
+    if len(ele) == 5:
+        assert ele[-2] in (
+            "DUP",
+            "DEL",
         )
-    )
-    reads_file = open(reads_output, "w")
-    for ele in reads_info_list:
-        reads_file.write(
-            "%s\t%d\t%d\t%d\t%s\n" % (Chr_name, ele[0], ele[1], ele[2], ele[3])
+        return "%s\t%s\t%d\t%d\t%s\n" % (ele[-2], ele[-1], ele[0], ele[1], ele[2])
+    elif len(ele) == 7:
+        assert ele[-2] == "TRA"
+        return "%s\t%s\t%s\t%d\t%s\t%d\t%s\n" % (
+            ele[-2],
+            ele[-1],
+            ele[0],
+            ele[1],
+            ele[2],
+            ele[3],
+            ele[4],
         )
-    reads_file.close()
-    logging.info("Finished %s:%d-%d." % (Chr_name, task[1], task[2]))
-    gc.collect()
+    assert len(ele) == 6
+    if ele[-2] == "INV":
+        # INV chr strand pos1 pos2 read_ID
+        return "%s\t%s\t%s\t%d\t%d\t%s\n" % (
+            ele[-2],
+            ele[-1],
+            ele[0],
+            ele[1],
+            ele[2],
+            ele[3],
+        )
+    assert ele[-2] == "INS"
+    # INS chr pos len read_ID seq
+    return "%s\t%s\t%d\t%d\t%s\t%s\n" % (
+        ele[-2],
+        ele[-1],
+        ele[0],
+        ele[1],
+        ele[2],
+        ele[3],
+    )
 
 
 def multi_run_wrapper(args):
@@ -968,28 +1176,34 @@ def multi_run_wrapper(args):
         raise exc
 
 
-def main_ctrl(args, argv):
+def main_ctrl(args, argv, pool: Optional[Pool] = None):
     if not os.path.isfile(args.reference):
         raise FileNotFoundError("[Errno 2] No such file: '%s'" % args.reference)
     temporary_dir = WorkDir(args.work_dir)
 
     # Apologise about the following line. I just can't fix all the silly directory handling here.
 
+    update_temp_data = temporary_dir.temp_dir_empty()
     contigINFO, read_group_name = process_bam_file(
-        args, temporary_dir.path, temporary_dir.temp_dir_empty()
+        args, temporary_dir.path, update_temp_data, pool
     )
 
     #'''
     #'''
-    if temporary_dir.temp_dir_empty():
-        logging.info("Rebuilding signatures of structural variants.")
-        merge_signatures(args, temporary_dir.path)
+    if update_temp_data:
+        logging.info("Rebuilt signatures of structural variants.")
     else:
         args.retain_work_dir = True
         logging.info(
             "Using signatures of structural variants from %s.", temporary_dir.path
         )
     #'''
+    if update_temp_data:
+        # Columns of earlier signatures are stale
+        remove_columns(temporary_dir.path)
+    if args.columnar_signatures and not temporary_dir.columnar:
+        n_signatures = write_columns(temporary_dir, int(args.threads), pool)
+        logging.info("Stored %d signatures in columns.", n_signatures)
 
     result = list()
 
@@ -998,105 +1212,123 @@ def main_ctrl(args, argv):
         logging.warning(
             "Force calling does something very different from denovo calling!"
         )
-        result = force_call_genotypes(args, temporary_dir)
+        result = force_call_genotypes(args, temporary_dir, pool)
 
     else:
         valuable_chr = temporary_dir.load_valuable_chr()
 
         logging.info("Clustering structural variants.")
-        analysis_pools = Pool(processes=int(args.threads))
-
-        def error_handler(exc, pool=analysis_pools):
-            logging.exception("Exception while multiprocessing! Exiting..")
-            pool.terminate()
-            raise exc
+        if args.genotype:
+            # Translocations are genotyped from the alignments, those of a stream from
+            # the reads store
+            if is_stream(args.input):
+                logging.info(
+                    "Genotyping translocations from the stored alignments with MAPQ "
+                    "of at least %d.",
+                    args.min_mapq,
+                )
+            genotype_threads = split_threads(
+                args.threads, args.htslib_threads, args.input, "genotype"
+            )
+        else:
+            genotype_threads = ThreadSplit(int(args.threads), 0)
+        tasks = list()
+        # (svtype, chromosome key, piece) of each task
+        task_keys = list()
+
+        def pieces(svtype, max_cluster_bias):
+            "Chromosomes of svtype and the pieces of their signatures clustered as tasks"
+            for chr in valuable_chr.get(svtype, []):
+                for piece in clustering_pieces(
+                    temporary_dir, svtype, chr, max_cluster_bias, args.cluster_piece_size
+                ):
+                    yield chr, piece
 
         # +++++DEL+++++
-        for chr in valuable_chr["DEL"]:
-            para = [
-                {
-                    "path": temporary_dir,
-                    "chr": chr,
-                    "svtype": "DEL",
-                    "read_count": args.min_support,
-                    "threshold_gloab": args.diff_ratio_merging_DEL,
-                    "max_cluster_bias": args.max_cluster_bias_DEL,
-                    "minimum_support_reads": min(args.min_support, 5),
-                    "bam_path": args.input,
-                    "action": args.genotype,
-                    "gt_round": args.gt_round,
-                    "remain_reads_ratio": args.remain_reads_ratio,
-                }
-            ]
-            result.append(
-                analysis_pools.map_async(run_del, para, error_callback=error_handler)
-            )
+        for chr, piece in pieces("DEL", args.max_cluster_bias_DEL):
+            para = {
+                "path": temporary_dir,
+                "chr": chr,
+                "svtype": "DEL",
+                "read_count": args.min_support,
+                "threshold_gloab": args.diff_ratio_merging_DEL,
+                "max_cluster_bias": args.max_cluster_bias_DEL,
+                "minimum_support_reads": min(args.min_support, 5),
+                "bam_path": args.input,
+                "action": args.genotype,
+                "gt_round": args.gt_round,
+                "remain_reads_ratio": args.remain_reads_ratio,
+                "piece": piece,
+            }
+            tasks.append((run_del, para))
+            task_keys.append(("DEL", chr, piece))
 
         # +++++INS+++++
-        for chr in valuable_chr["INS"]:
-            para = [
-                {
-                    "path": temporary_dir,
-                    "chr": chr,
-                    "svtype": "INS",
-                    "read_count": args.min_support,
-                    "threshold_gloab": args.diff_ratio_merging_INS,
-                    "max_cluster_bias": args.max_cluster_bias_INS,
-                    "minimum_support_reads": min(args.min_support, 5),
-                    "bam_path": args.input,
-                    "action": args.genotype,
-                    "gt_round": args.gt_round,
-                    "remain_reads_ratio": args.remain_reads_ratio,
-                }
-            ]
-            result.append(
-                analysis_pools.map_async(run_ins, para, error_callback=error_handler)
-            )
+        for chr, piece in pieces("INS", args.max_cluster_bias_INS):
+            para = {
+                "path": temporary_dir,
+                "chr": chr,
+                "svtype": "INS",
+                "read_count": args.min_support,
+                "threshold_gloab": args.diff_ratio_merging_INS,
+                "max_cluster_bias": args.max_cluster_bias_INS,
+                "minimum_support_reads": min(args.min_support, 5),
+                "bam_path": args.input,
+                "action": args.genotype,
+                "gt_round": args.gt_round,
+                "remain_reads_ratio": args.remain_reads_ratio,
+                "piece": piece,
+            }
+            tasks.append((run_ins, para))
+            task_keys.append(("INS", chr, piece))
 
         # +++++INV+++++
-        for chr in valuable_chr["INV"]:
-            para = [
-                {
-                    "path": temporary_dir,
-                    "chr": chr,
-                    "svtype": "INV",
-                    "read_count": args.min_support,
-                    "max_cluster_bias": args.max_cluster_bias_INV,
-                    "sv_size": args.min_size,
-                    "bam_path": args.input,
-                    "action": args.genotype,
-                    "MaxSize": args.max_size,
-                    "gt_round": args.gt_round,
-                }
-            ]
-            result.append(
-                analysis_pools.map_async(run_inv, para, error_callback=error_handler)
-            )
+        for chr, piece in pieces("INV", args.max_cluster_bias_INV):
+            para = {
+                "path": temporary_dir,
+                "chr": chr,
+                "svtype": "INV",
+                "read_count": args.min_support,
+                "max_cluster_bias": args.max_cluster_bias_INV,
+                "sv_size": args.min_size,
+                "bam_path": args.input,
+                "action": args.genotype,
+                "MaxSize": args.max_size,
+                "gt_round": args.gt_round,
+                "piece": piece,
+            }
+            tasks.append((run_inv, para))
+            task_keys.append(("INV", chr, piece))
 
         # +++++DUP+++++
-        for chr in valuable_chr["DUP"]:
-            para = [
-                {
-                    "path": temporary_dir,
-                    "chr": chr,
-                    "read_count": args.min_support,
-                    "max_cluster_bias": args.max_cluster_bias_DUP,
-                    "sv_size": args.min_size,
-                    "bam_path": args.input,
-                    "action": args.genotype,
-                    "MaxSize": args.max_size,
-                    "gt_round": args.gt_round,
-                }
-            ]
-            result.append(
-                analysis_pools.map_async(run_dup, para, error_callback=error_handler)
-            )
+        for chr, piece in pieces("DUP", args.max_cluster_bias_DUP):
+            para = {
+                "path": temporary_dir,
+                "chr": chr,
+                "read_count": args.min_support,
+                "max_cluster_bias": args.max_cluster_bias_DUP,
+                "sv_size": args.min_size,
+                "bam_path": args.input,
+                "action": args.genotype,
+                "MaxSize": args.max_size,
+                "gt_round": args.gt_round,
+                "piece": piece,
+            }
+            tasks.append((run_dup, para))
+            task_keys.append(("DUP", chr, piece))
 
         # +++++TRA+++++
-        for chr in valuable_chr["TRA"]:
+        for chr in valuable_chr.get("TRA", {}):
             for chr2 in valuable_chr["TRA"][chr]:
-                para = [
-                    {
+                tra_pieces = clustering_pieces(
+                    temporary_dir,
+                    "TRA",
+                    (chr, chr2),
+                    args.max_cluster_bias_TRA,
+                    args.cluster_piece_size,
+                )
+                for piece in tra_pieces:
+                    para = {
                         "path": temporary_dir,
                         "chr_1": chr,
                         "chr_2": chr2,
@@ -1106,16 +1338,24 @@ def main_ctrl(args, argv):
                         "bam_path": args.input,
                         "action": args.genotype,
                         "gt_round": args.gt_round,
+                        "htslib_threads": genotype_threads.htslib_threads,
+                        "piece": piece,
                     }
-                ]
-                result.append(
-                    analysis_pools.map_async(
-                        run_tra, para, error_callback=error_handler
-                    )
-                )
-
-        analysis_pools.close()
-        analysis_pools.join()
+                    tasks.append((run_tra, para))
+                    task_keys.append(("TRA", (chr, chr2), piece))
+        logging.info("Clustering in %d tasks.", len(tasks))
+        reads = read_counts(temporary_dir) if args.genotype else None
+        costs = [clustering_cost(temporary_dir, *key, reads) for key in task_keys]
+
+        result = [None] * len(tasks)
+        seconds = [0.0] * len(tasks)
+        with task_pool(pool, genotype_threads.workers, args.verbose) as cluster_pool:
+            for i, res, task_seconds in run_largest_first(
+                cluster_pool, tasks, costs, genotype_threads.workers
+            ):
+                result[i] = res
+                seconds[i] = task_seconds
+        log_task_times([task_label(*key) for key in task_keys], costs, seconds)
         del valuable_chr
 
     logging.info("Writing to your output file.")
@@ -1144,10 +1384,7 @@ def main_ctrl(args, argv):
     else:
         semi_result = list()
         for res in result:
-            try:
-                semi_result += res.get()[0]
-            except Exception as exc:
-                raise exc
+            semi_result += res
         # sort SVs by [chr] and [pos]
         semi_result = sorted(semi_result, key=lambda x: (x[0], int(x[2])))
 
@@ -1158,11 +1395,23 @@ def main_ctrl(args, argv):
         pass
     else:
         logging.info("Cleaning temporary files.")
-        cmd_remove_tempfile = f"rm -r {temporary_dir}/signatures {temporary_dir}/*.sigs"
-        exe(cmd_remove_tempfile)
+        wrk = temporary_dir.path
+        cmd_remove_tempfile = (
+            f"rm -rf {wrk}/signatures {wrk}/{COLUMNS_DIR} {wrk}/{SHARD_INDEX} "
+            f"{wrk}/*.sigs {wrk}/*.sigs.idx {wrk}/{READ_NAMES} {wrk}/{PROBED_NAMES} "
+            f"{wrk}/{READ_GROUPS} {wrk}/{READS_STORE} {wrk}/{TASK_MANIFEST} "
+            f"{wrk}/{METRICS_FILE}"
+        )
+        ret_code, output, _ = exe(cmd_remove_tempfile)
+        if ret_code != 0:
+            logging.warning(
+                "Failed cleaning temporary files (exit code %d): %s",
+                ret_code,
+                output.decode(errors="replace") if output else "",
+            )
 
 
-def force_call_genotypes(args, temporary_dir):
+def force_call_genotypes(args, temporary_dir, pool: Optional[Pool] = None):
     max_cluster_bias_dict = dict()
     max_cluster_bias_dict["INS"] = args.max_cluster_bias_INS
     max_cluster_bias_dict["DEL"] = args.max_cluster_bias_DEL
@@ -1180,116 +1429,338 @@ def force_call_genotypes(args, temporary_dir):
         threshold_gloab_dict,
         args.gt_round,
         args.threads,
+        pool,
     )
 
     return result
 
 
-def process_bam_file(args, temporary_dir: Path, update_temp_data: bool = True):
+def process_bam_file(
+    args,
+    temporary_dir: Path,
+    update_temp_data: bool = True,
+    pool: Optional[Pool] = None,
+):
+    if update_temp_data:
+        # The work dir files are written before any task runs
+        (temporary_dir / "signatures").mkdir(parents=True, exist_ok=True)
     samfile = pysam.AlignmentFile(args.input)
-    contig_num = len(samfile.get_index_statistics())
+    contig_num = samfile.nreferences
     logging.info("The total number of chromosomes: %d" % (contig_num))
 
-    Task_list = list()
-    chr_name_list = list()
-    contigINFO = list()
-
     rgs = samfile.header["RG"]
     assert len(rgs) == 1, "Alignment file should have exactly one read group."
     read_group_name = rgs[0]["ID"]
 
-    ref_ = samfile.get_index_statistics()
-    for i in ref_:
-        chr_name = i[0]
-        chr_name_list.append(chr_name)
-        local_ref_len = samfile.get_reference_length(chr_name)
-        contigINFO.append([chr_name, local_ref_len])
-        if local_ref_len < args.batches:
-            Task_list.append([chr_name, 0, local_ref_len])
-        else:
-            pos = 0
-            task_round = int(local_ref_len / args.batches)
-            for j in range(task_round):
-                Task_list.append([chr_name, pos, pos + args.batches])
-                pos += args.batches
-            if pos < local_ref_len:
-                Task_list.append([chr_name, pos, local_ref_len])
+    # Contig lengths from the header, streams have no index
+    contigINFO = [
+        [chr_name, local_ref_len]
+        for chr_name, local_ref_len in zip(samfile.references, samfile.lengths)
+    ]
+    references = list(samfile.references)
+    params = extraction_params(args)
+    if is_stream(args.input):
+        if update_temp_data:
+            write_read_groups(temporary_dir / READ_GROUPS, rgs)
+            process_stream(args, temporary_dir, samfile, params, pool)
+        samfile.close()
+        return (contigINFO, read_group_name)
     samfile.close()
-    bed_regions = load_bed(args.include_bed, Task_list)
+    Task_list = list()
+    if update_temp_data:
+        Task_list = read_manifest(temporary_dir / TASK_MANIFEST, params)
+        if Task_list is None:
+            # Largest first, so that the slow tasks are not left last.
+            Task_list = [
+                batch
+                for batch, _cost in partition_tasks(
+                    args.input, references, contigINFO, args.batches, args.threads
+                )
+            ]
+            write_manifest(temporary_dir / TASK_MANIFEST, params, Task_list)
+        else:
+            logging.info("Resuming the tasks of %s.", TASK_MANIFEST)
+    region_list = [task for batch in Task_list for task in batch]
+    bed_regions = load_bed(args.include_bed, region_list)
+    if bed_regions is not None:
+        # Regroup the regions per batch
+        region_iter = iter(bed_regions)
+        bed_regions = [[next(region_iter) for _task in batch] for batch in Task_list]
     #'''
     if update_temp_data:
-        process_alignments(args, temporary_dir, Task_list, bed_regions)
+        write_read_groups(temporary_dir / READ_GROUPS, rgs)
+        process_alignments(args, temporary_dir, Task_list, bed_regions, params, pool)
     return (contigINFO, read_group_name)
 
 
-def process_alignments(args, temporary_dir: Path, Task_list, bed_regions):
+def extraction_fields(args) -> Optional[int]:
+    "Return the alignment fields to decode for signature collection, None for all"
+    if args.decode_all_fields:
+        return None
+    # Inserted sequences are not used in force calling. Keep them for a retained
+    # work dir as it may be reused for de novo calling.
+    return signature_fields(
+        need_sequence=not args.two_pass_ins_seq
+        and (args.Ivcf is None or args.retain_work_dir)
+    )
+
+
+def extraction_params(args) -> Dict[str, Any]:
+    "Return the parameters that change the collected signatures or the tasks"
+    if is_stream(args.input):
+        alignments = [STREAM, None, None]
+    else:
+        stat = os.stat(args.input)
+        alignments = [os.path.abspath(args.input), stat.st_size, stat.st_mtime_ns]
+    return {
+        "version": VERSION,
+        "input": alignments,
+        "include_bed": None
+        if args.include_bed is None
+        else file_checksum(Path(args.include_bed)),
+        "batches": args.batches,
+        "min_size": args.min_size,
+        "min_mapq": args.min_mapq,
+        "max_split_parts": args.max_split_parts,
+        "min_read_len": args.min_read_len,
+        "min_siglength": args.min_siglength,
+        "merge_del_threshold": args.merge_del_threshold,
+        "merge_ins_threshold": args.merge_ins_threshold,
+        "max_size": args.max_size,
+        "fields": extraction_fields(args),
+        "two_pass_ins_seq": args.two_pass_ins_seq,
+        "compress_signatures": args.compress_signatures,
+    }
+
+
+def process_alignments(
+    args,
+    temporary_dir: Path,
+    Task_list,
+    bed_regions,
+    params: Dict[str, Any],
+    pool: Optional[Pool] = None,
+):
+    """Collect the signatures of the tasks and index them.
+
+    Tasks with a valid record from an interrupted run with the same parameters are not
+    run again. The read names, reads store and shard index are built from the records of
+    all tasks. The records are taken as the tasks finish.
+    """
     signatures_path = temporary_dir / "signatures/"
     signatures_path.mkdir(parents=True, exist_ok=True)
     logging.info("Signature path '%s'.", str(signatures_path))
 
-    analysis_pools = Pool(processes=int(args.threads))
+    fields = extraction_fields(args)
+    if fields is not None:
+        logging.info("Required alignment fields 0x%x.", fields)
+    digest = params_digest(params)
+
+    records = dict()
+    pending = list()
+    for i, batch in enumerate(Task_list):
+        pending_tasks = list()
+        for j, task in enumerate(batch):
+            record = load_task_record(signatures_path, task, digest)
+            if record is None:
+                pending_tasks.append(j)
+            else:
+                records[record["task"]] = record
+        if len(pending_tasks) > 0:
+            pending.append(
+                (
+                    [batch[j] for j in pending_tasks],
+                    None
+                    if bed_regions is None
+                    else [bed_regions[i][j] for j in pending_tasks],
+                )
+            )
+    if len(records) > 0:
+        logging.info(
+            "Found %d of %d tasks done.",
+            len(records),
+            sum(len(batch) for batch in Task_list),
+        )
+    # Outputs of interrupted or stale tasks
+    pending_prefixes = set(task_prefix(task) for tasks, _ in pending for task in tasks)
+    remove_task_outputs(signatures_path, pending_prefixes)
 
-    def error_handler(exc, pool=analysis_pools):
-        logging.exception("Exception while multiprocessing! Exiting..")
-        pool.terminate()
-        raise exc
+    signature_threads = split_threads(
+        args.threads, args.htslib_threads, args.input, "signatures"
+    )
+    tasks = list()
+    for batch, task_bed_regions in pending:
+        para = (
+            args.input,
+            args.min_size,
+            args.min_mapq,
+            args.max_split_parts,
+            args.min_read_len,
+            temporary_dir,
+            batch,
+            args.min_siglength,
+            args.merge_del_threshold,
+            args.merge_ins_threshold,
+            args.max_size,
+            task_bed_regions,
+            args.verbose,
+            fields,
+            args.two_pass_ins_seq,
+            args.compress_signatures,
+            digest,
+            signature_threads.htslib_threads,
+        )
+        tasks.append((multi_run_wrapper, para))
+    with task_pool(pool, signature_threads.workers, args.verbose) as signature_pool:
+        for _i, batch_records in run_tasks(
+            signature_pool, tasks, signature_threads.workers
+        ):
+            for record in batch_records:
+                records[record["task"]] = record
+    index_task_outputs(temporary_dir, list(records.values()))
+
+
+def process_stream(
+    args,
+    temporary_dir: Path,
+    samfile: pysam.AlignmentFile,
+    params: Dict[str, Any],
+    pool: Optional[Pool] = None,
+):
+    """Collect the signatures of a coordinate sorted alignment stream and index them.
 
-    for i in range(len(Task_list)):
-        para = [
-            (
-                args.input,
+    The tasks are cut from the stream as the workers become free, see
+    alignment_stream.py. A stream can not be resumed, so the outputs of earlier tasks in
+    the work directory are removed.
+    """
+    signatures_path = temporary_dir / "signatures/"
+    shutil.rmtree(signatures_path, ignore_errors=True)
+    signatures_path.mkdir(parents=True)
+    logging.info("Signature path '%s'.", str(signatures_path))
+    header_path = signatures_path / STREAM_HEADER
+    write_stream_header(header_path, samfile.header)
+
+    fields = extraction_fields(args)
+    digest = params_digest(params)
+    bed_index = load_bed_index(args.include_bed)
+    signature_threads = split_threads(
+        args.threads, args.htslib_threads, args.input, "signatures"
+    )
+
+    def tasks():
+        for task, lines in stream_tasks(samfile, args.batches):
+            para = (
+                header_path,
                 args.min_size,
                 args.min_mapq,
                 args.max_split_parts,
                 args.min_read_len,
                 temporary_dir,
-                Task_list[i],
+                [task],
                 args.min_siglength,
                 args.merge_del_threshold,
                 args.merge_ins_threshold,
                 args.max_size,
-                None if bed_regions is None else bed_regions[i],
+                None if bed_index is None else [task_bed_regions(bed_index, task)],
                 args.verbose,
+                fields,
+                args.two_pass_ins_seq,
+                args.compress_signatures,
+                digest,
+                0,
+                [lines],
             )
-        ]
-        analysis_pools.map_async(multi_run_wrapper, para, error_callback=error_handler)
-    analysis_pools.close()
-    analysis_pools.join()
+            yield multi_run_wrapper, para
 
+    records = list()
+    with task_pool(pool, signature_threads.workers, args.verbose) as signature_pool:
+        for _i, batch_records in run_tasks(
+            signature_pool, tasks(), signature_threads.workers
+        ):
+            records.extend(batch_records)
+    logging.info("Read %d tasks from the alignment stream.", len(records))
+    index_task_outputs(temporary_dir, records)
 
-def merge_signatures(args, temporary_dir: Path):
-    temporary_dir = str(temporary_dir) + "/"
-    cmd_del = (
-        "cat %ssignatures/*.bed | grep -w DEL | sort -u -T %s | sort -k 2,2 -k 3,3n -T %s > %sDEL.sigs"
-        % (temporary_dir, temporary_dir, temporary_dir, temporary_dir)
-    )
-    cmd_ins = (
-        "cat %ssignatures/*.bed | grep -w INS | sort -u -T %s | sort -k 2,2 -k 3,3n -T %s > %sINS.sigs"
-        % (temporary_dir, temporary_dir, temporary_dir, temporary_dir)
-    )
-    cmd_inv = (
-        "cat %ssignatures/*.bed | grep -w INV | sort -u -T %s | sort -k 2,2 -k 3,3 -k 4,4n -T %s > %sINV.sigs"
-        % (temporary_dir, temporary_dir, temporary_dir, temporary_dir)
+
+def remap_task_shards(
+    signatures_path: Path, prefix: str, entries: List[ShardEntry], remap: Dict[int, int]
+) -> List[ShardEntry]:
+    """Write the shards of a task with the read IDs of remap to {prefix}.ids.* shards.
+
+    The shards of the task are kept as they are, so that the work dir can be indexed
+    again from the task records.
+    """
+    remapped = list()
+    for name in dict.fromkeys(entry[2] for entry in entries):
+        remapped += remap_shard(
+            signatures_path / name,
+            signatures_path / ("%s.ids%s" % (prefix, name[len(prefix) :])),
+            [entry for entry in entries if entry[2] == name],
+            remap,
+        )
+    return remapped
+
+
+def index_task_outputs(temporary_dir: Path, records: List[TaskRecord]):
+    """Build the read names, reads store, shard index and metrics from the task records.
+
+    Reads of different tasks with the same hash are given distinct IDs (see
+    read_names.resolve_read_ids), and the outputs of their tasks are remapped to them.
+    """
+    signatures_path = temporary_dir / "signatures/"
+    # Task order, as the reads shards were
+    records = sorted(records, key=lambda record: record["task"])
+    named = [
+        record for record in records if record["task"] + NAMES_SUFFIX in record["files"]
+    ]
+    merged = merge_names(
+        temporary_dir / READ_NAMES,
+        [
+            (signatures_path / (record["task"] + NAMES_SUFFIX), record["probed"])
+            for record in named
+        ],
     )
-    cmd_tra = (
-        "cat %ssignatures/*.bed | grep -w TRA | sort -u -T %s | sort -k 2,2 -k 5,5 -k 3,3 -k 4,4n -T %s > %sTRA.sigs"
-        % (temporary_dir, temporary_dir, temporary_dir, temporary_dir)
+    write_names(
+        temporary_dir / PROBED_NAMES,
+        {rid: name for name, rid in merged.probed.items()},
     )
-    cmd_dup = (
-        "cat %ssignatures/*.bed | grep -w DUP | sort -u -T %s | sort -k 1,1r -k 2,2 -k 3,4n -T %s > %sDUP.sigs"
-        % (temporary_dir, temporary_dir, temporary_dir, temporary_dir)
+    logging.info("Wrote names of %d reads.", merged.count)
+    # New read IDs of the outputs of each task, after hash collisions
+    remaps = {record["task"]: remap for record, remap in zip(named, merged.remaps)}
+    shard_entries = list()
+    for record in records:
+        remap = remaps.get(record["task"], {})
+        if len(remap) == 0:
+            shard_entries += record["entries"]
+        else:
+            shard_entries += remap_task_shards(
+                signatures_path, record["task"], record["entries"], remap
+            )
+    reads_paths = list()
+    reads_remaps = list()
+    for record in records:
+        if record["task"] + READS_PART_SUFFIX in record["files"]:
+            reads_paths.append(signatures_path / (record["task"] + READS_PART_SUFFIX))
+            reads_remaps.append(remaps.get(record["task"], {}))
+    n_reads = merge_reads_parts(temporary_dir / READS_STORE, reads_paths, reads_remaps)
+    logging.info("Stored coordinates of %d alignments.", n_reads)
+    write_shard_index(temporary_dir / SHARD_INDEX, shard_entries)
+    logging.info("Wrote %d signature shard ranges.", len(shard_entries))
+    summary = write_metrics(
+        temporary_dir / METRICS_FILE,
+        [record["metrics"] for record in records if record.get("metrics") is not None],
     )
-    cmd_reads = "cat %ssignatures/*.reads > %sreads.sigs" % (
-        temporary_dir,
-        temporary_dir,
+    logging.info(
+        "Fetched %d alignments in %0.1f s, parsed in %0.1f s and wrote signatures in "
+        "%0.1f s. Peak RSS %d kB per worker. See %s.",
+        summary["reads"].get("fetched", 0),
+        summary["seconds"]["fetch"],
+        summary["seconds"]["parse"],
+        summary["seconds"]["write"],
+        summary["peak_rss_kb"]["task"],
+        METRICS_FILE,
     )
 
-    analysis_pools = Pool(processes=int(args.threads))
-    for i in [cmd_ins, cmd_del, cmd_dup, cmd_tra, cmd_inv, cmd_reads]:
-        analysis_pools.map_async(exe, (i,))
-    analysis_pools.close()
-    analysis_pools.join()
-
 
 def run(argv=None):
     if argv is None:
@@ -1297,5 +1768,7 @@ def run(argv=None):
     args = parseArgs(argv)
     setupLogging(args.verbose)
     starttime = time.time()
-    main_ctrl(args, argv)
+    # One pool of workers for all stages of the run
+    with start_pool(args.threads, args.verbose) as pool:
+        main_ctrl(args, argv, pool)
     logging.info("Finished in %0.2f seconds." % (time.time() - starttime))
@@ -1,6 +1,7 @@
 from typing import Iterable
+from .Description import WorkDir
 from .genotype import cal_CI, overlap_cover, assign_gt
-from multiprocessing import Pool
+from .worker_pool import ordered_results, run_tasks, task_pool
 from pysam import VariantFile, VariantRecord
 
 import logging
@@ -103,66 +104,73 @@ def parse_record(record):
     return sv_type, chrom1, chrom2, start, end, strand, svid, ref, alts
 
 
+def sig_lines(var_type, work_dir: WorkDir, chrom_list) -> Iterable[str]:
+    "Generate signature lines of var_type on the chromosomes of chrom_list"
+    valuable_chr = work_dir.load_valuable_chr()
+    for chrom in chrom_list:
+        if var_type == "TRA":
+            for chrom2 in valuable_chr.get("TRA", {}).get(chrom, []):
+                yield from work_dir.lines("TRA", chrom, chrom2)
+        elif chrom in valuable_chr.get(var_type, []):
+            yield from work_dir.lines(var_type, chrom)
+
+
 def parse_sigs_chrom(var_type, work_dir, chrom_list):
     if var_type == "DEL" or var_type == "DUP":
         var_dict = dict()  # var_dict[chrom] = [chrom, start, len/end, read_id]
-        with open(work_dir + var_type + ".sigs", "r") as f:
-            for line in f:
-                seq = line.strip().split("\t")
-                if seq[1] in chrom_list:
-                    if seq[1] not in var_dict:
-                        var_dict[seq[1]] = []
-                    var_dict[seq[1]].append([seq[1], int(seq[2]), int(seq[3]), seq[4]])
+        for line in sig_lines(var_type, work_dir, chrom_list):
+            seq = line.strip().split("\t")
+            if seq[1] in chrom_list:
+                if seq[1] not in var_dict:
+                    var_dict[seq[1]] = []
+                var_dict[seq[1]].append([seq[1], int(seq[2]), int(seq[3]), seq[4]])
         return var_dict
     if var_type == "INS":
         var_dict = dict()  # var_dict[chrom] = [chrom, start, len, read_id, seq]
-        with open(work_dir + "INS.sigs", "r") as f:
-            for line in f:
-                seq = line.strip().split("\t")
-                if seq[1] in chrom_list:
-                    if len(seq) < 6:
-                        cigar = "<INS>"
-                    else:
-                        cigar = seq[5]
+        for line in sig_lines("INS", work_dir, chrom_list):
+            seq = line.strip().split("\t")
+            if seq[1] in chrom_list:
+                if len(seq) < 6:
                     cigar = "<INS>"
-                    if seq[1] not in var_dict:
-                        var_dict[seq[1]] = []
-                    var_dict[seq[1]].append(
-                        [seq[1], int(seq[2]), int(seq[3]), seq[4], cigar]
-                    )
+                else:
+                    cigar = seq[5]
+                cigar = "<INS>"
+                if seq[1] not in var_dict:
+                    var_dict[seq[1]] = []
+                var_dict[seq[1]].append(
+                    [seq[1], int(seq[2]), int(seq[3]), seq[4], cigar]
+                )
         return var_dict
     if var_type == "INV":
         var_dict = dict()  # var_dict[chrom] = [chrom, start, end, read_id]
-        with open(work_dir + "INV.sigs", "r") as f:
-            for line in f:
-                seq = line.strip().split("\t")
-                if seq[1] in chrom_list:
-                    chrom = seq[1]
-                    if chrom not in var_dict:
-                        var_dict[chrom] = []
-                    var_dict[chrom].append([chrom, int(seq[3]), int(seq[4]), seq[5]])
+        for line in sig_lines("INV", work_dir, chrom_list):
+            seq = line.strip().split("\t")
+            if seq[1] in chrom_list:
+                chrom = seq[1]
+                if chrom not in var_dict:
+                    var_dict[chrom] = []
+                var_dict[chrom].append([chrom, int(seq[3]), int(seq[4]), seq[5]])
         for chrom in var_dict:
             var_dict[chrom].sort(key=lambda x: x[1])
         return var_dict
     if var_type in ("TRA", "BND"):
         var_dict = dict()  # var_dict[chrom1][chrom2] = [[chrom2, pos1, pos2, read_id]]
-        with open(work_dir + "TRA.sigs", "r") as f:
-            for line in f:
-                seq = line.strip().split("\t")
-                if seq[1] not in chrom_list:
-                    continue
-                chrom1 = seq[1]
-                tra_type = seq[2]
-                pos1 = int(seq[3])
-                chrom2 = seq[4]
-                pos2 = int(seq[5])
-                read_id = seq[6]
-
-                if chrom1 not in var_dict:
-                    var_dict[chrom1] = dict()
-                if chrom2 not in var_dict[chrom1]:
-                    var_dict[chrom1][chrom2] = []
-                var_dict[chrom1][chrom2].append([chrom2, pos1, pos2, read_id])
+        for line in sig_lines("TRA", work_dir, chrom_list):
+            seq = line.strip().split("\t")
+            if seq[1] not in chrom_list:
+                continue
+            chrom1 = seq[1]
+            tra_type = seq[2]
+            pos1 = int(seq[3])
+            chrom2 = seq[4]
+            pos2 = int(seq[5])
+            read_id = seq[6]
+
+            if chrom1 not in var_dict:
+                var_dict[chrom1] = dict()
+            if chrom2 not in var_dict[chrom1]:
+                var_dict[chrom1][chrom2] = []
+            var_dict[chrom1][chrom2].append([chrom2, pos1, pos2, read_id])
         for chr1 in var_dict:
             for chr2 in var_dict[chr1]:
                 var_dict[chr1][chr2].sort(key=lambda x: x[1])
@@ -517,6 +525,7 @@ def force_calling_chrom(
     threshold_gloab_dict,
     gt_round,
     threads,
+    pool=None,
 ):
     logging.info("Check the parameter -Ivcf: OK.")
     logging.info("Enable to perform force calling.")
@@ -545,20 +554,12 @@ def force_calling_chrom(
         )
 
     # parse reads in alignment
-    reads_count = dict()
-    with open("%sreads.sigs" % (temporary_dir), "r") as f:
-        for line in f:
-            seq = line.strip().split("\t")
-            if seq[0] not in reads_count:
-                reads_count[seq[0]] = 0
-            reads_count[seq[0]] += 1
+    reads_count = temporary_dir.read_counts()
     reads_count = sorted(reads_count.items(), key=lambda x: x[1])
     dispatch = generate_dispatch(reads_count, svs_tobe_genotyped.keys())
 
     # force calling
-    pool_result = list()
-    result = list()
-    process_pool = Pool(processes=threads)
+    tasks = list()
     # dispatch = [['MT']]
     for chroms in dispatch:
         genotype_sv_list = dict()
@@ -568,22 +569,19 @@ def force_calling_chrom(
         if len(genotype_sv_list) == 0:
             continue
         # pool_result.append(solve_fc(chroms, genotype_sv_list, temporary_dir, max_cluster_bias_dict, threshold_gloab_dict, gt_round))
-        fx_para = [
-            (
-                chroms,
-                genotype_sv_list,
-                temporary_dir,
-                max_cluster_bias_dict,
-                threshold_gloab_dict,
-                gt_round,
-            )
-        ]
-        pool_result.append(process_pool.map_async(solve_fc_wrapper, fx_para))
-    process_pool.close()
-    process_pool.join()
-
-    for x in pool_result:
-        result.extend(x.get()[0])
+        fx_para = (
+            chroms,
+            genotype_sv_list,
+            temporary_dir,
+            max_cluster_bias_dict,
+            threshold_gloab_dict,
+            gt_round,
+        )
+        tasks.append((solve_fc_wrapper, fx_para))
+    result = list()
+    with task_pool(pool, threads) as fc_pool:
+        for chrom_result in ordered_results(run_tasks(fc_pool, tasks, threads)):
+            result.extend(chrom_result)
     return result
 
 
@@ -600,16 +598,12 @@ def solve_fc(
     gt_round,
 ):
     reads_info = dict()  # [10000, 10468, 0, 'm54238_180901_011437/52298335/ccs']
-    reads_file_name = temporary_dir.path / "reads.sigs"
-    with reads_file_name.open("r") as readsfile:
-        for line in readsfile:
-            seq = line.strip().split("\t")
-            chr = seq[0]
-            if chr not in chrom_list:
-                continue
+    for chr in chrom_list:
+        for read in temporary_dir.reads(chr):
             if chr not in reads_info:
                 reads_info[chr] = list()
-            reads_info[chr].append([int(seq[1]), int(seq[2]), int(seq[3]), seq[4]])
+            # Read IDs as in the signature lines
+            reads_info[chr].append([read[0], read[1], read[2], str(read[3])])
 
     sv_dict = dict()
     for sv_type in ["DEL", "DUP", "INS", "INV", "TRA", "BND"]:
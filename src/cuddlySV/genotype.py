@@ -1,6 +1,15 @@
 import logging
-from typing import Dict, List, Tuple
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
 from .Description import Generation_VCF_header, WorkDir
+from .read_names import (
+    READ_NAMES,
+    lookup_names,
+    resolve_rnames,
+    rnames_ids,
+)
 from math import log10
 import numpy as np
 from collections import namedtuple
@@ -143,28 +152,63 @@ def count_coverage(chr, s, e, f, read_count, up_bound, itround):
     return status
 
 
-def load_reads(temporary_dir: WorkDir, chr: str) -> List[ChrReadInfo]:
-    """Read the reads.sigs file from work directory
+def count_stored_coverage(chr, s, e, work_dir, read_count, up_bound, itround):
+    """count_coverage of the alignments in the reads store of work_dir instead of the
+    alignment file, for the alignments read from a stream.
+
+    The store has only the alignments with at least --min_mapq, so the share of primary
+    alignments after itround alignments is of those.
+    """
+    status = 0
+    iteration = 0
+    primary_num = 0
+    for read in load_reads(work_dir, chr, (s, e)):
+        iteration += 1
+        if not read.PRIMARY:
+            continue
+        primary_num += 1
+        if read.START < s and read.STOP > e:
+            read_count.add(read.READ_NAME)
+            if len(read_count) >= up_bound:
+                status = 1
+                break
+        if iteration >= itround:
+            if float(primary_num / iteration) <= 0.2:
+                status = 1
+            else:
+                status = -1
+            break
+
+    return status
+
+
+def load_reads(
+    temporary_dir: WorkDir, chr: str, region: Optional[Tuple[float, float]] = None
+) -> List[ChrReadInfo]:
+    """Read the reads of a chromosome from the reads store, reads.sigs or read shards
 
     Args:
-        temporary_dir (str): Used work directory as string
+        temporary_dir (WorkDir): Used work directory
         chr (str): Chromosome to be read.
+        region (Optional[Tuple[float, float]]): Only reads overlapping the region, see
+            svs_region. None for all.
 
     Returns:
         List[ChrReadInfo]: List of used reads in given chromosome
     """
-    reads_list = list()  # [(10000, 10468, 0, 'm54238_180901_011437/52298335/ccs'), ...]
-    reads_path = temporary_dir.path / "reads.sigs"
-    with reads_path.open("r") as readsfile:
-        for line in readsfile:
-            seq = line.strip().split("\t")
-            if seq[0] != chr:
-                continue
-            reads_list.append(
-                ChrReadInfo(int(seq[1]), int(seq[2]), int(seq[3]), seq[4])
-            )
+    # [(10000, 10468, 0, 'm54238_180901_011437/52298335/ccs'), ...]
+    return [ChrReadInfo(*read) for read in temporary_dir.reads(chr, region)]
+
 
-    return reads_list
+def svs_region(svs_list: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """Span of the SV intervals of overlap_cover.
+
+    Only the reads overlapping the open span can overlap an SV interval, so the others
+    need not be loaded.
+    """
+    if not svs_list:
+        return (0, 0)
+    return min(i[0] for i in svs_list), max(i[1] for i in svs_list)
 
 
 def overlap_cover(
@@ -332,6 +376,20 @@ def strip_rnames(rnames: str) -> str:
     return ",".join(rname.split(":")[0] for rname in rnames.split(","))
 
 
+# Field of comma separated supporting read IDs in the variants of each type, BND otherwise
+RNAMES_FIELD = {"DEL": 12, "INS": 12, "DUP": 10, "INV": 11}
+
+
+def load_rnames(args, rnames_list: List[str]) -> Dict[int, str]:
+    "Look up the names of the reads in RNAMES from the read names of the work dir"
+    if not args.report_readid:
+        return {}
+    ids = set()
+    for rnames in rnames_list:
+        ids.update(rnames_ids(rnames))
+    return lookup_names(Path(args.work_dir) / READ_NAMES, ids)
+
+
 def generate_output(args, semi_result: List[Tuple], contigINFO, argv, ref_g):
     """
     Generation of VCF format file.
@@ -347,6 +405,9 @@ def generate_output(args, semi_result: List[Tuple], contigINFO, argv, ref_g):
     svid["DUP"] = 0
     svid["INV"] = 0
 
+    read_names = load_rnames(
+        args, [variant[RNAMES_FIELD.get(variant[1], 11)] for variant in semi_result]
+    )
     file = open(args.output, "w")
     action = args.genotype
     Generation_VCF_header(file, contigINFO, args.sample, argv)
@@ -373,11 +434,11 @@ def generate_output(args, semi_result: List[Tuple], contigINFO, argv, ref_g):
                     str(variant),
                 )
                 continue
-            output_INS_DEL(args, ref_g, svid, file, action, variant)
+            output_INS_DEL(args, ref_g, svid, file, action, variant, read_names)
         elif variant[1] == "DUP":
-            output_DUP(args, ref_g, svid, file, action, variant)
+            output_DUP(args, ref_g, svid, file, action, variant, read_names)
         elif variant[1] == "INV":
-            output_INV(args, ref_g, svid, file, action, variant)
+            output_INV(args, ref_g, svid, file, action, variant, read_names)
         else:
             # BND
             # info_list = "{PRECISION};SVTYPE={SVTYPE};CHR2={CHR2};END={END};RE={RE};RNAMES={RNAMES}".format(
@@ -387,13 +448,13 @@ def generate_output(args, semi_result: List[Tuple], contigINFO, argv, ref_g):
                 int(variant[2]) + 1,
                 variant[1],
             )
-            output_BND(args, ref_g, svid, file, action, variant)
+            output_BND(args, ref_g, svid, file, action, variant, read_names)
 
 
-def output_BND(args, ref_g, svid, file, action, variant):
+def output_BND(args, ref_g, svid, file, action, variant, read_names):
     rnames = "NULL"
     if args.report_readid:
-        rnames = variant[11]
+        rnames = resolve_rnames(variant[11], read_names)
     if not args.report_readgroup:
         rnames = strip_rnames(rnames)
     info_list = "{PRECISION};SVTYPE={SVTYPE};RE={RE};RNAMES={RNAMES}".format(
@@ -440,10 +501,10 @@ def output_BND(args, ref_g, svid, file, action, variant):
     svid["BND"] += 1
 
 
-def output_INV(args, ref_g, svid, file, action, variant):
+def output_INV(args, ref_g, svid, file, action, variant, read_names):
     rnames = "NULL"
     if args.report_readid:
-        rnames = variant[11]
+        rnames = resolve_rnames(variant[11], read_names)
     if not args.report_readgroup:
         rnames = strip_rnames(rnames)
     cal_end = int(variant[2]) + 1 + abs(int(float(variant[3])))
@@ -488,10 +549,10 @@ def output_INV(args, ref_g, svid, file, action, variant):
     svid[variant[1]] += 1
 
 
-def output_DUP(args, ref_g, svid, file, action, variant):
+def output_DUP(args, ref_g, svid, file, action, variant, read_names):
     rnames = "NULL"
     if args.report_readid:
-        rnames = variant[10]
+        rnames = resolve_rnames(variant[10], read_names)
     if not args.report_readgroup:
         rnames = strip_rnames(rnames)
     cal_end = int(variant[2]) + 1 + abs(int(float(variant[3])))
@@ -535,7 +596,7 @@ def output_DUP(args, ref_g, svid, file, action, variant):
     svid[variant[1]] += 1
 
 
-def output_INS_DEL(args, ref_g, svid, file, action, variant):
+def output_INS_DEL(args, ref_g, svid, file, action, variant, read_names):
     if variant[1] == "INS":
         cal_end = int(variant[2])
     else:
@@ -543,7 +604,7 @@ def output_INS_DEL(args, ref_g, svid, file, action, variant):
 
     rnames = "NULL"
     if args.report_readid:
-        rnames = variant[12]
+        rnames = resolve_rnames(variant[12], read_names)
     if not args.report_readgroup:
         rnames = strip_rnames(rnames)
     info_list = "{PRECISION};SVTYPE={SVTYPE};SVLEN={SVLEN};END={END};CIPOS={CIPOS};CILEN={CILEN};RE={RE};RNAMES={RNAMES}".format(
@@ -611,6 +672,7 @@ def output_INS_DEL(args, ref_g, svid, file, action, variant):
 
 
 def generate_pvcf(args, result, contigINFO, argv, ref_g):
+    read_names = load_rnames(args, [i[8] for i in result if i != []])
     file = open(args.output, "w")
     Generation_VCF_header(file, contigINFO, args.sample, argv)
     file.write(
@@ -647,7 +709,9 @@ def generate_pvcf(args, result, contigINFO, argv, ref_g):
                 CIPOS=i[5],
                 CILEN=i[6],
                 RE=i[7][0],
-                RNAMES=i[8] if args.report_readid else "NULL",
+                RNAMES=resolve_rnames(i[8], read_names)
+                if args.report_readid
+                else "NULL",
             )
             try:
                 info_list += ";AF=" + str(round(i[7][0] / (i[7][0] + i[7][1]), 4))
@@ -688,7 +752,9 @@ def generate_pvcf(args, result, contigINFO, argv, ref_g):
                 CIPOS=i[5],
                 CILEN=i[6],
                 RE=i[7][0],
-                RNAMES=i[8] if args.report_readid else "NULL",
+                RNAMES=resolve_rnames(i[8], read_names)
+                if args.report_readid
+                else "NULL",
             )
             try:
                 info_list += ";AF=" + str(round(i[7][0] / (i[7][0] + i[7][1]), 4))
@@ -721,7 +787,9 @@ def generate_pvcf(args, result, contigINFO, argv, ref_g):
                 SVLEN=abs(i[4] - i[1]),
                 END=i[4],
                 RE=i[7][0],
-                RNAMES=i[8] if args.report_readid else "NULL",
+                RNAMES=resolve_rnames(i[8], read_names)
+                if args.report_readid
+                else "NULL",
             )
             try:
                 info_list += ";AF=" + str(round(i[7][0] / (i[7][0] + i[7][1]), 4))
@@ -754,7 +822,9 @@ def generate_pvcf(args, result, contigINFO, argv, ref_g):
                 SVLEN=i[4] - i[1],
                 END=i[4],
                 RE=i[7][0],
-                RNAMES=(i[8]) if args.report_readid else "NULL",
+                RNAMES=resolve_rnames(i[8], read_names)
+                if args.report_readid
+                else "NULL",
             )
             if i[12] != ".":
                 info_list += ";STRAND=" + i[12]
@@ -786,7 +856,9 @@ def generate_pvcf(args, result, contigINFO, argv, ref_g):
                 PRECISION="IMPRECISE" if i[2] == "0/0" else "PRECISE",
                 SVTYPE=i[3],
                 RE=i[7][0],
-                RNAMES=i[8] if args.report_readid else "NULL",
+                RNAMES=resolve_rnames(i[8], read_names)
+                if args.report_readid
+                else "NULL",
             )
             try:
                 info_list += ";AF=" + str(round(i[7][0] / (i[7][0] + i[7][1]), 4))
@@ -818,28 +890,80 @@ def generate_pvcf(args, result, contigINFO, argv, ref_g):
             )
 
 
-def load_bed(bed_file, Task_list):
-    # Task_list: [[chr, start, end], ...]
-    bed_regions = dict()
-    if bed_file is not None:
-        # only consider regions in BED file
-        with open(bed_file, "r") as f:
-            for line in f:
-                seq = line.strip().split("\t")
-                if seq[0] not in bed_regions:
-                    bed_regions[seq[0]] = list()
-                bed_regions[seq[0]].append((int(seq[1]) - 1000, int(seq[2]) + 1000))
-        region_list = [[] for i in range(len(Task_list))]
-        for chrom in bed_regions:
-            bed_regions[chrom].sort(key=lambda x: (x[0], x[1]))
-            for item in bed_regions[chrom]:
-                for i in range(len(Task_list)):
-                    if chrom == Task_list[i][0]:
-                        if (
-                            Task_list[i][1] <= item[0] and Task_list[i][2] > item[0]
-                        ) or item[0] <= Task_list[i][1] < item[1]:
-                            region_list[i].append(item)
-        assert len(region_list) == len(Task_list), "parse bed file error"
-        return region_list
-    else:
+class IntervalIndex(object):
+    """Half-open intervals sorted by start for overlap queries in O(log n).
+
+    The running maximum of the interval ends is kept along the starts: an interval
+    overlapping [start, end) exists if the maximum end of the intervals starting before
+    end is past start.
+    """
+
+    def __init__(self, intervals: List[Tuple[int, int]]):
+        self.intervals = sorted(intervals)
+        self.starts = [i[0] for i in self.intervals]
+        self.max_ends = list(accumulate((i[1] for i in self.intervals), max))
+
+    def __len__(self) -> int:
+        return len(self.intervals)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        "Whether any interval overlaps [start, end)"
+        idx = bisect_left(self.starts, end)
+        return idx > 0 and self.max_ends[idx - 1] > start
+
+    def subset(self, start: int, end: int) -> "IntervalIndex":
+        """Index of the intervals starting before end and after the first interval
+        reaching past start. Contains all the intervals overlapping [start, end)."""
+        lo = bisect_right(self.max_ends, start)
+        hi = bisect_left(self.starts, end)
+        return IntervalIndex(self.intervals[lo:hi])
+
+
+def load_bed_index(bed_file) -> Optional[Dict[str, IntervalIndex]]:
+    """Index the regions of BED file by chromosome.
+
+    The regions are extended by 1 kb on both sides.
+
+    Args:
+        bed_file (Optional[str]): Path to BED file, or None for no filtering.
+
+    Returns:
+        Optional[Dict[str, IntervalIndex]]: Regions of each chromosome, None without
+            BED file.
+    """
+    if bed_file is None:
+        return None
+    # only consider regions in BED file
+    bed_regions: Dict[str, List[Tuple[int, int]]] = dict()
+    with open(bed_file, "r") as f:
+        for line in f:
+            seq = line.strip().split("\t")
+            if seq[0] not in bed_regions:
+                bed_regions[seq[0]] = list()
+            bed_regions[seq[0]].append((int(seq[1]) - 1000, int(seq[2]) + 1000))
+    return {chrom: IntervalIndex(regions) for chrom, regions in bed_regions.items()}
+
+
+def task_bed_regions(bed_index: Dict[str, IntervalIndex], task) -> IntervalIndex:
+    "Return the BED regions overlapping task [chr, start, end]"
+    if task[0] not in bed_index:
+        return IntervalIndex([])
+    return bed_index[task[0]].subset(task[1], task[2])
+
+
+def load_bed(bed_file, Task_list) -> Optional[List[IntervalIndex]]:
+    """Index the regions of BED file for each task.
+
+    The regions are extended by 1 kb on both sides.
+
+    Args:
+        bed_file (Optional[str]): Path to BED file, or None for no filtering.
+        Task_list (List[List]): Tasks [chr, start, end].
+
+    Returns:
+        Optional[List[IntervalIndex]]: Regions overlapping each task, None without BED file.
+    """
+    bed_index = load_bed_index(bed_file)
+    if bed_index is None:
         return None
+    return [task_bed_regions(bed_index, task) for task in Task_list]
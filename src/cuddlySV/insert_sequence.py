@@ -0,0 +1,178 @@
+"""Deferred retrieval of inserted sequences.
+
+Instead of copying the read bases of every insertion signature, signature collection can
+store a locator of the bases within the alignment they came from. The locators are
+written in place of the sequence as tokens
+
+    {chrom,ref_start,flag,start,stop,step}
+
+where chrom, ref_start and flag identify the alignment (together with the read name of
+the signature) and range(start, stop, step) gives the indices to its query sequence.
+Tokens of merged signals are concatenated. The bases are fetched from the alignment file
+only for the insertions that are reported.
+"""
+import logging
+import re
+from typing import List, Optional, Tuple, Union
+
+from .alignment_file import (
+    get_query_name,
+    get_read_id,
+    open_alignment_file,
+    signature_fields,
+)
+from .read_names import ProbedIds
+
+TOKEN_PATTERN = re.compile(r"\{([^{},]*),(\d+),(\d+),(-?\d+),(-?\d+),(-?1)\}")
+
+# (chrom, ref_start, flag)
+Locator = Tuple[str, int, int]
+
+
+class DeferredQuery(object):
+    """Stand-in for the query sequence of an alignment.
+
+    Slicing works like slicing a string, including reversal with [::-1], but yields
+    index ranges instead of bases. str() gives the locator token.
+    """
+
+    __slots__ = ("locator", "indices")
+
+    def __init__(self, chrom: str, ref_start: int, flag: int, length: int):
+        self.locator: Locator = (chrom, ref_start, flag)
+        self.indices = range(length)
+
+    def __getitem__(self, key: slice) -> "DeferredQuery":
+        if not isinstance(key, slice):
+            raise TypeError("DeferredQuery supports only slicing")
+        sliced = object.__new__(DeferredQuery)
+        sliced.locator = self.locator
+        sliced.indices = self.indices[key]
+        return sliced
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __str__(self) -> str:
+        if len(self.indices) == 0:
+            return ""
+        return "{%s,%d,%d,%d,%d,%d}" % (
+            self.locator
+            + (self.indices.start, self.indices.stop, self.indices.step)
+        )
+
+
+def take(sequence: str, indices: range) -> str:
+    "Return the bases of sequence at indices"
+    if len(indices) == 0:
+        return ""
+    stop = indices.stop if indices.stop >= 0 else None
+    return sequence[indices.start : stop : indices.step]
+
+
+class DeferredSequence(object):
+    "Inserted sequence given as locator tokens, possibly mixed with plain bases."
+
+    __slots__ = ("pieces",)
+
+    def __init__(self, pieces: List[Union[str, Tuple[Locator, range]]]):
+        self.pieces = pieces
+
+    @classmethod
+    def parse(cls, seq: str) -> Union[str, "DeferredSequence"]:
+        "Return DeferredSequence for seq with locator tokens, seq itself otherwise"
+        if not seq.startswith("{"):
+            return seq
+        pieces: List[Union[str, Tuple[Locator, range]]] = []
+        prev_end = 0
+        for match in TOKEN_PATTERN.finditer(seq):
+            if match.start() > prev_end:
+                pieces.append(seq[prev_end : match.start()])
+            chrom, ref_start, flag, start, stop, step = match.groups()
+            pieces.append(
+                (
+                    (chrom, int(ref_start), int(flag)),
+                    range(int(start), int(stop), int(step)),
+                )
+            )
+            prev_end = match.end()
+        if prev_end < len(seq):
+            pieces.append(seq[prev_end:])
+        return cls(pieces)
+
+    def __len__(self) -> int:
+        return sum(len(i) if isinstance(i, str) else len(i[1]) for i in self.pieces)
+
+    def __getitem__(self, key: slice) -> "DeferredSequence":
+        "Slice with step 1 (or None)"
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("DeferredSequence supports only contiguous slicing")
+        start, stop, _ = key.indices(len(self))
+        pieces = []
+        offset = 0
+        for piece in self.pieces:
+            piece_len = len(piece) if isinstance(piece, str) else len(piece[1])
+            lo, hi = max(start - offset, 0), min(stop - offset, piece_len)
+            if lo < hi:
+                if isinstance(piece, str):
+                    pieces.append(piece[lo:hi])
+                else:
+                    pieces.append((piece[0], piece[1][lo:hi]))
+            offset += piece_len
+        return DeferredSequence(pieces)
+
+    def resolve(
+        self, fetcher: "InsertSequenceFetcher", read_name: Union[int, str]
+    ) -> str:
+        "Fetch the bases of the sequence. Raises LookupError if the read is not found."
+        return "".join(
+            piece
+            if isinstance(piece, str)
+            else take(fetcher.query_sequence(piece[0], read_name), piece[1])
+            for piece in self.pieces
+        )
+
+
+class InsertSequenceFetcher(object):
+    """Fetch query sequences of alignments from an alignment file.
+
+    The latest sequence is kept as merged signals refer to the same alignment.
+    Integer read names are matched with the probed IDs of the work directory.
+    """
+
+    def __init__(self, path, probed: Optional[ProbedIds] = None):
+        self.path = path
+        self.probed = probed
+        self._samfile = None
+        self._latest: Tuple[Tuple[Locator, str], str] = (None, "")
+
+    def query_sequence(self, locator: Locator, read_name: Union[int, str]) -> str:
+        if self._latest[0] == (locator, read_name):
+            return self._latest[1]
+        if self._samfile is None:
+            self._samfile = open_alignment_file(self.path, signature_fields())
+        chrom, ref_start, flag = locator
+        # Integer read IDs, or 'query_name:RG' of work dirs from before them
+        integer_id = isinstance(read_name, int)
+        for aligned in self._samfile.fetch(chrom, ref_start, ref_start + 1):
+            if (
+                aligned.reference_start == ref_start
+                and aligned.flag == flag
+                and aligned.query_sequence is not None
+                and (
+                    get_read_id(aligned, self.probed)
+                    if integer_id
+                    else get_query_name(aligned)
+                )
+                == read_name
+            ):
+                self._latest = ((locator, read_name), aligned.query_sequence)
+                return self._latest[1]
+        logging.debug("Read %s not found at %s:%d.", read_name, chrom, ref_start)
+        raise LookupError(read_name)
+
+    def close(self):
+        if self._samfile is not None:
+            self._samfile.close()
+            self._samfile = None
+        self._latest = (None, "")
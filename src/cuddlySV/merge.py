@@ -0,0 +1,518 @@
+"""Merging signatures of work directories.
+
+The signatures of each type and chromosome (chromosome pair for TRA) are k-way merged
+from the sorted runs of the input work directories, dropping identical lines, or with
+unique_keys the lines with the positions of an earlier line like the sort --unique of
+the old somatic scripts (see signatures.UNIQUE_KEYS). The chromosomes are merged in
+parallel. Too many runs for the memory budget are merged in several passes through
+temporary files.
+
+The output is a sharded work directory (see signatures.py) with one shard per type and
+chromosome, optionally BGZF compressed, and optionally the read coordinates of one of
+the inputs, as a copy of its reads store if it has one. The read names and read groups
+of the inputs are merged to it too. It is written to a temporary directory which is
+renamed to the output when all merges succeed.
+
+The read names are merged first, giving reads of different inputs with the same hash
+distinct IDs (see read_names.resolve_read_ids). The signatures and read coordinates of
+each input are remapped to these IDs as they are merged.
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import traceback
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .Description import WorkDir, setupLogging
+from .read_names import (
+    PROBED_NAMES,
+    READ_GROUPS,
+    READ_NAMES,
+    ResolvedName,
+    load_probed,
+    merge_names,
+    merge_read_groups,
+    parse_read_id,
+    write_names,
+)
+from .reads_store import READS_STORE, remap_reads_store
+from .signatures import (
+    READ_ID_FIELD,
+    COMPRESSED_SUFFIX,
+    SHARD_INDEX,
+    SIGNATURE_TYPES,
+    SORT_KEYS,
+    UNIQUE_KEYS,
+    ChromKey,
+    ShardEntry,
+    merge_unique,
+    remap_read_ids,
+    shard_lines,
+    write_shard,
+    write_shard_index,
+)
+
+# Estimated memory of one open run: file buffers and the heap entry
+RUN_MEMORY = 1 << 16
+DEFAULT_MEMORY = "5G"
+
+# (svtype, chromosome key, output signatures/ dir, shard name, maximum runs per merge,
+# whether lines are deduplicated by UNIQUE_KEYS)
+MergeJob = Tuple[str, ChromKey, Path, str, int, bool]
+
+# Input work dirs, read names and read groups to keep, the integer IDs of the kept
+# reads and the new read IDs of each input, set in each merge process
+_inputs: List[WorkDir] = []
+_read_names: Optional[Set[str]] = None
+_read_groups: Optional[Set[str]] = None
+_kept_ids: Optional[Set[int]] = None
+_remaps: Optional[List[Dict[int, int]]] = None
+
+
+def init_merge(
+    inputs: List[WorkDir],
+    read_names: Optional[Set[str]],
+    read_groups: Optional[Set[str]],
+    kept_ids: Optional[Set[int]] = None,
+    remaps: Optional[List[Dict[int, int]]] = None,
+):
+    "Set the inputs of the merge process"
+    global _inputs, _read_names, _read_groups, _kept_ids, _remaps
+    _inputs = inputs
+    _read_names = read_names
+    _read_groups = read_groups
+    _kept_ids = kept_ids
+    _remaps = remaps
+
+
+def parse_memory(size: str) -> int:
+    "Parse memory size with optional K, M or G suffix (like sort -S) to bytes"
+    suffixes = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    size = size.strip().upper()
+    if size[-1:] in suffixes:
+        return int(float(size[:-1]) * suffixes[size[-1]])
+    return int(size)
+
+
+def name_kept(
+    query_name: str,
+    read_group: str,
+    read_names: Optional[Set[str]],
+    read_groups: Optional[Set[str]],
+) -> bool:
+    """Whether the read is kept.
+
+    The read name, with or without ':readgroup', must be in read_names and the read group
+    in read_groups. None keeps all.
+    """
+    if (
+        read_names is not None
+        and query_name not in read_names
+        and "%s:%s" % (query_name, read_group) not in read_names
+    ):
+        return False
+    return read_groups is None or read_group in read_groups
+
+
+def read_kept(
+    svtype: str,
+    line: str,
+    read_names: Optional[Set[str]],
+    read_groups: Optional[Set[str]],
+    kept_ids: Optional[Set[int]] = None,
+) -> bool:
+    """Whether the read of the signature line is kept.
+
+    Integer read IDs must be in kept_ids, 'name:readgroup' IDs are checked by name_kept.
+    """
+    read_id = parse_read_id(line.rstrip("\n").split("\t")[READ_ID_FIELD[svtype]])
+    if isinstance(read_id, int):
+        return kept_ids is None or read_id in kept_ids
+    name, _, read_group = read_id.partition(":")
+    return name_kept(name, read_group, read_names, read_groups)
+
+
+def signature_runs(
+    svtype: str,
+    key: ChromKey,
+    work_dirs: List[WorkDir],
+    remaps: Optional[List[Dict[int, int]]] = None,
+) -> List[Iterable[str]]:
+    """Return the sorted runs of signatures of key in the work dirs, one per byte range,
+    with the read IDs of remaps of each work dir"""
+    runs = list()
+    for i, work_dir in enumerate(work_dirs):
+        if key not in work_dir.idx.get(f"{svtype}.sigs", {}):
+            continue
+        remap = {} if remaps is None else remaps[i]
+        for name, start, end in work_dir.idx[f"{svtype}.sigs"][key]:
+            run = shard_lines(work_dir.shard_dir / name, start, end)
+            if len(remap) > 0:
+                run = remap_read_ids(svtype, run, remap)
+            runs.append(run)
+    return runs
+
+
+def write_run(path: Path, lines: Iterable[str]) -> int:
+    "Write lines to path and return the number of bytes written"
+    size = 0
+    with open(path, "wb") as f:
+        for line in lines:
+            data = line.encode()
+            f.write(data)
+            size += len(data)
+    return size
+
+
+def merge_chrom(job: MergeJob) -> Optional[ShardEntry]:
+    """Merge signatures of one type and chromosome to a shard.
+
+    Returns:
+        Optional[ShardEntry]: Range of the written shard, None if there were no
+            signatures.
+    """
+    svtype, key, signatures_path, shard_name, fan_in, unique_keys = job
+    sort_key = SORT_KEYS[svtype]
+    unique_key = UNIQUE_KEYS[svtype] if unique_keys else None
+    runs = signature_runs(svtype, key, _inputs, _remaps)
+    if _read_names is not None or _read_groups is not None:
+        runs = [
+            (
+                line
+                for line in run
+                if read_kept(svtype, line, _read_names, _read_groups, _kept_ids)
+            )
+            for run in runs
+        ]
+    with tempfile.TemporaryDirectory(dir=signatures_path) as tmp_dir:
+        n_pass = 0
+        while len(runs) > fan_in:
+            # Merge groups of runs to temporary files
+            n_pass += 1
+            merged_runs = list()
+            for i in range(0, len(runs), fan_in):
+                run_path = Path(tmp_dir) / ("pass%d_%d" % (n_pass, i))
+                size = write_run(
+                    run_path, merge_unique(runs[i : i + fan_in], sort_key, unique_key)
+                )
+                merged_runs.append(shard_lines(run_path, 0, size))
+            runs = merged_runs
+        entries = write_shard(
+            signatures_path / shard_name,
+            svtype,
+            merge_unique(runs, sort_key, unique_key),
+        )
+    if len(entries) == 0:
+        (signatures_path / shard_name).unlink()
+        return None
+    return entries[0]
+
+
+def merge_chrom_wrapper(job: MergeJob) -> Tuple[MergeJob, Optional[ShardEntry], str]:
+    "Run merge_chrom returning the formatted traceback instead of raising"
+    try:
+        return job, merge_chrom(job), ""
+    except Exception:
+        return job, None, traceback.format_exc()
+
+
+def remap_reads_lines(lines: Iterable[str], remap: Dict[int, int]) -> Iterable[str]:
+    "Replace the integer read IDs of reads lines found in remap"
+    for line in lines:
+        seq = line.rstrip("\n").split("\t")
+        if seq[4].isdigit() and int(seq[4]) in remap:
+            seq[4] = str(remap[int(seq[4])])
+            line = "\t".join(seq) + "\n"
+        yield line
+
+
+def copy_reads(
+    work_dir: WorkDir,
+    signatures_path: Path,
+    suffix: str = "",
+    remap: Optional[Dict[int, int]] = None,
+) -> List[ShardEntry]:
+    """Copy read coordinates of work_dir to the output with the read IDs of remap.
+
+    A reads store is copied as it is, text reads are written to a shard of the output.
+    """
+    remap = {} if remap is None else remap
+    if work_dir.reads_stored:
+        reads_path = signatures_path.parent / READS_STORE
+        shutil.copyfile(work_dir.path / READS_STORE, reads_path)
+        remap_reads_store(reads_path, remap)
+        return []
+    return write_shard(
+        signatures_path / ("_merged.reads" + suffix),
+        "reads",
+        remap_reads_lines(work_dir.all_reads(), remap),
+    )
+
+
+def merge_work_dirs(
+    output: Path,
+    work_dirs: List[Path],
+    reads_from: Optional[Path] = None,
+    read_names: Optional[Set[str]] = None,
+    read_groups: Optional[Set[str]] = None,
+    threads: int = 1,
+    memory: int = parse_memory(DEFAULT_MEMORY),
+    allow_empty: bool = True,
+    compress: bool = False,
+    unique_keys: bool = False,
+) -> List[ShardEntry]:
+    """Merge signatures of work directories to a new sharded work directory.
+
+    Args:
+        output (Path): Output work directory. Must not exist.
+        work_dirs (List[Path]): Input work directories, sharded or with TYPE.sigs files.
+        reads_from (Optional[Path]): Work directory to take the read coordinates from.
+        read_names (Optional[Set[str]]): Keep only signatures of these reads.
+        read_groups (Optional[Set[str]]): Keep only signatures of these read groups.
+        threads (int): Number of parallel merges.
+        memory (int): Memory budget in bytes for the open runs of all merges.
+        allow_empty (bool): Whether a signature type may have no signatures.
+        compress (bool): Write BGZF compressed shards.
+        unique_keys (bool): Drop lines with the positions of an earlier line instead of
+            identical lines, see signatures.UNIQUE_KEYS.
+
+    Raises:
+        FileExistsError: If output exists.
+        RuntimeError: If any of the merges failed or a type has no signatures.
+
+    Returns:
+        List[ShardEntry]: Ranges of the output shards.
+    """
+    output = Path(output).absolute()
+    if output.exists():
+        raise FileExistsError("[Errno 17] File exists: '%s'" % output)
+    inputs = [WorkDir(str(i)) for i in work_dirs]
+    for work_dir in inputs:
+        # Index once here instead of in every merge
+        logging.info("Indexing %s", str(work_dir.path))
+        work_dir.idx
+    fan_in = max(memory // (max(threads, 1) * RUN_MEMORY), 2)
+    suffix = COMPRESSED_SUFFIX if compress else ""
+    # The reads of the copied coordinates need IDs distinct from those of the inputs
+    # too, so their names are merged even if they are not an input
+    reads_dir = None
+    if reads_from is not None:
+        reads_dir = next(
+            (i for i in inputs if i.path.resolve() == Path(reads_from).resolve()),
+            None,
+        )
+        if reads_dir is None:
+            reads_dir = WorkDir(str(reads_from))
+    sources = list(inputs)
+    if reads_dir is not None and reads_dir not in inputs:
+        sources.append(reads_dir)
+    named = [i for i in sources if (i.path / READ_NAMES).exists()]
+    filtered = read_names is not None or read_groups is not None
+    kept_ids: Set[int] = set()
+
+    def keep(name: ResolvedName) -> bool:
+        # Names of the copied reads are kept for the later merges of the output
+        if name_kept(name[1], name[2], read_names, read_groups):
+            kept_ids.add(name[0])
+            return True
+        return any(named[source] is reads_dir for source, _ in name[3])
+
+    tmp_output = Path(tempfile.mkdtemp(prefix=output.name + ".", dir=output.parent))
+    try:
+        merged = merge_names(
+            tmp_output / READ_NAMES,
+            [
+                (i.path / READ_NAMES, load_probed(i.path / PROBED_NAMES))
+                for i in named
+            ],
+            keep=keep if filtered else None,
+        )
+        write_names(
+            tmp_output / PROBED_NAMES,
+            {rid: name for name, rid in merged.probed.items()},
+        )
+        remaps = [dict() for _ in inputs]
+        for work_dir, remap in zip(named, merged.remaps):
+            if work_dir in inputs:
+                remaps[inputs.index(work_dir)] = remap
+        if filtered:
+            logging.info(
+                "Keeping signatures of %d reads with integer IDs.", len(kept_ids)
+            )
+        signatures_path = tmp_output / "signatures"
+        signatures_path.mkdir()
+        jobs: List[MergeJob] = list()
+        for svtype in SIGNATURE_TYPES:
+            keys = dict.fromkeys(
+                k for wd in inputs for k in wd.idx.get(f"{svtype}.sigs", {})
+            )
+            for key in sorted(keys):
+                shard_name = "_merged_%d.%s.sigs%s" % (len(jobs), svtype, suffix)
+                jobs.append(
+                    (svtype, key, signatures_path, shard_name, fan_in, unique_keys)
+                )
+        logging.info(
+            "Merging %d chromosomes with up to %d runs per merge.", len(jobs), fan_in
+        )
+
+        entries = list()
+        failures = list()
+        with Pool(
+            processes=max(threads, 1),
+            initializer=init_merge,
+            initargs=(
+                inputs,
+                read_names,
+                read_groups,
+                kept_ids if filtered else None,
+                remaps,
+            ),
+        ) as pool:
+            for job, entry, error in pool.imap_unordered(merge_chrom_wrapper, jobs):
+                if error != "":
+                    logging.error("Failed merging %s of %s:\n%s", job[0], job[1], error)
+                    failures.append(job)
+                elif entry is not None:
+                    entries.append(entry)
+        if len(failures) > 0:
+            raise RuntimeError(
+                "Failed merging %d of %d chromosomes." % (len(failures), len(jobs))
+            )
+        merged_types = set(entry[0] for entry in entries)
+        for svtype in SIGNATURE_TYPES:
+            if svtype not in merged_types:
+                if not allow_empty:
+                    raise RuntimeError("No %s signatures to merge." % svtype)
+                logging.warning("No %s signatures to merge.", svtype)
+
+        if reads_dir is not None:
+            reads_remap = dict()
+            if reads_dir in named:
+                reads_remap = merged.remaps[named.index(reads_dir)]
+            entries += copy_reads(reads_dir, signatures_path, suffix, reads_remap)
+        merge_read_groups(
+            tmp_output / READ_GROUPS, [i.path / READ_GROUPS for i in inputs], read_groups
+        )
+        write_shard_index(tmp_output / SHARD_INDEX, entries)
+        tmp_output.rename(output)
+    except BaseException:
+        shutil.rmtree(tmp_output, ignore_errors=True)
+        raise
+    logging.info("Merged %d work directories to %s", len(inputs), str(output))
+    return entries
+
+
+def read_name_list(path: str) -> Set[str]:
+    "Read names or read groups, one per line or comma separated"
+    names = set()
+    with open(path, "rt") as f:
+        for line in f:
+            names.update(i for i in line.strip().split(",") if i != "")
+    return names
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="cuddlySV-merge",
+        description="Merge signatures of cuddlySV work directories to a new one.",
+    )
+    parser.add_argument("work_dirs", nargs="+", help="Input work directories.")
+    parser.add_argument(
+        "-o", "--output", required=True, help="Output work directory. Must not exist."
+    )
+    parser.add_argument(
+        "-r",
+        "--reads_from",
+        help="Work directory to take the read coordinates from. [%(default)s]",
+        default=None,
+    )
+    parser.add_argument(
+        "-n",
+        "--read_names",
+        help="File of read names. Keep only signatures of these reads. [%(default)s]",
+        default=None,
+    )
+    parser.add_argument(
+        "-g",
+        "--read_groups",
+        help="File of read groups. Keep only signatures of these read groups. "
+        "[%(default)s]",
+        default=None,
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        help="Number of parallel merges. [%(default)s]",
+        default=5,
+        type=int,
+    )
+    parser.add_argument(
+        "-m",
+        "--memory",
+        help="Memory budget for merging, with K, M or G suffix. [%(default)s]",
+        default=DEFAULT_MEMORY,
+    )
+    parser.add_argument(
+        "-z",
+        "--compress",
+        help="Write BGZF compressed signatures.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--unique_keys",
+        help="Keep only the first signature of each type, chromosome and position, "
+        "like sort --unique with the sort keys of the signatures. By default only "
+        "identical signature lines are removed.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--allow_empty",
+        help="Allow signature types without any signatures.",
+        action="store_true",
+    )
+    parser.add_argument("--verbose", help="Verbose logging.", action="store_true")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parse_args(argv)
+    setupLogging(args.verbose)
+    read_names = None
+    if args.read_names is not None:
+        read_names = read_name_list(args.read_names)
+        if len(read_names) == 0:
+            logging.error("No read names in %s!", args.read_names)
+            return 1
+    read_groups = None
+    if args.read_groups is not None:
+        read_groups = read_name_list(args.read_groups)
+        if len(read_groups) == 0:
+            logging.error("No read groups in %s!", args.read_groups)
+            return 1
+    try:
+        merge_work_dirs(
+            Path(args.output),
+            [Path(i) for i in args.work_dirs],
+            reads_from=args.reads_from,
+            read_names=read_names,
+            read_groups=read_groups,
+            threads=args.threads,
+            memory=parse_memory(args.memory),
+            allow_empty=args.allow_empty,
+            compress=args.compress,
+            unique_keys=args.unique_keys,
+        )
+    except (OSError, RuntimeError) as exc:
+        logging.error("%s", exc)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,93 @@
+"""Counters and timers of signature collection.
+
+Each task counts the alignments it fetched and skipped by reason, the signatures it
+emitted by type and the seconds spent fetching and decoding alignments, parsing them for
+signatures and writing its outputs. The peak resident set size of its worker process is
+taken at the end of the task. The metrics are kept in the task record (see
+checkpoint.py) and summarized over all tasks to extraction_metrics.json of the work
+directory at the end of signature collection.
+"""
+import json
+import resource
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+METRICS_FILE = "extraction_metrics.json"
+# Reasons of skipping a fetched alignment, in the order they are checked
+SKIP_REASONS = (
+    "secondary",
+    "before_task",
+    "outside_bed",
+    "min_read_len",
+    "no_signal",
+    "chimera_1d2",
+)
+TIMERS = ("fetch", "parse", "write")
+# Number of the slowest tasks listed in the summary
+SLOWEST_TASKS = 10
+
+TaskMetrics = Dict[str, Any]
+
+
+def task_metrics(task) -> TaskMetrics:
+    "Return zeroed metrics of task [chrom, start, end]"
+    reads = {"fetched": 0}
+    reads.update((reason, 0) for reason in SKIP_REASONS)
+    reads.update(low_mapq=0, with_signatures=0)
+    return {
+        "region": "%s:%d-%d" % (task[0], task[1], task[2]),
+        "reads": reads,
+        "signatures": dict(),
+        "seconds": dict.fromkeys(TIMERS, 0.0),
+        "peak_rss_kb": 0,
+    }
+
+
+def peak_rss_kb(who: int = resource.RUSAGE_SELF) -> int:
+    "Peak resident set size of this process, or its waited for children, in kB"
+    rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def summarize_metrics(tasks: List[TaskMetrics]) -> Dict[str, Any]:
+    "Sum the counters and timers of the tasks and take the maximum of their peak RSS"
+    reads: Dict[str, int] = dict()
+    signatures: Dict[str, int] = dict()
+    seconds = dict.fromkeys(TIMERS, 0.0)
+    for metrics in tasks:
+        for name, count in metrics["reads"].items():
+            reads[name] = reads.get(name, 0) + count
+        for svtype, count in metrics["signatures"].items():
+            signatures[svtype] = signatures.get(svtype, 0) + count
+        for name, value in metrics["seconds"].items():
+            seconds[name] += value
+    slowest = sorted(tasks, key=lambda x: sum(x["seconds"].values()), reverse=True)
+    return {
+        "tasks": len(tasks),
+        "reads": reads,
+        "signatures": signatures,
+        "seconds": seconds,
+        "peak_rss_kb": {
+            "task": max((i["peak_rss_kb"] for i in tasks), default=0),
+            "main": peak_rss_kb(resource.RUSAGE_SELF),
+            "children": peak_rss_kb(resource.RUSAGE_CHILDREN),
+        },
+        "slowest_tasks": [
+            {"region": i["region"], "seconds": sum(i["seconds"].values())}
+            for i in slowest[:SLOWEST_TASKS]
+        ],
+    }
+
+
+def write_metrics(path: Path, tasks: List[TaskMetrics]) -> Dict[str, Any]:
+    """Write the summary and the metrics of each task as JSON.
+
+    Returns:
+        Dict[str, Any]: The summary.
+    """
+    summary = summarize_metrics(tasks)
+    with open(path, "wt") as f:
+        json.dump({"summary": summary, "tasks": tasks}, f, indent=1)
+    return summary
@@ -0,0 +1,287 @@
+"""Partitioning of the genome into signature collection tasks.
+
+The amount of alignment data along each contig is estimated from the alignment index:
+the linear index of BAI gives the file offset of the first alignment of every 16 kb
+window and CRAI gives the size and span of every slice. Contigs are cut into tasks of
+roughly equal amount of data, so that deep or repetitive regions get shorter tasks. If
+the index can not be read, or --batches is shorter than a 16 kb window, contigs are cut
+into windows of fixed length.
+"""
+import gzip
+import logging
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Window size of BAI linear index
+LINEAR_WINDOW = 1 << 14
+BAI_PSEUDO_BIN = 37450
+# Tasks per thread to balance the work
+TASKS_PER_THREAD = 4
+# Shortest task length unless --batches is shorter. Reads overlapping the start of a
+# task are fetched, and discarded, by the task too.
+MIN_TASK_LENGTH = 1000000
+# Tasks below this fraction of the target cost are batched together
+SMALL_TASK_FRACTION = 0.5
+
+
+def find_index(alignment_path: str) -> Optional[str]:
+    "Return path of the BAI or CRAI index of the alignment file, if any"
+    stem, _ext = os.path.splitext(alignment_path)
+    for candidate in (
+        alignment_path + ".bai",
+        stem + ".bai",
+        alignment_path + ".crai",
+        stem + ".crai",
+    ):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def read_bai_window_bytes(index_path: str, contigs: List[str]) -> Dict[str, np.ndarray]:
+    """Estimate compressed bytes of alignments starting in each 16 kb window from BAI.
+
+    Args:
+        index_path (str): Path to .bai file.
+        contigs (List[str]): Reference names in the order of the alignment file header.
+
+    Returns:
+        Dict[str, np.ndarray]: Bytes per window for each contig with alignments.
+    """
+    with open(index_path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"BAI\x01":
+        raise ValueError("Not a BAI index: %s" % index_path)
+    (n_ref,) = struct.unpack_from("<i", data, 4)
+    offset = 8
+    window_bytes = dict()
+    for ref_idx in range(n_ref):
+        (n_bin,) = struct.unpack_from("<i", data, offset)
+        offset += 4
+        ref_end = 0
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from("<Ii", data, offset)
+            offset += 8
+            if bin_id == BAI_PSEUDO_BIN:
+                # (ref_beg, ref_end) virtual offsets and mapped/unmapped read counts
+                ref_end = struct.unpack_from("<Q", data, offset + 8)[0]
+            offset += 16 * n_chunk
+        (n_intv,) = struct.unpack_from("<i", data, offset)
+        offset += 4
+        ioffsets = np.frombuffer(data, dtype="<u8", count=n_intv, offset=offset)
+        offset += 8 * n_intv
+        if n_intv == 0 or ref_end == 0:
+            continue
+        # Compressed file offsets. Empty windows have no offset.
+        coffsets = np.maximum.accumulate((ioffsets >> np.uint64(16)).astype(np.int64))
+        coffsets = np.append(coffsets, ref_end >> 16)
+        window_bytes[contigs[ref_idx]] = np.maximum(np.diff(coffsets), 0)
+    return window_bytes
+
+
+def read_crai_window_bytes(index_path: str, contigs: List[str]) -> Dict[str, np.ndarray]:
+    """Estimate bytes of alignments in each 16 kb window from CRAI.
+
+    Slice sizes are spread evenly over the windows the slice spans. Slices with several
+    references are shared in proportion to the spans.
+    """
+    entries = []
+    with gzip.open(index_path, "rt") as f:
+        for line in f:
+            seq = line.split("\t")
+            if len(seq) < 6 or int(seq[0]) < 0:
+                continue
+            slice_key = (seq[3], seq[4])
+            entries.append(
+                (int(seq[0]), int(seq[1]) - 1, int(seq[2]), slice_key, int(seq[5]))
+            )
+    slice_span = dict()
+    for ref_idx, start, span, slice_key, size in entries:
+        slice_span[slice_key] = slice_span.get(slice_key, 0) + max(span, 1)
+
+    window_bytes = dict()
+    for ref_idx, start, span, slice_key, size in entries:
+        chrom = contigs[ref_idx]
+        first = max(start, 0) // LINEAR_WINDOW
+        last = max(start + span - 1, 0) // LINEAR_WINDOW
+        if chrom not in window_bytes or len(window_bytes[chrom]) <= last:
+            grown = np.zeros(last + 1, dtype=np.float64)
+            if chrom in window_bytes:
+                grown[: len(window_bytes[chrom])] = window_bytes[chrom]
+            window_bytes[chrom] = grown
+        share = size * max(span, 1) / slice_span[slice_key]
+        window_bytes[chrom][first : last + 1] += share / (last - first + 1)
+    return window_bytes
+
+
+def read_window_bytes(
+    alignment_path: str, contigs: List[str]
+) -> Optional[Dict[str, np.ndarray]]:
+    "Return bytes per 16 kb window for each contig, or None if no usable index was found"
+    index_path = find_index(alignment_path)
+    if index_path is None:
+        return None
+    try:
+        if index_path.endswith(".crai"):
+            return read_crai_window_bytes(index_path, contigs)
+        return read_bai_window_bytes(index_path, contigs)
+    except (OSError, ValueError, struct.error, IndexError) as exc:
+        logging.warning("Could not read alignment density from %s: %s", index_path, exc)
+        return None
+
+
+def split_contig(
+    contig_len: int,
+    window_bytes: np.ndarray,
+    target_bytes: float,
+    min_len: int,
+    max_len: int,
+) -> List[Tuple[int, int, float]]:
+    """Cut a contig into intervals of about target_bytes of alignment data.
+
+    Interval lengths are between min_len and max_len (except the last one) and
+    rounded to the 16 kb windows of the index.
+
+    Returns:
+        List[Tuple[int, int, float]]: Start, end and estimated bytes of the intervals.
+    """
+    n_windows = (contig_len + LINEAR_WINDOW - 1) // LINEAR_WINDOW
+    cum_bytes = np.zeros(n_windows + 1)
+    n_known = min(len(window_bytes), n_windows)
+    cum_bytes[1 : n_known + 1] = np.cumsum(window_bytes[:n_known])
+    cum_bytes[n_known + 1 :] = cum_bytes[n_known]
+    if len(window_bytes) > n_windows:
+        cum_bytes[-1] += window_bytes[n_windows:].sum()
+
+    min_windows = max(min_len // LINEAR_WINDOW, 1)
+    max_windows = max(max_len // LINEAR_WINDOW, 1)
+    intervals = []
+    first = 0
+    while first < n_windows:
+        last = (
+            int(np.searchsorted(cum_bytes, cum_bytes[first] + target_bytes, "right"))
+            - 1
+        )
+        last = min(max(last, first + min_windows), first + max_windows, n_windows)
+        if n_windows - last < min_windows and n_windows - first <= max_windows:
+            # Avoid a short remainder
+            last = n_windows
+        start = first * LINEAR_WINDOW
+        end = min(last * LINEAR_WINDOW, contig_len) if last < n_windows else contig_len
+        intervals.append((start, end, float(cum_bytes[last] - cum_bytes[first])))
+        first = last
+    return intervals
+
+
+def coalesce_tasks(
+    tasks: List[Tuple[List, float]], target_cost: float
+) -> List[Tuple[List[List], float]]:
+    """Batch small tasks together up to target_cost.
+
+    Each batch is processed by a single worker call, so that the overhead of opening
+    the alignment file is paid once for many small contigs.
+
+    Args:
+        tasks (List[Tuple[List, float]]): Tasks [chrom, start, end] with their costs.
+        target_cost (float): Cost of a batch of small tasks. Tasks of at least
+            SMALL_TASK_FRACTION of it are not batched.
+
+    Returns:
+        List[Tuple[List[List], float]]: Batches of tasks with their total costs,
+            largest cost first.
+    """
+    batches = list()
+    small_tasks = list()
+    small_cost = 0.0
+    for task, cost in sorted(tasks, key=lambda x: -x[1]):
+        if cost >= target_cost * SMALL_TASK_FRACTION:
+            batches.append(([task], cost))
+            continue
+        small_tasks.append(task)
+        small_cost += cost
+        if small_cost >= target_cost:
+            batches.append((small_tasks, small_cost))
+            small_tasks = list()
+            small_cost = 0.0
+    if len(small_tasks) > 0:
+        batches.append((small_tasks, small_cost))
+    batches.sort(key=lambda x: -x[1])
+    return batches
+
+
+def partition_tasks(
+    alignment_path: str,
+    references: List[str],
+    contig_lengths: List[Tuple[str, int]],
+    batches: int,
+    threads: int,
+) -> List[Tuple[List[List], float]]:
+    """Cut contigs into signature collection tasks of roughly equal work.
+
+    Tasks are at most batches long. Tasks of small contigs are batched together. Contigs without alignments in the index are skipped.
+    Without a readable index, or with batches shorter than the 16 kb windows of the
+    index, the contigs are cut into windows of batches and the cost is the window
+    length.
+
+    Args:
+        alignment_path (str): Path to indexed BAM/CRAM file.
+        references (List[str]): All reference names in the alignment file header.
+        contig_lengths (List[Tuple[str, int]]): Names and lengths of contigs.
+        batches (int): Maximum length of a task.
+        threads (int): Number of parallel workers.
+
+    Returns:
+        List[Tuple[List[List], float]]: Batches of tasks [chrom, start, end] with their
+            estimated costs, largest cost first.
+    """
+    if batches < LINEAR_WINDOW:
+        logging.info(
+            "Not using the index: --batches is shorter than its %d bp windows.",
+            LINEAR_WINDOW,
+        )
+        window_bytes = None
+    else:
+        window_bytes = read_window_bytes(alignment_path, references)
+    tasks = list()
+    if window_bytes is None:
+        logging.info("Splitting contigs to fixed windows of %d bp.", batches)
+        target_cost = float(batches)
+        for chr_name, local_ref_len in contig_lengths:
+            for start in range(0, local_ref_len, batches):
+                end = min(start + batches, local_ref_len)
+                tasks.append(([chr_name, start, end], float(end - start)))
+    else:
+        total_bytes = sum(float(i.sum()) for i in window_bytes.values())
+        genome_len = sum(i[1] for i in contig_lengths)
+        # Average data of a window of maximum length, with enough tasks for all threads
+        target_bytes = max(
+            min(
+                total_bytes * batches / max(genome_len, 1),
+                total_bytes / max(threads * TASKS_PER_THREAD, 1),
+            ),
+            1.0,
+        )
+        min_len = min(MIN_TASK_LENGTH, batches)
+        for chr_name, local_ref_len in contig_lengths:
+            if chr_name not in window_bytes:
+                # No alignments
+                continue
+            chrom_bytes = window_bytes[chr_name]
+            for start, end, cost in split_contig(
+                local_ref_len, chrom_bytes, target_bytes, min_len, batches
+            ):
+                tasks.append(([chr_name, start, end], cost))
+        logging.info(
+            "Split %d contigs to %d tasks of about %.0f kB of alignments.",
+            len(contig_lengths),
+            len(tasks),
+            target_bytes / 1024,
+        )
+        target_cost = target_bytes
+    task_batches = coalesce_tasks(tasks, target_cost)
+    if len(task_batches) < len(tasks):
+        logging.info("Batched %d tasks to %d.", len(tasks), len(task_batches))
+    return task_batches
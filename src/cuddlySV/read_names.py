@@ -0,0 +1,350 @@
+"""Integer read IDs and the read name dictionary of the work directory.
+
+Signatures and read coordinates identify reads by a 63 bit hash of 'query_name:RG', so
+that the signature collection tasks and separate work directories give the same read
+the same ID without coordination. The names of the reads with signatures or stored
+coordinates are kept in read_names.tsv (id, query name, read group) sorted by ID, and
+the samples of the read groups in read_groups.tsv. The names are looked up only when
+RNAMES are written.
+
+Reads with the same hash are given distinct IDs when the names are merged (see
+resolve_read_ids): in the order of hash and name, each read gets its hash or the ID
+after the previous read if that is larger, i.e. linear probing. The outputs of the
+tasks, or input work directories, are then remapped to these IDs. The reads whose ID
+is not their hash are listed in probed_read_names.tsv, in the format of
+read_names.tsv. Reads of one task with the same hash are told apart by running the task
+again with probed IDs (see ReadIdCollision).
+
+Work directories from before the dictionary carry the 'query_name:RG' strings as IDs.
+They are passed through as they are.
+"""
+import hashlib
+import heapq
+import logging
+from pathlib import Path
+from collections import namedtuple
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+READ_NAMES = "read_names.tsv"
+READ_GROUPS = "read_groups.tsv"
+PROBED_NAMES = "probed_read_names.tsv"
+NAMES_SUFFIX = ".names"
+# Read names buffered by a task before spilling them to sorted runs
+SPILL_NAMES = 1 << 18
+MAX_READ_ID = (1 << 63) - 1
+
+ReadId = Union[int, str]
+# (read ID, query name, read group)
+ReadName = Tuple[int, str, str]
+# IDs of the reads, by (query name, read group), that are not their hash
+ProbedIds = Dict[Tuple[str, str], int]
+# Final ID, query name, read group and the (source, ID in source) of a merged read
+ResolvedName = Tuple[int, str, str, List[Tuple[int, int]]]
+# Number of names written, remap of the IDs of each source and the probed IDs
+MergedNames = namedtuple("MergedNames", ("count", "remaps", "probed"))
+
+
+def read_id(query_name: str, read_group: str) -> int:
+    "Return the integer ID of a read, equal in all work directories"
+    digest = hashlib.blake2b(
+        ("%s:%s" % (query_name, read_group)).encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+
+def probed_read_id(query_name: str, read_group: str, probed: ProbedIds) -> int:
+    "Return the ID of a read, its hash unless it is probed"
+    rid = probed.get((query_name, read_group))
+    return read_id(query_name, read_group) if rid is None else rid
+
+
+def parse_read_id(field: str) -> ReadId:
+    "Parse read ID field of a signature or reads line, keeping 'name:RG' strings"
+    return int(field) if field.isdigit() else field
+
+
+def write_names(path: Path, names: Dict[int, Tuple[str, str]]):
+    "Write read names of a task sorted by ID"
+    with open(path, "wt") as f:
+        for rid in sorted(names):
+            f.write("%d\t%s\t%s\n" % ((rid,) + names[rid]))
+
+
+class ReadIdCollision(Exception):
+    """Reads of a task with the same ID.
+
+    Their signatures can not be told apart, so the task is run again with the IDs of
+    probe_collisions for them.
+    """
+
+    def __init__(self, names: List[ReadName]):
+        super().__init__(
+            "Reads with the same ID: %s"
+            % ", ".join("%s:%s (%d)" % (i[1], i[2], i[0]) for i in names)
+        )
+        self.names = names
+
+
+def probe_collisions(names: List[ReadName]) -> ProbedIds:
+    """Return IDs for reads with the same ID, the first by name keeping it and the
+    others taking the following IDs"""
+    probed = dict()
+    by_id: Dict[int, Set[Tuple[str, str]]] = dict()
+    for rid, query_name, read_group in names:
+        by_id.setdefault(rid, set()).add((query_name, read_group))
+    for rid, keys in by_id.items():
+        for i, key in enumerate(sorted(keys)):
+            probed[key] = (rid + i) & MAX_READ_ID
+    return probed
+
+
+class NamesWriter:
+    """Read names of a task written while its signatures are collected.
+
+    The names are buffered in a dictionary. Every spill_names names they are written
+    to a run {path}.run{n} sorted by ID, and the runs are merged to path when the
+    writer is closed. The IDs of the reads are their hashes, or the ones in probed.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        spill_names: int = SPILL_NAMES,
+        probed: Optional[ProbedIds] = None,
+    ):
+        self.path = path
+        self.spill_names = spill_names
+        self.probed: ProbedIds = dict() if probed is None else probed
+        self.names: Dict[int, Tuple[str, str]] = dict()
+        self.runs: List[Path] = list()
+        self.collisions: List[ReadName] = list()
+
+    def read_id(self, query_name: str, read_group: str) -> int:
+        return probed_read_id(query_name, read_group, self.probed)
+
+    def add(self, rid: int, query_name: str, read_group: str):
+        name = (query_name, read_group)
+        prev = self.names.setdefault(rid, name)
+        if prev != name:
+            self.collisions += [(rid,) + prev, (rid,) + name]
+        if len(self.names) >= self.spill_names:
+            self.spill()
+
+    def spill(self):
+        run_path = self.path.with_name("%s.run%d" % (self.path.name, len(self.runs)))
+        write_names(run_path, self.names)
+        self.runs.append(run_path)
+        self.names = dict()
+
+    def close(self):
+        """Write the read names and remove the runs.
+
+        Raises:
+            ReadIdCollision: If reads of the task have the same ID.
+        """
+        if len(self.runs) == 0:
+            write_names(self.path, self.names)
+        else:
+            if len(self.names) > 0:
+                self.spill()
+            with open(self.path, "wt") as f:
+                for group in id_groups(
+                    unique_names(iter_names(i) for i in self.runs)
+                ):
+                    if len(group) > 1:
+                        self.collisions += group
+                    f.write("%d\t%s\t%s\n" % group[0])
+            for run_path in self.runs:
+                run_path.unlink()
+            self.runs = list()
+        self.names = dict()
+        if len(self.collisions) > 0:
+            raise ReadIdCollision(sorted(set(self.collisions)))
+
+
+def iter_names(path: Path) -> Iterator[ReadName]:
+    "Generate the (id, query name, read group) of a read name file"
+    with open(path, "rt") as f:
+        for line in f:
+            rid, query_name, read_group = line.rstrip("\n").split("\t")
+            yield int(rid), query_name, read_group
+
+
+def unique_names(runs: Iterable[Iterable[ReadName]]) -> Iterator[ReadName]:
+    "Merge runs of names sorted by ID, dropping duplicates"
+    prev = None
+    for name in heapq.merge(*runs):
+        if name != prev:
+            yield name
+            prev = name
+
+
+def id_groups(names: Iterable[ReadName]) -> Iterator[List[ReadName]]:
+    "Group unique names sorted by ID by their ID"
+    group: List[ReadName] = list()
+    for name in names:
+        if len(group) > 0 and group[0][0] != name[0]:
+            yield group
+            group = list()
+        group.append(name)
+    if len(group) > 0:
+        yield group
+
+
+def load_probed(path: Path) -> ProbedIds:
+    "Read probed IDs from a read name file, none if it does not exist"
+    if not path.exists():
+        return dict()
+    return {(name, rg): rid for rid, name, rg in iter_names(path)}
+
+
+def hashed_names(
+    path: Path, source: int, probed_ids: Set[int]
+) -> Iterator[Tuple[int, str, str, int, int]]:
+    "Generate the (hash, query name, read group, source, ID) of the unprobed names"
+    for rid, query_name, read_group in iter_names(path):
+        if rid not in probed_ids:
+            yield rid, query_name, read_group, source, rid
+
+
+def resolve_read_ids(
+    sources: List[Tuple[Path, ProbedIds]]
+) -> Iterator[ResolvedName]:
+    """Give distinct IDs to the reads of read name files.
+
+    The reads are taken in the order of their hash, query name and read group. Each
+    gets its hash, or the ID after the previous read if that is larger. The IDs then
+    differ from the hashes only after a collision, and are sorted like the reads.
+
+    Args:
+        sources (List[Tuple[Path, ProbedIds]]): Read name files sorted by ID, each with
+            one ID per read, and the reads of each whose ID is not their hash.
+
+    Raises:
+        OverflowError: If probing runs past the largest ID.
+
+    Yields:
+        Iterator[ResolvedName]: The reads in the order of their IDs.
+    """
+    runs = list()
+    probed_names = list()
+    for source, (path, probed) in enumerate(sources):
+        probed_ids = set(probed.values())
+        for (query_name, read_group), rid in probed.items():
+            hashed = read_id(query_name, read_group)
+            probed_names.append((hashed, query_name, read_group, source, rid))
+        runs.append(hashed_names(path, source, probed_ids))
+    runs.append(sorted(probed_names))
+    resolved: Optional[ResolvedName] = None
+    for hashed, query_name, read_group, source, rid in heapq.merge(*runs):
+        if resolved is not None and resolved[1:3] == (query_name, read_group):
+            resolved[3].append((source, rid))
+            continue
+        prev_id = -1
+        if resolved is not None:
+            yield resolved
+            prev_id = resolved[0]
+        final = max(hashed, prev_id + 1)
+        if final > MAX_READ_ID:
+            raise OverflowError("No read ID left for %s:%s." % (query_name, read_group))
+        resolved = (final, query_name, read_group, [(source, rid)])
+    if resolved is not None:
+        yield resolved
+
+
+def merge_names(
+    output: Path,
+    sources: List[Tuple[Path, ProbedIds]],
+    keep: Optional[Callable[[ResolvedName], bool]] = None,
+) -> MergedNames:
+    """Merge read name files to output with distinct IDs, see resolve_read_ids.
+
+    Args:
+        output (Path): Merged read name file.
+        sources (List[Tuple[Path, ProbedIds]]): Read name files sorted by ID and their
+            probed IDs.
+        keep (Optional[Callable[[ResolvedName], bool]]): Write only these reads. None
+            writes all.
+
+    Returns:
+        MergedNames: Number of read names written, the new IDs of the reads of each
+            source by their ID in it where they differ, and the written reads whose
+            ID is not their hash.
+    """
+    n_names = 0
+    remaps: List[Dict[int, int]] = [dict() for _ in sources]
+    probed: ProbedIds = dict()
+    tmp_output = output.with_name(output.name + ".tmp")
+    with open(tmp_output, "wt") as f:
+        for name in resolve_read_ids(sources):
+            final, query_name, read_group, source_ids = name
+            for source, rid in source_ids:
+                if rid != final:
+                    remaps[source][rid] = final
+            if keep is None or keep(name):
+                f.write("%d\t%s\t%s\n" % (final, query_name, read_group))
+                n_names += 1
+                if final != read_id(query_name, read_group):
+                    probed[(query_name, read_group)] = final
+    tmp_output.replace(output)
+    if len(probed) > 0:
+        logging.info("Gave %d reads probed IDs for hash collisions.", len(probed))
+    return MergedNames(n_names, remaps, probed)
+
+
+def lookup_names(path: Path, ids: Set[int]) -> Dict[int, str]:
+    "Return 'query_name:RG' of the IDs from read name file path"
+    names = dict()
+    if len(ids) > 0 and path.exists():
+        for rid, query_name, read_group in iter_names(path):
+            if rid in ids:
+                names[rid] = "%s:%s" % (query_name, read_group)
+    return names
+
+
+def rnames_ids(rnames: str) -> Set[int]:
+    "Return the integer read IDs of a comma separated RNAMES string"
+    return set(int(i) for i in rnames.split(",") if i.isdigit())
+
+
+def resolve_rnames(rnames: str, names: Dict[int, str]) -> str:
+    "Replace integer read IDs in comma separated RNAMES with 'query_name:RG'"
+    return ",".join(
+        names.get(int(i), i) if i.isdigit() else i for i in rnames.split(",")
+    )
+
+
+def write_read_groups(path: Path, read_groups: List[Dict[str, str]]):
+    "Write the read groups of the alignment header with their samples"
+    with open(path, "wt") as f:
+        for rg in read_groups:
+            f.write("%s\t%s\n" % (rg["ID"], rg.get("SM", "")))
+
+
+def merge_read_groups(
+    output: Path, inputs: Iterable[Path], keep: Optional[Set[str]] = None
+):
+    "Write the union of read group files, only the read groups in keep if given"
+    read_groups: Dict[str, str] = dict()
+    for path in inputs:
+        if not path.exists():
+            logging.warning("No read groups in %s", str(path.parent))
+            continue
+        with open(path, "rt") as f:
+            for line in f:
+                rg, sample = line.rstrip("\n").split("\t")
+                if keep is None or rg in keep:
+                    read_groups.setdefault(rg, sample)
+    with open(output, "wt") as f:
+        for rg, sample in read_groups.items():
+            f.write("%s\t%s\n" % (rg, sample))
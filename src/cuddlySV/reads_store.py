@@ -0,0 +1,255 @@
+"""Binary read coordinate store of the work directory.
+
+The start, end, primary flag and integer read ID of the alignments are stored in
+reads.bin by chromosome. The file starts with the magic bytes, the length of the header
+as uint64 and the header, one line per chromosome: chrom, number of reads and the offset
+of its block from the end of the header. Each block has the columns read ID (int64),
+start and end (int32) and primary (uint8), and is padded to 8 bytes. Loading the reads
+of a chromosome is then one seek and one memory-map.
+
+Each signature collection task writes its reads to a store of one chromosome,
+signatures/_{chrom}_{start}_{end}.reads.bin, which are concatenated to reads.bin. The
+task buffers the columns in arrays and spills them to temporary column files, so that
+its memory does not grow with the number of reads.
+
+Work directories with 'query_name:RG' read IDs keep their reads in text reads.sigs, or
+reads shards.
+"""
+import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+READS_STORE = "reads.bin"
+READS_PART_SUFFIX = ".reads.bin"
+READS_MAGIC = b"CSVREAD1"
+
+# Columns of a chromosome block in file order, the widest first to keep them aligned
+READS_COLUMNS = (
+    ("read", np.dtype("<i8")),
+    ("start", np.dtype("<i4")),
+    ("end", np.dtype("<i4")),
+    ("primary", np.dtype("u1")),
+)
+READS_ALIGN = 8
+# array typecodes of the columns buffered by ReadsWriter
+BUFFER_TYPECODES = {"read": "q", "start": "i", "end": "i", "primary": "B"}
+# Reads buffered by a task before spilling them to the column files
+SPILL_READS = 1 << 20
+
+ReadColumns = Dict[str, np.ndarray]
+# From chromosome to the number of reads and block offset from the end of the header
+ReadsHeader = Dict[str, Tuple[int, int]]
+
+
+def block_size(n_reads: int) -> int:
+    "Size of a chromosome block of n_reads, padded to READS_ALIGN"
+    size = sum(dtype.itemsize for _, dtype in READS_COLUMNS) * n_reads
+    return -(-size // READS_ALIGN) * READS_ALIGN
+
+
+def read_columns(reads: Iterable[Tuple[int, int, int, int]]) -> ReadColumns:
+    "Return the columns of (start, end, primary, read ID) tuples"
+    values = dict(zip(("start", "end", "primary", "read"), zip(*reads)))
+    columns = dict()
+    for name, dtype in READS_COLUMNS:
+        columns[name] = np.array(values.get(name, ()), dtype=dtype)
+    return columns
+
+
+def write_reads_store(path: Path, chroms: Dict[str, List[ReadColumns]]):
+    """Write the reads store.
+
+    Args:
+        path (Path): The store file, written through a temporary file.
+        chroms (Dict[str, List[ReadColumns]]): Columns of each chromosome in parts,
+            concatenated in the block of the chromosome.
+    """
+    header = list()
+    offset = 0
+    for chrom, parts in chroms.items():
+        n_reads = sum(len(part["read"]) for part in parts)
+        header.append("%s\t%d\t%d\n" % (chrom, n_reads, offset))
+        offset += block_size(n_reads)
+    header_bytes = "".join(header).encode()
+    header_bytes += b"\n" * (-(len(header_bytes) + 16) % READS_ALIGN)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(READS_MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for parts in chroms.values():
+            size = 0
+            for name, dtype in READS_COLUMNS:
+                for part in parts:
+                    data = np.ascontiguousarray(part[name], dtype=dtype)
+                    f.write(data.data)
+                    size += data.nbytes
+            f.write(b"\0" * (-size % READS_ALIGN))
+    tmp_path.replace(path)
+
+
+class ReadsWriter:
+    """Reads store of one chromosome written while the reads are collected.
+
+    The columns are buffered in arrays. Every spill_reads reads they are appended to
+    the column files {path}.{column}.tmp, which are memory-mapped and concatenated to
+    the store when the writer is closed.
+    """
+
+    def __init__(self, path: Path, chrom: str, spill_reads: int = SPILL_READS):
+        self.path = path
+        self.chrom = chrom
+        self.spill_reads = spill_reads
+        self.columns = {
+            name: array.array(BUFFER_TYPECODES[name]) for name, _ in READS_COLUMNS
+        }
+        self.spilled = 0
+
+    def column_path(self, name: str) -> Path:
+        return self.path.with_name("%s.%s.tmp" % (self.path.name, name))
+
+    def add(self, start: int, end: int, primary: int, read: int):
+        columns = self.columns
+        columns["start"].append(start)
+        columns["end"].append(end)
+        columns["primary"].append(primary)
+        columns["read"].append(read)
+        if len(columns["read"]) >= self.spill_reads:
+            self.spill()
+
+    def spill(self):
+        "Append the buffered columns to the column files"
+        for name, dtype in READS_COLUMNS:
+            with open(self.column_path(name), "ab") as f:
+                f.write(np.asarray(self.columns[name], dtype=dtype).data)
+            del self.columns[name][:]
+        self.spilled += 1
+
+    def close(self) -> int:
+        """Write the store and remove the column files.
+
+        Returns:
+            int: Number of reads stored.
+        """
+        if self.spilled == 0:
+            part = {name: self.columns[name] for name, _ in READS_COLUMNS}
+            write_reads_store(self.path, {self.chrom: [part]})
+            return len(part["read"])
+        if len(self.columns["read"]) > 0:
+            self.spill()
+        part = {
+            name: np.memmap(self.column_path(name), dtype=dtype, mode="r")
+            for name, dtype in READS_COLUMNS
+        }
+        write_reads_store(self.path, {self.chrom: [part]})
+        n_reads = len(part["read"])
+        del part
+        for name, _ in READS_COLUMNS:
+            self.column_path(name).unlink()
+        return n_reads
+
+
+def read_reads_header(path: Path) -> Tuple[int, ReadsHeader]:
+    """Read the header of the reads store.
+
+    Raises:
+        ValueError: If path is not a reads store.
+
+    Returns:
+        Tuple[int, ReadsHeader]: Offset of the first block and the chromosome blocks.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(READS_MAGIC)) != READS_MAGIC:
+            raise ValueError("%s is not a reads store." % str(path))
+        header_size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header_bytes = f.read(header_size)
+    blocks = dict()
+    for line in header_bytes.decode().split("\n"):
+        if line != "":
+            chrom, n_reads, offset = line.split("\t")
+            blocks[chrom] = (int(n_reads), int(offset))
+    return 16 + header_size, blocks
+
+
+def load_reads_columns(
+    path: Path, chrom: str, data_start: int, blocks: ReadsHeader, mode: str = "r"
+) -> ReadColumns:
+    "Memory-map the read columns of chrom, empty if it has no reads"
+    n_reads, offset = blocks.get(chrom, (0, 0))
+    if n_reads == 0:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in READS_COLUMNS}
+    block = np.memmap(
+        path,
+        dtype=np.uint8,
+        mode=mode,
+        offset=data_start + offset,
+        shape=(block_size(n_reads),),
+    )
+    columns = dict()
+    start = 0
+    for name, dtype in READS_COLUMNS:
+        end = start + dtype.itemsize * n_reads
+        columns[name] = block[start:end].view(dtype)
+        start = end
+    return columns
+
+
+def iter_reads(columns: ReadColumns) -> Iterable[Tuple[int, int, int, int]]:
+    "Generate the (start, end, primary, read ID) of loaded read columns"
+    return zip(
+        columns["start"].tolist(),
+        columns["end"].tolist(),
+        columns["primary"].tolist(),
+        columns["read"].tolist(),
+    )
+
+
+def remap_read_column(reads: np.ndarray, remap: Dict[int, int]) -> np.ndarray:
+    "Return the read ID column with the IDs found in remap replaced"
+    if len(remap) == 0 or len(reads) == 0:
+        return reads
+    old = np.fromiter(sorted(remap), dtype=reads.dtype, count=len(remap))
+    new = np.array([remap[i] for i in old.tolist()], dtype=reads.dtype)
+    index = np.minimum(np.searchsorted(old, reads), len(old) - 1)
+    return np.where(old[index] == reads, new[index], reads)
+
+
+def remap_reads_store(path: Path, remap: Dict[int, int]):
+    "Replace the read IDs found in remap in the reads store in place"
+    if len(remap) == 0:
+        return
+    data_start, blocks = read_reads_header(path)
+    for chrom in blocks:
+        columns = load_reads_columns(path, chrom, data_start, blocks, mode="r+")
+        # Written through the shared memory map
+        columns["read"][:] = remap_read_column(columns["read"], remap)
+        del columns
+
+
+def merge_reads_parts(
+    path: Path, parts: Iterable[Path], remaps: Optional[List[Dict[int, int]]] = None
+) -> int:
+    """Concatenate the reads stores of the tasks to the reads store of the work dir.
+
+    Args:
+        path (Path): The reads store.
+        parts (Iterable[Path]): Task stores in order of their reads.
+        remaps (Optional[List[Dict[int, int]]]): New read IDs of each part, see
+            read_names.merge_names.
+
+    Returns:
+        int: Number of reads stored.
+    """
+    chroms: Dict[str, List[ReadColumns]] = dict()
+    for i, part in enumerate(parts):
+        data_start, blocks = read_reads_header(part)
+        for chrom in blocks:
+            columns = load_reads_columns(part, chrom, data_start, blocks)
+            if remaps is not None:
+                columns["read"] = remap_read_column(columns["read"], remaps[i])
+            chroms.setdefault(chrom, list()).append(columns)
+    write_reads_store(path, chroms)
+    return sum(len(c["read"]) for parts in chroms.values() for c in parts)
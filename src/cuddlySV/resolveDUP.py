@@ -2,8 +2,9 @@ from ast import Tuple
 from collections import namedtuple
 from typing import List
 import logging
+from .cluster_arrays import dup_segments
 from .Description import WorkDir
-from .genotype import load_reads, overlap_cover, assign_gt
+from .genotype import load_reads, overlap_cover, assign_gt, svs_region
 
 # TODO: 1. Identify DP with samfile pointer;
 # TODO: 2. Add CIPOS, CILEN and/or CIEND;
@@ -21,63 +22,46 @@ def resolution_DUP(
     action,
     MaxSize,
     gt_round,
+    piece=None,
 ):
-    semi_dup_cluster = list()
-    semi_dup_cluster.append([0, 0, ""])
     candidate_single_SV: List[Tuple] = list()
 
-    # file = open("%s%s.sigs" % (path, "DUP"), "r")
-    # for line in file:
-    for line in path.lines("DUP", chr):
-        seq = line.strip("\n").split("\t")
-        if seq[1] != chr:
-            continue
-
-        pos_1 = int(seq[2])
-        pos_2 = int(seq[3])
-        read_id = seq[4]
-
-        # if pos_1 - semi_dup_cluster[-1][0] > max_cluster_bias or pos_2 - semi_dup_cluster[-1][1] > max_cluster_bias:
-        if pos_1 - semi_dup_cluster[-1][0] > max_cluster_bias:
-            if len(semi_dup_cluster) >= read_count:
-                if semi_dup_cluster[-1][0] == semi_dup_cluster[-1][1] == 0:
-                    pass
-                else:
-                    generate_dup_cluster(
-                        semi_dup_cluster,
+    columns = path.signature_columns("DUP", chr, piece=piece)
+    segments = dup_segments(
+        columns["pos_1"], columns["pos_2"], columns["read"], read_count, max_cluster_bias
+    )
+    read_names = columns["read_names"]
+    for i, (breakpoint_1, breakpoint_2) in enumerate(
+        zip(segments.bp_1.tolist(), segments.bp_2.tolist())
+    ):
+        if sv_size <= breakpoint_2 - breakpoint_1 <= MaxSize or (
+            sv_size <= breakpoint_2 - breakpoint_1 and MaxSize == -1
+        ):
+            members = segments.members[segments.bounds[i] : segments.bounds[i + 1]]
+            # Reads in the order of their set, as they have been reported
+            support_read = list(
+                set([read_names[j] for j in columns["read"][members].tolist()])
+            )
+            if action:
+                candidate_single_SV.append(
+                    [chr, "DUP", breakpoint_1, breakpoint_2, support_read]
+                )
+            else:
+                candidate_single_SV.append(
+                    DuplicationSV(
                         chr,
-                        read_count,
-                        max_cluster_bias,
-                        sv_size,
-                        candidate_single_SV,
-                        action,
-                        MaxSize,
-                        gt_round,
+                        "DUP",
+                        str(breakpoint_1),  # POS
+                        str(breakpoint_2 - breakpoint_1),  # SVLEN
+                        str(len(support_read)),  # RE?
+                        ".",
+                        "./.",
+                        ".,.,.",
+                        ".",
+                        ".",
+                        str(",".join(map(str, support_read))),
                     )
-            semi_dup_cluster = []
-            semi_dup_cluster.append([pos_1, pos_2, read_id])
-        else:
-            if semi_dup_cluster[-1][0] == semi_dup_cluster[-1][1] == 0:
-                semi_dup_cluster = []
-                semi_dup_cluster.append([pos_1, pos_2, read_id])
-            else:
-                semi_dup_cluster.append([pos_1, pos_2, read_id])
-
-    if len(semi_dup_cluster) >= read_count:
-        if semi_dup_cluster[-1][0] == semi_dup_cluster[-1][1] == 0:
-            pass
-        else:
-            generate_dup_cluster(
-                semi_dup_cluster,
-                chr,
-                read_count,
-                max_cluster_bias,
-                sv_size,
-                candidate_single_SV,
-                action,
-                MaxSize,
-                gt_round,
-            )
+                )
 
     if action:
         candidate_single_SV_gt = call_gt_dup(
@@ -108,74 +92,6 @@ DuplicationSV = namedtuple(
 )
 
 
-def generate_dup_cluster(
-    semi_dup_cluster,
-    chr,
-    read_count,
-    max_cluster_bias,
-    sv_size,
-    candidate_single_SV: List[DuplicationSV],
-    action,
-    MaxSize,
-    gt_round,
-):
-    # calculate support reads
-    support_read = list(set([i[2] for i in semi_dup_cluster]))
-    if len(support_read) < read_count:
-        return
-
-    semi_dup_cluster.sort(key=lambda x: x[1])
-    allele_collect = []
-    allele_collect.append([semi_dup_cluster[0]])
-    last_len = semi_dup_cluster[0][1]
-    for i in semi_dup_cluster[1:]:
-        if i[1] - last_len > max_cluster_bias:
-            allele_collect.append([])
-        allele_collect[-1].append(i)
-        last_len = i[1]
-    for i in allele_collect:
-        support_read = list(set([j[2] for j in i]))
-        if len(support_read) < read_count:
-            continue
-        low_b = int(len(i) * 0.4)
-        up_b = int(len(i) * 0.6)
-
-        if low_b == up_b:
-            breakpoint_1 = i[low_b][0]
-            breakpoint_2 = i[low_b][1]
-        else:
-            # TODO: Figure out proper breakpoints. Not just means of breakpoints.
-            breakpoint_1 = [i[0] for i in i[low_b:up_b]]
-            breakpoint_2 = [i[1] for i in i[low_b:up_b]]
-            breakpoint_1 = int(sum(breakpoint_1) / len(i[low_b:up_b]))
-            breakpoint_2 = int(sum(breakpoint_2) / len(i[low_b:up_b]))
-
-        if sv_size <= breakpoint_2 - breakpoint_1 <= MaxSize or (
-            sv_size <= breakpoint_2 - breakpoint_1 and MaxSize == -1
-        ):
-            if action:
-                candidate_single_SV.append(
-                    [chr, "DUP", breakpoint_1, breakpoint_2, support_read]
-                )
-                # print("DUP", chr, int(breakpoint_1), int(breakpoint_2), DR, DV, QUAL, "%.4f"%cost_time)
-            else:
-                candidate_single_SV.append(
-                    DuplicationSV(
-                        chr,
-                        "DUP",
-                        str(breakpoint_1),  # POS
-                        str(breakpoint_2 - breakpoint_1),  # SVLEN
-                        str(len(support_read)),  # RE?
-                        ".",
-                        "./.",
-                        ".,.,.",
-                        ".",
-                        ".",
-                        str(",".join(support_read)),
-                    )
-                )
-
-
 def run_dup(args):
     return resolution_DUP(**args)
 
@@ -183,7 +99,6 @@ def run_dup(args):
 def call_gt_dup(
     temporary_dir, chr, candidate_single_SV: List[DuplicationSV], max_cluster_bias
 ):
-    reads_list = load_reads(temporary_dir, chr)
     svs_list = list()
     for item in candidate_single_SV:
         new_cluster_bias = min(max_cluster_bias, item[3] - item[2])
@@ -195,6 +110,7 @@ def call_gt_dup(
         svs_list.append(
             (max(item[3] - new_cluster_bias / 2, 0), item[3] + new_cluster_bias / 2)
         )
+    reads_list = load_reads(temporary_dir, chr, svs_region(svs_list))
     iteration_dict, primary_num_dict, cover_dict = overlap_cover(
         svs_list, reads_list
     )  # both key(sv idx), value(set(read id))
@@ -227,7 +143,7 @@ def call_gt_dup(
                 str(assign_list[i][3]),
                 str(assign_list[i][4]),
                 str(assign_list[i][5]),
-                ",".join(candidate_single_SV[i][4]),
+                ",".join(map(str, candidate_single_SV[i][4])),
             )
         )
     return candidate_single_SV_gt
@@ -1,7 +1,8 @@
-from collections import namedtuple
-from typing import List
 import numpy as np
-from .genotype import cal_CI, load_reads, overlap_cover, assign_gt
+from .cluster_arrays import closest_mean, indel_alleles
+from .columns import column_seq
+from .insert_sequence import DeferredSequence, InsertSequenceFetcher
+from .genotype import load_reads, overlap_cover, assign_gt, svs_region
 from .Description import WorkDir, setupLogging
 import logging
 
@@ -22,6 +23,7 @@ def resolution_DEL(
     action,
     gt_round,
     remain_reads_ratio,
+    piece=None,
 ):
     """
     cluster DEL
@@ -49,65 +51,65 @@ def resolution_DEL(
     """
     if remain_reads_ratio > 1:
         remain_reads_ratio = 1
-    semi_del_cluster = list()
-    semi_del_cluster.append([0, 0, ""])
     candidate_single_SV = list()
 
     logging.debug("Reading DEL signatures from files.")
-    # file = open("%s%s.sigs" % (path, "DEL"), "r")
-    # for line in file:
-    for line in path.lines("DEL", chr):
-        seq = line.strip("\n").split("\t")
-        if seq[1] != chr:
-            continue
-
-        pos = int(seq[2])
-        indel_len = int(seq[3])
-        read_id = seq[4]
-
-        if pos - semi_del_cluster[-1][0] > max_cluster_bias:
-            if len(semi_del_cluster) >= read_count:
-                if semi_del_cluster[-1][0] == semi_del_cluster[-1][1] == 0:
-                    pass  # Length and position of the last read are equal to zero! How does that happen?
-                else:
-                    generate_del_cluster(
-                        semi_del_cluster,
-                        chr,
-                        svtype,
-                        read_count,
-                        threshold_gloab,
-                        # threshold_local,
-                        minimum_support_reads,
-                        candidate_single_SV,
-                        action,
-                        gt_round,
-                        remain_reads_ratio,
-                    )
-            semi_del_cluster = []
-            semi_del_cluster.append([pos, indel_len, read_id])
-        else:
-            if semi_del_cluster[-1][0] == semi_del_cluster[-1][1] == 0:
-                semi_del_cluster = []
-                semi_del_cluster.append([pos, indel_len, read_id])
-            else:
-                semi_del_cluster.append([pos, indel_len, read_id])
-
-    if len(semi_del_cluster) >= read_count:
-        if semi_del_cluster[-1][0] == semi_del_cluster[-1][1] == 0:
-            pass
+    columns = path.signature_columns("DEL", chr, piece=piece)
+    alleles = indel_alleles(
+        columns["pos"],
+        columns["len"],
+        columns["read"],
+        read_count,
+        max_cluster_bias,
+        threshold_gloab,
+        minimum_support_reads,
+    )
+    read_names = columns["read_names"]
+    positions = np.asarray(columns["pos"])
+    for i in range(len(alleles.pos_median)):
+        members = alleles.members[alleles.bounds[i] : alleles.bounds[i + 1]]
+        support = len(members)
+        remain_allele_num = max(int(remain_reads_ratio * support), 1)
+        # Mean of the breakpoints closest to the median
+        breakpointStart, search_threshold = closest_mean(
+            positions[members], alleles.pos_median[i], remain_allele_num
+        )
+        signalLen = int(alleles.len_median[i])
+        CIPOS = "%d,%d" % (alleles.pos_low[i], alleles.pos_high[i])
+        CILEN = "%d,%d" % (alleles.len_low[i], alleles.len_high[i])
+        ReadNames = [read_names[j] for j in columns["read"][members].tolist()]
+
+        if action:
+            candidate_single_SV.append(
+                [
+                    chr,
+                    svtype,
+                    int(breakpointStart),
+                    -signalLen,
+                    support,
+                    CIPOS,
+                    CILEN,
+                    int(search_threshold),
+                    ReadNames,
+                ]
+            )
         else:
-            generate_del_cluster(
-                semi_del_cluster,
-                chr,
-                svtype,
-                read_count,
-                threshold_gloab,
-                # threshold_local,
-                minimum_support_reads,
-                candidate_single_SV,
-                action,
-                gt_round,
-                remain_reads_ratio,
+            candidate_single_SV.append(
+                [
+                    chr,
+                    svtype,
+                    str(int(breakpointStart)),
+                    str(-signalLen),
+                    str(support),
+                    CIPOS,
+                    CILEN,
+                    ".",
+                    "./.",
+                    ".,.,.",
+                    ".",
+                    ".",
+                    ",".join(map(str, ReadNames)),
+                ]
             )
 
     if action:
@@ -121,152 +123,6 @@ def resolution_DEL(
         return candidate_single_SV
 
 
-DelAlleleDesc = namedtuple(
-    "DelAlleleDesc", ("Positions", "Lengths", "Something", "ReadNames")
-)
-
-InsAlleleDesc = namedtuple(
-    "InsAlleleDesc", ("Positions", "Lengths", "Something", "ReadNames", "InsertSeq")
-)
-
-
-def generate_del_cluster(
-    semi_del_cluster,
-    chr,
-    svtype,
-    read_count,
-    threshold_gloab,
-    minimum_support_reads,
-    candidate_single_SV,
-    action,
-    gt_round,
-    remain_reads_ratio,
-):
-    """
-    candidate_single_SV is the output argument where to put the clusters.
-
-    generate deletion
-    *************************************************************
-    threshold_gloab 	threshold_local 	minimum_support_reads
-    -------------------------------------------------------------
-        0.3					0.7 					5		CLR
-        0.4					0.5 				  <=5		CCS
-    *************************************************************
-    """
-
-    # Remove duplicates
-    read_tag = dict()
-    for element in semi_del_cluster:
-        if element[2] not in read_tag:
-            read_tag[element[2]] = element
-        else:
-            if element[1] > read_tag[element[2]][1]:
-                read_tag[element[2]] = element
-
-    if len(read_tag) < read_count:
-        return
-
-    read_tag2SortedList = sorted(list(read_tag.values()), key=lambda x: x[1])
-    global_len = [i[1] for i in read_tag2SortedList]
-    DISCRETE_THRESHOLD_LEN_CLUSTER_DEL_TEMP = threshold_gloab * np.mean(global_len)
-
-    last_len = read_tag2SortedList[0][1]
-
-    """
-    *************************************************************
-        #1 				#2			#3			#4
-    -------------------------------------------------------------
-        del-breakpoint	del-len		#support 	read-id
-    *************************************************************
-    """
-
-    allele_collect: List[DelAlleleDesc] = list()
-    allele_collect.append(
-        DelAlleleDesc(
-            [read_tag2SortedList[0][0]],
-            [read_tag2SortedList[0][1]],
-            [],
-            [read_tag2SortedList[0][2]],
-        )
-    )
-
-    for i in read_tag2SortedList[1:]:
-        if i[1] - last_len > DISCRETE_THRESHOLD_LEN_CLUSTER_DEL_TEMP:
-            allele_collect[-1][2].append(len(allele_collect[-1][0]))
-            allele_collect.append(DelAlleleDesc([], [], [], []))
-
-        allele_collect[-1][0].append(i[0])
-        allele_collect[-1][1].append(i[1])
-        allele_collect[-1][3].append(i[2])
-        last_len = i[1]
-    allele_collect[-1][2].append(len(allele_collect[-1][0]))
-    allele_sort = sorted(allele_collect, key=lambda x: x[2])
-
-    for allele in allele_sort:
-        if allele[2][0] >= minimum_support_reads:
-            allele_list = list()
-            var_list = list()
-            remain_allele_num = max(int(remain_reads_ratio * allele[2][0]), 1)
-            pos_median, CIPOS, n_pos = cal_CI(allele.Positions)
-
-            for i in range(len(allele[0])):
-                var_list.append((abs(allele[0][i] - pos_median), i))
-            var_list.sort(key=lambda x: x[0])
-            for i in range(remain_allele_num):
-                allele_list.append(allele[0][var_list[i][1]])
-            breakpointStart = np.mean(allele_list)
-            search_threshold = allele_list[0]
-
-            allele_list = list()
-            var_list = list()
-            len_mean = np.mean(allele[1])
-            for i in range(len(allele[1])):
-                var_list.append((abs(allele[1][i] - len_mean), i))
-            var_list.sort(key=lambda x: x[0])
-            for i in range(remain_allele_num):
-                allele_list.append(allele[1][var_list[i][1]])
-            signalLen = np.mean(allele_list)
-
-            signalLen, CILEN, n_pos = cal_CI(allele.Lengths)
-
-            # allele[0]: List[Position]
-            # allele[1]: List[Length]
-            # allele[2]:  ????
-            # allele[3]: List[ReadName]
-            if action:
-                candidate_single_SV.append(
-                    [
-                        chr,
-                        svtype,
-                        int(breakpointStart),
-                        int(-signalLen),
-                        allele[2][0],
-                        str(CIPOS),
-                        str(CILEN),
-                        int(search_threshold),
-                        allele.ReadNames,
-                    ]
-                )
-            else:
-                candidate_single_SV.append(
-                    [
-                        chr,
-                        svtype,
-                        str(int(breakpointStart)),
-                        str(int(-signalLen)),
-                        str(allele[2][0]),
-                        str(CIPOS),
-                        str(CILEN),
-                        ".",
-                        "./.",
-                        ".,.,.",
-                        ".",
-                        ".",
-                        str(",".join(allele.ReadNames)),
-                    ]
-                )
-
-
 def resolution_INS(
     path: WorkDir,
     chr,
@@ -279,6 +135,7 @@ def resolution_INS(
     action,
     gt_round,
     remain_reads_ratio,
+    piece=None,
 ):
     """
     cluster INS
@@ -305,72 +162,85 @@ def resolution_INS(
     #6  INS sequence
     ********************************************************************************************
     """
-    if remain_reads_ratio > 1:
-        remain_reads_ratio = 1
-    semi_ins_cluster = list()
-    semi_ins_cluster.append([0, 0, "", ""])
     candidate_single_SV = list()
-
-    # file = open("%s%s.sigs" % (path, "INS"), "r")
-    # for line in file:
-    for line in path.lines("INS", chr):
-        seq = line.strip("\n").split("\t")
-        if seq[1] != chr:
-            logging.warning("Shouldn't have got %s", str(seq))
+    fetcher = InsertSequenceFetcher(bam_path, path.probed_ids())
+
+    columns = path.signature_columns("INS", chr, piece=piece)
+    alleles = indel_alleles(
+        columns["pos"],
+        columns["len"],
+        columns["read"],
+        read_count,
+        max_cluster_bias,
+        threshold_gloab,
+        minimum_support_reads,
+    )
+    read_names = columns["read_names"]
+    for i in range(len(alleles.pos_median)):
+        members = alleles.members[alleles.bounds[i] : alleles.bounds[i + 1]]
+        signalLen = int(alleles.len_median[i])
+        ReadNames = [read_names[j] for j in columns["read"][members].tolist()]
+        ideal_ins_seq = "<INS>"
+
+        # TODO: Figure out a way to get the consensus sequence insert. This is just randome one.
+        for j, read_name in zip(members.tolist(), ReadNames):
+            try:
+                ins_seq = column_seq(columns, j)
+            except (KeyError, IndexError):
+                # Columns without the inserted sequences
+                ins_seq = ""
+            ins_seq = DeferredSequence.parse(ins_seq)
+            if len(ins_seq) >= signalLen:
+                ins_seq = ins_seq[0:signalLen]
+                if isinstance(ins_seq, DeferredSequence):
+                    # Fetch the bases of the selected read, or try the next one
+                    try:
+                        ins_seq = ins_seq.resolve(fetcher, read_name)
+                    except LookupError:
+                        continue
+                breakpointStart = int(columns["pos"][j])
+                ideal_ins_seq = ins_seq
+                break
+        if ideal_ins_seq == "<INS>":
             continue
-
-        pos = int(seq[2])
-        indel_len = int(seq[3])
-        read_id = seq[4]
-        try:
-            ins_seq = seq[5]
-        except Exception:
-            ins_seq = ""
-
-        if pos - semi_ins_cluster[-1][0] > max_cluster_bias:
-            if len(semi_ins_cluster) >= read_count:
-                if semi_ins_cluster[-1][0] == semi_ins_cluster[-1][1] == 0:
-                    pass
-                else:
-                    generate_ins_cluster(
-                        semi_ins_cluster,
-                        chr,
-                        svtype,
-                        read_count,
-                        threshold_gloab,
-                        # threshold_local,
-                        minimum_support_reads,
-                        candidate_single_SV,
-                        action,
-                        gt_round,
-                        remain_reads_ratio,
-                    )
-            semi_ins_cluster = []
-            semi_ins_cluster.append([pos, indel_len, read_id, ins_seq])
-        else:
-            if semi_ins_cluster[-1][0] == semi_ins_cluster[-1][1] == 0:
-                semi_ins_cluster = []
-                semi_ins_cluster.append([pos, indel_len, read_id, ins_seq])
-            else:
-                semi_ins_cluster.append([pos, indel_len, read_id, ins_seq])
-
-    if len(semi_ins_cluster) >= read_count:
-        if semi_ins_cluster[-1][0] == semi_ins_cluster[-1][1] == 0:
-            pass
+        CIPOS = "%d,%d" % (alleles.pos_low[i], alleles.pos_high[i])
+        CILEN = "%d,%d" % (alleles.len_low[i], alleles.len_high[i])
+
+        if action:
+            candidate_single_SV.append(
+                [
+                    chr,
+                    svtype,
+                    breakpointStart,
+                    signalLen,
+                    len(members),
+                    CIPOS,
+                    CILEN,
+                    breakpointStart,
+                    ReadNames,
+                    ideal_ins_seq,
+                ]
+            )
         else:
-            generate_ins_cluster(
-                semi_ins_cluster,
-                chr,
-                svtype,
-                read_count,
-                threshold_gloab,
-                # threshold_local,
-                minimum_support_reads,
-                candidate_single_SV,
-                action,
-                gt_round,
-                remain_reads_ratio,
+            candidate_single_SV.append(
+                [
+                    chr,
+                    svtype,
+                    str(breakpointStart),
+                    str(signalLen),
+                    str(len(members)),
+                    CIPOS,
+                    CILEN,
+                    ".",
+                    "./.",
+                    ".,.,.",
+                    ".",
+                    ".",
+                    ",".join(map(str, ReadNames)),
+                    ideal_ins_seq,
+                ]
             )
+    fetcher.close()
 
     if action:
         candidate_single_SV_gt = call_gt(
@@ -383,140 +253,6 @@ def resolution_INS(
         return candidate_single_SV
 
 
-def generate_ins_cluster(
-    semi_ins_cluster,
-    chr,
-    svtype,
-    read_count,
-    threshold_gloab,
-    minimum_support_reads,
-    candidate_single_SV,
-    action,
-    gt_round,
-    remain_reads_ratio,
-):
-    """
-    generate insertion
-    *************************************************************
-    threshold_gloab 	threshold_local 	minimum_support_reads
-    -------------------------------------------------------------
-        0.2					0.6 					5		CLR
-        0.65				0.7 				  <=5		CCS
-    *************************************************************
-    """
-    # Remove duplicates
-    read_tag = dict()
-    for element in semi_ins_cluster:
-        if element[2] not in read_tag:
-            read_tag[element[2]] = element
-        else:
-            if element[1] > read_tag[element[2]][1]:
-                read_tag[element[2]] = element
-
-    if len(read_tag) < read_count:
-        return
-
-    read_tag2SortedList = sorted(list(read_tag.values()), key=lambda x: x[1])
-    # start&end breakpoint
-    global_len = [i[1] for i in read_tag2SortedList]
-    DISCRETE_THRESHOLD_LEN_CLUSTER_INS_TEMP = threshold_gloab * np.mean(global_len)
-    last_len = read_tag2SortedList[0][1]
-
-    allele_collect: List[InsAlleleDesc] = list()
-    allele_collect.append(
-        InsAlleleDesc(
-            [read_tag2SortedList[0][0]],
-            [read_tag2SortedList[0][1]],
-            [],
-            [read_tag2SortedList[0][2]],
-            [read_tag2SortedList[0][3]],
-        )
-    )
-
-    for i in read_tag2SortedList[1:]:
-        if i[1] - last_len > DISCRETE_THRESHOLD_LEN_CLUSTER_INS_TEMP:
-            allele_collect[-1][2].append(len(allele_collect[-1][0]))
-            allele_collect.append(InsAlleleDesc([], [], [], [], []))
-
-        allele_collect[-1][0].append(i[0])
-        allele_collect[-1][1].append(i[1])
-        allele_collect[-1][3].append(i[2])
-        allele_collect[-1][4].append(i[3])
-        last_len = i[1]
-    allele_collect[-1][2].append(len(allele_collect[-1][0]))
-    allele_sort = sorted(allele_collect, key=lambda x: x[2])
-
-    for allele in allele_sort:
-        if allele[2][0] >= minimum_support_reads:
-            allele_list = list()
-            var_list = list()
-            remain_allele_num = max(int(remain_reads_ratio * allele[2][0]), 1)
-            pos_mean, CIPOS, n_pos = cal_CI(allele.Positions)
-
-            for i in range(len(allele[0])):
-                var_list.append((abs(allele[0][i] - pos_mean), i))
-            var_list.sort(key=lambda x: x[0])
-            for i in range(remain_allele_num):
-                allele_list.append(allele[0][var_list[i][1]])
-            breakpointStart = np.mean(allele_list)
-
-            allele_list = list()
-            var_list = list()
-            len_mean = np.mean(allele[1])
-            for i in range(len(allele[1])):
-                var_list.append((abs(allele[1][i] - len_mean), i))
-            var_list.sort(key=lambda x: x[0])
-            for i in range(remain_allele_num):
-                allele_list.append(allele[1][var_list[i][1]])
-
-            signalLen, CILEN, n_len = cal_CI(allele.Lengths)
-            ideal_ins_seq = "<INS>"
-
-            # TODO: Figure out a way to get the consensus sequence insert. This is just randome one.
-            for pos, ins_seq in zip(allele.Positions, allele.InsertSeq):
-                if len(ins_seq) >= int(signalLen):
-                    breakpointStart = pos
-                    ideal_ins_seq = ins_seq[0 : int(signalLen)]
-                    break
-            if ideal_ins_seq == "<INS>":
-                continue
-
-            if action:
-                candidate_single_SV.append(
-                    [
-                        chr,
-                        svtype,
-                        int(breakpointStart),
-                        int(signalLen),
-                        allele[2][0],
-                        str(CIPOS),
-                        str(CILEN),
-                        int(breakpointStart),
-                        allele.ReadNames,
-                        ideal_ins_seq,
-                    ]
-                )
-            else:
-                candidate_single_SV.append(
-                    [
-                        chr,
-                        svtype,
-                        str(int(breakpointStart)),
-                        str(int(signalLen)),
-                        str(allele[2][0]),
-                        str(CIPOS),
-                        str(CILEN),
-                        ".",
-                        "./.",
-                        ".,.,.",
-                        ".",
-                        ".",
-                        str(",".join(allele.ReadNames)),
-                        ideal_ins_seq,
-                    ]
-                )
-
-
 def run_del(args):
     setupLogging()
     try:
@@ -536,13 +272,12 @@ def run_ins(args):
 
 
 def call_gt(temporary_dir, chr, candidate_single_SV, max_cluster_bias, svtype):
-    reads_list = load_reads(temporary_dir, chr)
-
     svs_list = list()
     for item in candidate_single_SV:
         svs_list.append(
             (max(item[7] - max_cluster_bias, 0), item[7] + max_cluster_bias)
         )
+    reads_list = load_reads(temporary_dir, chr, svs_region(svs_list))
     iteration_dict, primary_num_dict, cover_dict = overlap_cover(
         svs_list, reads_list
     )  # both key(sv idx), value(set(read id))
@@ -571,7 +306,7 @@ def call_gt(temporary_dir, chr, candidate_single_SV, max_cluster_bias, svtype):
                 str(assign_list[i][3]),
                 str(assign_list[i][4]),
                 str(assign_list[i][5]),
-                ",".join(candidate_single_SV[i][8]),
+                ",".join(map(str, candidate_single_SV[i][8])),
             ]
         )
         if svtype == "INS":
@@ -1,6 +1,7 @@
 import logging
+from .cluster_arrays import first_occurrences, inv_segments
 from .Description import WorkDir
-from .genotype import load_reads, overlap_cover, assign_gt
+from .genotype import load_reads, overlap_cover, assign_gt, svs_region
 
 
 def resolution_INV(
@@ -14,6 +15,7 @@ def resolution_INV(
     action,
     MaxSize,
     gt_round,
+    piece=None,
 ):
     """
     cluster INV
@@ -40,80 +42,62 @@ def resolution_INV(
     ************************************************************************
     """
 
-    # Initialization of some temporary variables
-    semi_inv_cluster = list()
-    semi_inv_cluster.append([0, 0, "", ""])
     candidate_single_SV = list()
 
     # Load inputs & cluster breakpoint from each signature read
-    #file = open("%s%s.sigs" % (path, "INV"), "r")
-    #for line in file:
-    for line in path.lines("INV",chr):
-        seq = line.strip("\n").split("\t")
-        if seq[1] != chr:
+    columns = path.signature_columns("INV", chr, piece=piece)
+    segments = inv_segments(
+        columns["strand"],
+        columns["bp_1"],
+        columns["bp_2"],
+        columns["read"],
+        read_count,
+        max_cluster_bias,
+    )
+    read_names = columns["read_names"]
+    for i, (breakpoint_1, breakpoint_2) in enumerate(
+        zip(segments.bp_1.tolist(), segments.bp_2.tolist())
+    ):
+        inv_len = breakpoint_2 - breakpoint_1
+        if inv_len < sv_size or (inv_len > MaxSize and MaxSize != -1):
             continue
-
-        strand = seq[2]
-        breakpoint_1_in_read = int(seq[3])
-        breakpoint_2_in_read = int(seq[4])
-        read_id = seq[5]
-
-        # print("new")
-        # print(seq[1], seq[2], seq[3], seq[4], seq[5])
-        # print(semi_inv_cluster)
-
-        if (
-            breakpoint_1_in_read - semi_inv_cluster[-1][0] > max_cluster_bias
-            or breakpoint_2_in_read - semi_inv_cluster[-1][1] > max_cluster_bias
-            or strand != semi_inv_cluster[-1][-1]
-        ):
-            if len(semi_inv_cluster) >= read_count:
-                if semi_inv_cluster[-1][0] == semi_inv_cluster[-1][1] == 0:
-                    pass
-                else:
-                    generate_semi_inv_cluster(
-                        semi_inv_cluster,
-                        chr,
-                        svtype,
-                        read_count,
-                        sv_size,
-                        candidate_single_SV,
-                        max_cluster_bias,
-                        action,
-                        MaxSize,
-                        gt_round,
-                    )
-            semi_inv_cluster = []
-            semi_inv_cluster.append(
-                [breakpoint_1_in_read, breakpoint_2_in_read, read_id, strand]
+        members = segments.members[segments.bounds[i] : segments.bounds[i + 1]]
+        strand = columns["strand"][members[0]].decode()
+        # Reads in the order of their first signatures
+        temp_id = [
+            read_names[j] for j in first_occurrences(columns["read"][members]).tolist()
+        ]
+        if action:
+            candidate_single_SV.append(
+                [
+                    chr,
+                    svtype,
+                    breakpoint_1,
+                    inv_len,
+                    len(temp_id),
+                    strand,
+                    temp_id,
+                    breakpoint_2,
+                ]
             )
         else:
-            if semi_inv_cluster[-1][0] == semi_inv_cluster[-1][1] == 0:
-                semi_inv_cluster = []
-                semi_inv_cluster.append(
-                    [breakpoint_1_in_read, breakpoint_2_in_read, read_id, strand]
-                )
-            else:
-                semi_inv_cluster.append(
-                    [breakpoint_1_in_read, breakpoint_2_in_read, read_id, strand]
-                )
-
-    if len(semi_inv_cluster) >= read_count:
-        if semi_inv_cluster[-1][0] == semi_inv_cluster[-1][1] == 0:
-            pass
-        else:
-            generate_semi_inv_cluster(
-                semi_inv_cluster,
-                chr,
-                svtype,
-                read_count,
-                sv_size,
-                candidate_single_SV,
-                max_cluster_bias,
-                action,
-                MaxSize,
-                gt_round,
+            candidate_single_SV.append(
+                [
+                    chr,
+                    svtype,
+                    str(breakpoint_1),
+                    str(inv_len),
+                    str(len(temp_id)),
+                    ".",
+                    "./.",
+                    strand,
+                    ".,.,.",
+                    ".",
+                    ".",
+                    ",".join(map(str, temp_id)),
+                ]
             )
+
     if action:
         candidate_single_SV_gt = call_gt_inv(
             path, chr, candidate_single_SV, max_cluster_bias
@@ -125,142 +109,11 @@ def resolution_INV(
         return candidate_single_SV
 
 
-def generate_semi_inv_cluster(
-    semi_inv_cluster,
-    chr,
-    svtype,
-    read_count,
-    sv_size,
-    candidate_single_SV,
-    max_cluster_bias,
-    action,
-    MaxSize,
-    gt_round,
-):
-    strand = semi_inv_cluster[0][-1]
-
-    read_id = [i[2] for i in semi_inv_cluster]
-    support_read = len(list(set(read_id)))
-    if support_read < read_count:
-        return
-
-    inv_cluster_b2 = sorted(semi_inv_cluster, key=lambda x: x[1])
-
-    # breakpoint_1 = np.mean(breakpoint_1_candidate)
-    last_bp = inv_cluster_b2[0][1]
-    temp_count = 1
-    # max_count = 0
-    temp_sum_b1 = inv_cluster_b2[0][0]
-    temp_sum_b2 = last_bp
-
-    # max_sum = 0
-    temp_id = dict()
-    temp_id[inv_cluster_b2[0][2]] = 0
-
-    for i in inv_cluster_b2[1:]:
-        if i[1] - last_bp > max_cluster_bias:
-            if temp_count >= read_count:
-                max_count_id = len(temp_id)
-
-                breakpoint_1 = round(temp_sum_b1 / temp_count)
-                breakpoint_2 = round(temp_sum_b2 / temp_count)
-                inv_len = breakpoint_2 - breakpoint_1
-                if inv_len >= sv_size and max_count_id >= read_count:
-                    # candidate_single_SV.append('%s\t%s\t%d\t%d\t%d\n'%(chr, svtype, breakpoint_1, breakpoint_2, max_count_id))
-                    if inv_len <= MaxSize or MaxSize == -1:
-                        if action:
-                            candidate_single_SV.append(
-                                [
-                                    chr,
-                                    svtype,
-                                    breakpoint_1,
-                                    inv_len,
-                                    max_count_id,
-                                    strand,
-                                    list(temp_id.keys()),
-                                    breakpoint_2,
-                                ]
-                            )
-                        else:
-                            candidate_single_SV.append(
-                                [
-                                    chr,
-                                    svtype,
-                                    str(int(breakpoint_1)),
-                                    str(int(inv_len)),
-                                    str(max_count_id),
-                                    ".",
-                                    "./.",
-                                    strand,
-                                    ".,.,.",
-                                    ".",
-                                    ".",
-                                    str(",".join(list(temp_id.keys()))),
-                                ]
-                            )
-                        # print(chr, svtype, str(int(breakpoint_1)), str(int(inv_len)), str(max_count_id), str(DR), str(GT), strand)
-
-            temp_id = dict()
-            temp_count = 1
-            temp_sum_b1 = i[0]
-            temp_sum_b2 = i[1]
-            temp_id[i[2]] = 0
-        else:
-            if i[2] not in temp_id:
-                temp_id[i[2]] = 0
-            else:
-                temp_id[i[2]] += 1
-            temp_count += 1
-            temp_sum_b1 += i[0]
-            temp_sum_b2 += i[1]
-        last_bp = i[1]
-    if temp_count >= read_count:
-        max_count_id = len(temp_id)
-        breakpoint_1 = round(temp_sum_b1 / temp_count)
-        breakpoint_2 = round(temp_sum_b2 / temp_count)
-        inv_len = breakpoint_2 - breakpoint_1
-        if inv_len >= sv_size and max_count_id >= read_count:
-            # candidate_single_SV.append('%s\t%s\t%d\t%d\t%d\n'%(chr, svtype, breakpoint_1, breakpoint_2, max_count_id))
-            if inv_len <= MaxSize or MaxSize == -1:
-                if action:
-                    candidate_single_SV.append(
-                        [
-                            chr,
-                            svtype,
-                            breakpoint_1,
-                            inv_len,
-                            max_count_id,
-                            strand,
-                            list(temp_id.keys()),
-                            breakpoint_2,
-                        ]
-                    )
-                else:
-                    candidate_single_SV.append(
-                        [
-                            chr,
-                            svtype,
-                            str(int(breakpoint_1)),
-                            str(int(inv_len)),
-                            str(max_count_id),
-                            ".",
-                            "./.",
-                            strand,
-                            ".,.,.",
-                            ".",
-                            ".",
-                            str(",".join(list(temp_id.keys()))),
-                        ]
-                    )
-                # print(chr, svtype, str(int(breakpoint_1)), str(int(inv_len)), str(max_count_id), str(DR), str(GT), strand)
-
-
 def run_inv(args):
     return resolution_INV(**args)
 
 
 def call_gt_inv(temporary_dir, chr, candidate_single_SV, max_cluster_bias):
-    reads_list = load_reads(temporary_dir,chr)
     svs_list = list()
     for item in candidate_single_SV:
         svs_list.append(
@@ -270,6 +123,7 @@ def call_gt_inv(temporary_dir, chr, candidate_single_SV, max_cluster_bias):
         svs_list.append(
             (max(item[7] - max_cluster_bias / 2, 0), item[7] + max_cluster_bias / 2)
         )
+    reads_list = load_reads(temporary_dir, chr, svs_region(svs_list))
     iteration_dict, primary_num_dict, cover_dict = overlap_cover(
         svs_list, reads_list
     )  # both key(sv idx), value(set(read id))
@@ -303,7 +157,7 @@ def call_gt_inv(temporary_dir, chr, candidate_single_SV, max_cluster_bias):
                 str(assign_list[i][3]),
                 str(assign_list[i][4]),
                 str(assign_list[i][5]),
-                ",".join(candidate_single_SV[i][6]),
+                ",".join(map(str, candidate_single_SV[i][6])),
             ]
         )
     return candidate_single_SV_gt
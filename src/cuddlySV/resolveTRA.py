@@ -1,6 +1,14 @@
 import logging
+from .cluster_arrays import tra_segments
 from .Description import WorkDir
-from .genotype import cal_GL, threshold_ref_count, count_coverage
+from .alignment_file import cached_alignment_file
+from .alignment_stream import is_stream
+from .genotype import (
+    cal_GL,
+    threshold_ref_count,
+    count_coverage,
+    count_stored_coverage,
+)
 
 """
 *******************************************
@@ -26,6 +34,9 @@ from .genotype import cal_GL, threshold_ref_count, count_coverage
 			*****************************
 			"""
 
+# ALT of each breakend type for the mate position
+BND_FORMATS = {"A": "N[%s[", "B": "N]%s]", "C": "[%s[N", "D": "]%s]N"}
+
 
 def resolution_TRA(
     path:WorkDir,
@@ -37,285 +48,100 @@ def resolution_TRA(
     bam_path,
     action,
     gt_round,
+    htslib_threads=0,
+    piece=None,
 ):
-    semi_tra_cluster = list()
-    semi_tra_cluster.append([0, 0, "", "N"])
     candidate_single_SV = list()
-    #logging.info("Update A")
-    #file = open("%s%s.sigs" % (path, "TRA"), "r")
-    #for line in file:
-    for line in path.lines("TRA",chr_1,chr_2):
-        seq = line.strip("\n").split("\t")
-        if seq[1] != chr_1:
-            continue
-        if seq[4] != chr_2:
+    columns = path.signature_columns("TRA", chr_1, chr_2, piece)
+    segments = tra_segments(
+        columns["bnd_type"],
+        columns["pos_1"] - 1,
+        columns["pos_2"] - 1,
+        columns["read"],
+        read_count,
+        max_cluster_bias,
+        overlap_size,
+    )
+    read_names = columns["read_names"]
+    for i, (breakpoint_1, breakpoint_2) in enumerate(
+        zip(segments.bp_1.tolist(), segments.bp_2.tolist())
+    ):
+        members = segments.members[segments.bounds[i] : segments.bounds[i + 1]]
+        BND_type = columns["bnd_type"][members[0]].decode()
+        if BND_type not in BND_FORMATS:
             continue
+        TRA = BND_FORMATS[BND_type] % ("%s:%s" % (chr_2, breakpoint_2))
+        read_ids = set([read_names[j] for j in columns["read"][members].tolist()])
 
-        pos_1 = int(seq[3]) -1
-        pos_2 = int(seq[5]) -1
-        read_id = seq[6]
-        BND_type = seq[2]
-
-        if (
-            pos_1 - semi_tra_cluster[-1][0] > max_cluster_bias
-            or BND_type != semi_tra_cluster[-1][3]
-        ):
-            if len(semi_tra_cluster) >= read_count:
-                if semi_tra_cluster[-1][0] == semi_tra_cluster[-1][1] == 0:
-                    pass
-                else:
-                    generate_semi_tra_cluster(
-                        semi_tra_cluster,
-                        chr_1,
-                        chr_2,
-                        read_count,
-                        overlap_size,
-                        max_cluster_bias,
-                        candidate_single_SV,
-                        bam_path,
-                        action,
-                        gt_round,
-                    )
-            semi_tra_cluster = []
-            semi_tra_cluster.append([pos_1, pos_2, read_id, BND_type])
-        else:
-            if semi_tra_cluster[-1][0] == semi_tra_cluster[-1][1] == 0:
-                semi_tra_cluster = []
-                semi_tra_cluster.append([pos_1, pos_2, read_id, BND_type])
-            else:
-                semi_tra_cluster.append([pos_1, pos_2, read_id, BND_type])
-
-    if len(semi_tra_cluster) >= read_count:
-        if semi_tra_cluster[-1][0] == semi_tra_cluster[-1][1] == 0:
-            pass
-        else:
-            generate_semi_tra_cluster(
-                semi_tra_cluster,
+        if action:
+            DV, DR, GT, GL, GQ, QUAL = call_gt(
+                path,
+                bam_path,
+                breakpoint_1,
+                breakpoint_2,
                 chr_1,
                 chr_2,
-                read_count,
-                overlap_size,
+                read_ids,
                 max_cluster_bias,
-                candidate_single_SV,
-                bam_path,
-                action,
                 gt_round,
+                htslib_threads,
             )
+        else:
+            DR = "."
+            GT = "./."
+            GL = ".,.,."
+            GQ = "."
+            QUAL = "."
+        candidate_single_SV.append(
+            [
+                chr_1,
+                TRA,
+                str(breakpoint_1),
+                chr_2,
+                str(breakpoint_2),
+                str(len(read_ids)),
+                str(DR),
+                str(GT),
+                str(GL),
+                str(GQ),
+                str(QUAL),
+                str(",".join(map(str, read_ids))),
+            ]
+        )
     logging.info("Finished %s-%s:%s." % (chr_1, chr_2, "TRA/BND"))
     return candidate_single_SV
 
 
-def generate_semi_tra_cluster(
-    semi_tra_cluster,
-    chr_1,
-    chr_2,
-    read_count,
-    overlap_size,
-    max_cluster_bias,
-    candidate_single_SV,
-    bam_path,
-    action,
-    gt_round,
-):
-    BND_type = semi_tra_cluster[0][3]
-    semi_tra_cluster = sorted(semi_tra_cluster, key=lambda x: x[1])
-    read_tag = dict()
-    temp = list()
-    # p1, p2, count
-    last_len = semi_tra_cluster[0][1]
-    temp.append(
-        [semi_tra_cluster[0][0], semi_tra_cluster[0][1], [semi_tra_cluster[0][2]]]
-    )
-    read_tag[semi_tra_cluster[0][2]] = 0
-    for element in semi_tra_cluster:
-        if element[1] - last_len > max_cluster_bias:
-            temp.append([element[0], element[1], [element[2]]])
-            last_len = element[1]
-        else:
-            temp[-1][0] += element[0]
-            temp[-1][1] += element[1]
-            temp[-1][2].append(element[2])
-            last_len = element[1]
-
-        if element[2] not in read_tag:
-            read_tag[element[2]] = 0
-    if len(read_tag) < read_count:
-        return
-
-    temp = sorted(temp, key=lambda x: -len(set(x[2])))
-
-    if len(temp) > 1 and len(set(temp[1][2])) >= 0.5 * read_count:
-        if (
-            len(set(temp[0][2])) + len(set(temp[1][2]))
-            >= len(semi_tra_cluster) * overlap_size
-        ):
-            # candidate_single_SV.append("%s\tTRA\t%d\t%s\t%d\t%d\n"%(chr_1, int(temp[0][0]/temp[0][2]), chr_2, int(temp[0][1]/temp[0][2]), len(read_tag)))
-            # candidate_single_SV.append("%s\tTRA\t%d\t%s\t%d\t%d\n"%(chr_1, int(temp[1][0]/temp[1][2]), chr_2, int(temp[1][1]/temp[1][2]), len(read_tag)))
-            BND_pos_1 = "%s:%s" % (chr_2, int(temp[0][1] / len(temp[0][2])))
-            BND_pos_2 = "%s:%s" % (chr_2, int(temp[1][1] / len(temp[1][2])))
-            if BND_type == "A":
-                TRA_1 = "N[%s[" % (BND_pos_1)
-                TRA_2 = "N[%s[" % (BND_pos_2)
-            elif BND_type == "B":
-                TRA_1 = "N]%s]" % (BND_pos_1)
-                TRA_2 = "N]%s]" % (BND_pos_2)
-            elif BND_type == "C":
-                TRA_1 = "[%s[N" % (BND_pos_1)
-                TRA_2 = "[%s[N" % (BND_pos_2)
-            elif BND_type == "D":
-                TRA_1 = "]%s]N" % (BND_pos_1)
-                TRA_2 = "]%s]N" % (BND_pos_2)
-            else:
-                return
-
-            if action:
-
-                # time_start = time.time()
-                DV, DR, GT, GL, GQ, QUAL = call_gt(
-                    bam_path,
-                    int(temp[0][0] / len(temp[0][2])),
-                    int(temp[0][1] / len(temp[0][2])),
-                    chr_1,
-                    chr_2,
-                    set(temp[0][2]),
-                    max_cluster_bias,
-                    gt_round,
-                )
-                # cost_time = time.time() - time_start
-                # print("BND", chr_1, chr_2, int(temp[0][0]/len(temp[0][2])), int(temp[0][1]/len(temp[0][2])), DR, DV, QUAL, "%.4f"%cost_time)
-            else:
-                DR = "."
-                GT = "./."
-                GL = ".,.,."
-                GQ = "."
-                QUAL = "."
-            candidate_single_SV.append(
-                [
-                    chr_1,
-                    TRA_1,
-                    str(int(temp[0][0] / len(temp[0][2]))),
-                    chr_2,
-                    str(int(temp[0][1] / len(temp[0][2]))), 
-                    str(len(set(temp[0][2]))),
-                    str(DR),
-                    str(GT),
-                    str(GL),
-                    str(GQ),
-                    str(QUAL),
-                    str(",".join(set(temp[0][2]))),
-                ]
-            )
-
-            if action:
-
-                # time_start = time.time()
-                DV, DR, GT, GL, GQ, QUAL = call_gt(
-                    bam_path,
-                    int(temp[1][0] / len(temp[1][2])),
-                    int(temp[1][1] / len(temp[1][2])),
-                    chr_1,
-                    chr_2,
-                    set(temp[1][2]),
-                    max_cluster_bias,
-                    gt_round,
-                )
-                # cost_time = time.time() - time_start
-                # print("BND", chr_1, chr_2, int(temp[1][0]/len(temp[1][2])), int(temp[1][1]/len(temp[1][2])), DR, DV, QUAL, "%.4f"%cost_time)
-            else:
-                DR = "."
-                GT = "./."
-                GL = ".,.,."
-                GQ = "."
-                QUAL = "."
-            candidate_single_SV.append(
-                [
-                    chr_1,
-                    TRA_2,
-                    str(int(temp[1][0] / len(temp[1][2]))),
-                    chr_2,
-                    str(int(temp[1][1] / len(temp[1][2]))),
-                    str(len(set(temp[1][2]))),
-                    str(DR),
-                    str(GT),
-                    str(GL),
-                    str(GQ),
-                    str(QUAL),
-                    str(",".join(set(temp[1][2]))),
-                ]
-            )
-    else:
-        if len(set(temp[0][2])) >= len(semi_tra_cluster) * overlap_size:
-            # print("%s\tTRA\t%d\t%s\t%d\t%d"%(chr_1, int(temp[0][0]/temp[0][2]), chr_2, int(temp[0][1]/temp[0][2]), len(read_tag)))
-            # candidate_single_SV.append("%s\tTRA\t%d\t%s\t%d\t%d\n"%(chr_1, int(temp[0][0]/temp[0][2]), chr_2, int(temp[0][1]/temp[0][2]), len(read_tag)))
-            BND_pos = "%s:%s" % (chr_2, int(temp[0][1] / len(temp[0][2])))
-            if BND_type == "A":
-                TRA = "N[%s[" % (BND_pos)
-            elif BND_type == "B":
-                TRA = "N]%s]" % (BND_pos)
-            elif BND_type == "C":
-                TRA = "[%s[N" % (BND_pos)
-            elif BND_type == "D":
-                TRA = "]%s]N" % (BND_pos)
-            else:
-                return
-
-            if action:
-
-                # time_start = time.time()
-                DV, DR, GT, GL, GQ, QUAL = call_gt(
-                    bam_path,
-                    int(temp[0][0] / len(temp[0][2])),
-                    int(temp[0][1] / len(temp[0][2])),
-                    chr_1,
-                    chr_2,
-                    set(temp[0][2]),
-                    max_cluster_bias,
-                    gt_round,
-                )
-                # cost_time = time.time() - time_start
-                # print("BND", chr_1, chr_2, int(temp[0][0]/len(temp[0][2])), int(temp[0][1]/len(temp[0][2])), DR, DV, QUAL, "%.4f"%cost_time)
-            else:
-                DR = "."
-                GT = "./."
-                GL = ".,.,."
-                GQ = "."
-                QUAL = "."
-            candidate_single_SV.append(
-                [
-                    chr_1,
-                    TRA,
-                    str(int(temp[0][0] / len(temp[0][2]))),
-                    chr_2,
-                    str(int(temp[0][1] / len(temp[0][2]))),
-                    str(len(set(temp[0][2]))),
-                    str(DR),
-                    str(GT),
-                    str(GL),
-                    str(GQ),
-                    str(QUAL),
-                    str(",".join(set(temp[0][2]))),
-                ]
-            )
-
-
 def run_tra(args):
     return resolution_TRA(**args)
 
 
 def call_gt(
-    bam_path, pos_1, pos_2, chr_1, chr_2, read_id_list, max_cluster_bias, gt_round
+    path: WorkDir,
+    bam_path,
+    pos_1,
+    pos_2,
+    chr_1,
+    chr_2,
+    read_id_list,
+    max_cluster_bias,
+    gt_round,
+    htslib_threads=0,
 ):
-    import pysam
-
-    bamfile = pysam.AlignmentFile(bam_path)
+    if is_stream(bam_path):
+        # Streamed alignments can not be fetched again, count the stored ones
+        alignments, coverage = path, count_stored_coverage
+    else:
+        alignments = cached_alignment_file(bam_path, htslib_threads)
+        coverage = count_coverage
     querydata = set()
     search_start = max(int(pos_1) - max_cluster_bias, 0)
-    search_end = min(int(pos_1) + max_cluster_bias, bamfile.get_reference_length(chr_1))
+    search_end = search_limit(alignments, chr_1, int(pos_1) + max_cluster_bias)
 
     up_bound = threshold_ref_count(len(read_id_list))
 
-    status = count_coverage(
-        chr_1, search_start, search_end, bamfile, querydata, up_bound, gt_round
+    status = coverage(
+        chr_1, search_start, search_end, alignments, querydata, up_bound, gt_round
     )
 
     if status == -1:
@@ -334,11 +160,9 @@ def call_gt(
 
     else:
         search_start = max(int(pos_2) - max_cluster_bias, 0)
-        search_end = min(
-            int(pos_2) + max_cluster_bias, bamfile.get_reference_length(chr_2)
-        )
-        status_2 = count_coverage(
-            chr_2, search_start, search_end, bamfile, querydata, up_bound, gt_round
+        search_end = search_limit(alignments, chr_2, int(pos_2) + max_cluster_bias)
+        status_2 = coverage(
+            chr_2, search_start, search_end, alignments, querydata, up_bound, gt_round
         )
         # status_2 judgement
         DR = 0
@@ -347,5 +171,12 @@ def call_gt(
                 DR += 1
         GT, GL, GQ, QUAL = cal_GL(DR, len(read_id_list))
 
-    bamfile.close()
     return len(read_id_list), DR, GT, GL, GQ, QUAL
+
+
+def search_limit(alignments, chrom: str, end: int) -> int:
+    "End of the search region within the reference of an alignment file"
+    if isinstance(alignments, WorkDir):
+        # The stored alignments end within the reference
+        return end
+    return min(end, alignments.get_reference_length(chrom))
@@ -0,0 +1,437 @@
+"""Sorted signature shards of the work directory.
+
+Each signature collection task writes its signatures of each type to a shard file
+signatures/_{chrom}_{start}_{end}.{TYPE}.sigs, deduplicated and sorted in the order of
+the merged TYPE.sigs files. The byte ranges of each chromosome (or chromosome pair for
+TRA) in the shards are collected to the shard index signatures.idx of the work
+directory, so that the signatures of a chromosome can be read by merging its shards
+without a genome wide sort.
+
+The order is the one of GNU sort with LC_ALL=C: the sort keys of the signature type
+followed by the whole line.
+
+Shards with names ending in .gz are BGZF compressed and their ranges are BGZF virtual
+offsets, like in a tabix index.
+
+Work directories with genome wide merged TYPE.sigs(.gz) files get a sidecar index
+TYPE.sigs(.gz).idx in the same format when they are first indexed.
+"""
+import heapq
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pysam.libcbgzf import BGZFile
+
+SIGNATURE_TYPES = ("DEL", "DUP", "INS", "INV", "TRA")
+SHARD_INDEX = "signatures.idx"
+SIDECAR_SUFFIX = ".idx"
+COMPRESSED_SUFFIX = ".gz"
+# Signature lines buffered by a task before spilling them to sorted runs
+SPILL_LINES = 1 << 18
+# Typical ratio of the uncompressed and compressed sizes of signature lines
+BGZF_RATIO = 4
+
+# Chromosome, or chromosome pair for TRA
+ChromKey = Union[str, Tuple[str, str]]
+# (svtype, chromosome key, shard file name, start byte, end byte)
+ShardEntry = Tuple[str, ChromKey, str, int, int]
+
+
+def _indel_key(line: str):
+    # sort -k 2,2 -k 3,3n
+    seq = line.split("\t", 3)
+    return (seq[1], int(seq[2]), line.rstrip("\n"))
+
+
+def _inv_key(line: str):
+    # sort -k 2,2 -k 3,3 -k 4,4n
+    seq = line.split("\t", 4)
+    return (seq[1], seq[2], int(seq[3]), line.rstrip("\n"))
+
+
+def _tra_key(line: str):
+    # sort -k 2,2 -k 5,5 -k 3,3 -k 4,4n
+    seq = line.split("\t", 5)
+    return (seq[1], seq[4], seq[2], int(seq[3]), line.rstrip("\n"))
+
+
+SORT_KEYS: Dict[str, Callable[[str], tuple]] = {
+    "DEL": _indel_key,
+    "INS": _indel_key,
+    # sort -k 1,1r -k 2,2 -k 3,4n on lines of single type
+    "DUP": _indel_key,
+    "INV": _inv_key,
+    "TRA": _tra_key,
+}
+
+
+def _indel_position(line: str):
+    # sort -k 2,2 -k 3,4n --unique, the number of field 3
+    seq = line.split("\t", 3)
+    return (seq[1], int(seq[2]))
+
+
+def _inv_position(line: str):
+    # sort -k 2,2 -k 3,3 -k 4,5n --unique, the number of field 4
+    seq = line.split("\t", 4)
+    return (seq[1], seq[2], int(seq[3]))
+
+
+def _tra_position(line: str):
+    # sort -k 2,2 -k 5,5 -k 3,3 -k 4,4n -k 6,6n --unique
+    seq = line.split("\t", 6)
+    return (seq[1], seq[4], seq[2], int(seq[3]), int(seq[5]))
+
+
+# Fields of the lines deduplicated by the key based --unique sorts of the somatic
+# scripts. Lines with equal keys are adjacent in the SORT_KEYS order, the first is kept.
+UNIQUE_KEYS: Dict[str, Callable[[str], tuple]] = {
+    "DEL": _indel_position,
+    "INS": _indel_position,
+    "DUP": _indel_position,
+    "INV": _inv_position,
+    "TRA": _tra_position,
+}
+
+
+# Column of the read ID in the signature lines of each type
+READ_ID_FIELD = {"DEL": 4, "DUP": 4, "INS": 4, "INV": 5, "TRA": 6}
+
+
+def chrom_key(svtype: str, line: str) -> ChromKey:
+    "Return the chromosome (pair for TRA) of a signature or reads line"
+    seq = line.split("\t", 5)
+    if svtype == "TRA":
+        return seq[1], seq[4]
+    if svtype == "reads":
+        return seq[0]
+    return seq[1]
+
+
+def open_shard(path: Path, mode: str):
+    "Open a shard for binary I/O, BGZF compressed if the name ends with .gz"
+    if path.name.endswith(COMPRESSED_SUFFIX):
+        return BGZFile(str(path), mode)
+    return open(path, mode)
+
+
+def shard_offsets(path: Path) -> Iterator[Tuple[int, int, bytes]]:
+    "Generate the lines of a whole shard with their start and end offsets"
+    if path.name.endswith(COMPRESSED_SUFFIX):
+        with BGZFile(str(path), "rb") as f:
+            while True:
+                start = f.tell()
+                line = f.readline()
+                if line == b"":
+                    return
+                # BGZFile.readline drops the newline
+                yield start, f.tell(), line + b"\n"
+    else:
+        start = 0
+        with open(path, "rb") as f:
+            for line in f:
+                yield start, start + len(line), line
+                start += len(line)
+
+
+def write_shard(path: Path, svtype: str, lines: Iterable[str]) -> List[ShardEntry]:
+    """Write lines to a shard, BGZF compressed if the name ends with .gz.
+
+    Args:
+        path (Path): The shard file.
+        svtype (str): Signature type of the lines, or "reads".
+        lines (Iterable[str]): Lines sorted by chromosome key.
+
+    Returns:
+        List[ShardEntry]: Ranges of the chromosome keys in the shard.
+    """
+    entries = list()
+    prev_key = None
+    with open_shard(path, "wb") as shard:
+        for line in lines:
+            key = chrom_key(svtype, line)
+            if key != prev_key:
+                offset = shard.tell()
+                if len(entries) > 0:
+                    entries[-1][4] = offset
+                entries.append([svtype, key, path.name, offset, offset])
+                prev_key = key
+            shard.write(line.encode())
+        if len(entries) > 0:
+            entries[-1][4] = shard.tell()
+    return [tuple(i) for i in entries]
+
+
+def merge_unique(
+    runs: Iterable[Iterable[str]],
+    key: Callable[[str], tuple],
+    unique_key: Optional[Callable[[str], tuple]] = None,
+) -> Iterator[str]:
+    """K-way merge of sorted runs of lines dropping duplicate lines.
+
+    Args:
+        runs (Iterable[Iterable[str]]): Runs of lines sorted by key.
+        key (Callable[[str], tuple]): Sort key of a line.
+        unique_key (Optional[Callable[[str], tuple]]): Drop lines with the unique_key
+            of the previous line, like sort --unique, instead of identical lines. Lines
+            with equal unique_key must be adjacent in key order.
+
+    Yields:
+        Iterator[str]: Unique lines in key order.
+    """
+    if unique_key is None:
+        unique_key = str
+    prev = None
+    for line in heapq.merge(*runs, key=key):
+        line_key = unique_key(line)
+        if line_key != prev:
+            yield line
+            prev = line_key
+
+
+class ShardWriter:
+    """Sorted and deduplicated shards of a task written while its signatures are
+    collected.
+
+    The lines are buffered in sets by type. When the buffers hold spill_lines lines,
+    each type is written to a sorted run signatures/{prefix}.{TYPE}.sigs.run{n}, and the
+    runs are merged to the shards when the writer is closed. The memory of a task is
+    then bounded by spill_lines regardless of the length and depth of its region.
+    """
+
+    def __init__(
+        self,
+        signatures_path: Path,
+        shard_prefix: str,
+        compress=False,
+        spill_lines: int = SPILL_LINES,
+    ):
+        self.signatures_path = signatures_path
+        self.shard_prefix = shard_prefix
+        self.compress = compress
+        self.spill_lines = spill_lines
+        self.buffers: Dict[str, set] = dict()
+        self.buffered = 0
+        self.runs: Dict[str, List[Path]] = dict()
+        # Lines added by type, including duplicates
+        self.counts: Dict[str, int] = dict()
+
+    def add(self, line: str):
+        "Add a signature line of any type"
+        svtype = line.split("\t", 1)[0]
+        self.counts[svtype] = self.counts.get(svtype, 0) + 1
+        buffer = self.buffers.setdefault(svtype, set())
+        if line not in buffer:
+            buffer.add(line)
+            self.buffered += 1
+            if self.buffered >= self.spill_lines:
+                self.spill()
+
+    def spill(self):
+        "Write the buffered lines of each type to a sorted run"
+        for svtype, buffer in self.buffers.items():
+            runs = self.runs.setdefault(svtype, list())
+            run_path = self.signatures_path / (
+                "%s.%s.sigs.run%d" % (self.shard_prefix, svtype, len(runs))
+            )
+            with open(run_path, "wt") as run:
+                run.writelines(sorted(buffer, key=SORT_KEYS[svtype]))
+            runs.append(run_path)
+        self.buffers = dict()
+        self.buffered = 0
+
+    def close(self) -> List[ShardEntry]:
+        """Write the shards and remove the runs.
+
+        Returns:
+            List[ShardEntry]: Ranges of chromosomes in the written shards.
+        """
+        entries = list()
+        suffix = COMPRESSED_SUFFIX if self.compress else ""
+        for svtype in self.counts:
+            key = SORT_KEYS[svtype]
+            runs = [open(run_path, "rt") for run_path in self.runs.get(svtype, ())]
+            shard_path = self.signatures_path / (
+                "%s.%s.sigs%s" % (self.shard_prefix, svtype, suffix)
+            )
+            buffered = sorted(self.buffers.get(svtype, ()), key=key)
+            try:
+                entries += write_shard(
+                    shard_path, svtype, merge_unique(runs + [buffered], key)
+                )
+            finally:
+                for run in runs:
+                    run.close()
+            for run_path in self.runs.get(svtype, ()):
+                run_path.unlink()
+        self.buffers = dict()
+        self.runs = dict()
+        return entries
+
+
+def write_shards(
+    signatures_path: Path, shard_prefix: str, lines: Iterable[str], compress=False
+) -> List[ShardEntry]:
+    """Write signature lines of a task to sorted and deduplicated shards by type.
+
+    Args:
+        signatures_path (Path): The signatures/ directory of the work dir.
+        shard_prefix (str): Name of the task, e.g. _chr1_0_10000
+        lines (Iterable[str]): Signature lines of any type.
+        compress (bool): Write BGZF compressed shards.
+
+    Returns:
+        List[ShardEntry]: Ranges of chromosomes in the written shards.
+    """
+    writer = ShardWriter(signatures_path, shard_prefix, compress)
+    for line in lines:
+        writer.add(line)
+    return writer.close()
+
+
+def remap_read_ids(
+    svtype: str, lines: Iterable[str], remap: Dict[int, int]
+) -> Iterator[str]:
+    """Replace the integer read IDs of sorted signature lines found in remap.
+
+    The IDs order the lines with equal sort keys, so each run of them is sorted again
+    if any of its IDs changed.
+    """
+    key = SORT_KEYS[svtype]
+    field = READ_ID_FIELD[svtype]
+    run: List[str] = list()
+    run_key = None
+    changed = False
+    for line in lines:
+        line_key = key(line)[:-1]
+        if line_key != run_key:
+            yield from sorted(run, key=key) if changed else run
+            run = list()
+            run_key = line_key
+            changed = False
+        seq = line.rstrip("\n").split("\t")
+        if seq[field].isdigit() and int(seq[field]) in remap:
+            seq[field] = str(remap[int(seq[field])])
+            line = "\t".join(seq) + "\n"
+            changed = True
+        run.append(line)
+    yield from sorted(run, key=key) if changed else run
+
+
+def remap_shard(
+    path: Path, remapped_path: Path, entries: List[ShardEntry], remap: Dict[int, int]
+) -> List[ShardEntry]:
+    """Write the lines of the entries of a shard to remapped_path with the read IDs of
+    remap, see remap_read_ids.
+
+    Returns:
+        List[ShardEntry]: Ranges of the chromosome keys in the written shard.
+    """
+    svtype = entries[0][0]
+    lines = (
+        line
+        for entry in sorted(entries, key=lambda x: x[3])
+        for line in shard_lines(path, entry[3], entry[4])
+    )
+    return write_shard(remapped_path, svtype, remap_read_ids(svtype, lines, remap))
+
+
+def write_shard_index(path: Path, entries: Iterable[ShardEntry]):
+    """Write shard index of the work directory.
+
+    The index lists one range per line: svtype, shard, start, end, chrom[, chrom2]
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wt") as index:
+        for svtype, key, shard_name, start, end in sorted(
+            entries, key=lambda x: (x[0], x[2])
+        ):
+            chroms = "\t".join(key) if isinstance(key, tuple) else key
+            index.write(
+                "%s\t%s\t%d\t%d\t%s\n" % (svtype, shard_name, start, end, chroms)
+            )
+    tmp_path.replace(path)
+
+
+def read_shard_index(
+    path: Path,
+) -> Dict[str, Dict[ChromKey, List[Tuple[str, int, int]]]]:
+    """Read shard index of the work directory.
+
+    Returns:
+        Dict[str, Dict[ChromKey, List[Tuple[str, int, int]]]]: From svtype and
+            chromosome key to shard names and byte ranges, in order of shard names.
+    """
+    index: Dict[str, Dict[ChromKey, List[Tuple[str, int, int]]]] = dict()
+    with open(path, "rt") as f:
+        for line in f:
+            seq = line.rstrip("\n").split("\t")
+            key = seq[4] if len(seq) == 5 else (seq[4], seq[5])
+            index.setdefault(seq[0], dict()).setdefault(key, list()).append(
+                (seq[1], int(seq[2]), int(seq[3]))
+            )
+    return index
+
+
+def index_sigs_file(path: Path, svtype: str) -> List[ShardEntry]:
+    """Find the ranges of consecutive lines of each chromosome key in a .sigs file.
+
+    Args:
+        path (Path): Merged signature file TYPE.sigs(.gz), or reads.sigs(.gz).
+        svtype (str): Signature type, or "reads".
+
+    Returns:
+        List[ShardEntry]: Ranges in file order. A key can have several ranges if its
+            lines are not consecutive.
+    """
+    entries = list()
+    prev_key = None
+    for start, end, line in shard_offsets(path):
+        seq = line.split(b"\t", 5)
+        if svtype == "reads":
+            key = seq[0].decode()
+        elif svtype == "TRA":
+            key = seq[1].decode(), seq[4].decode()
+        else:
+            key = seq[1].decode()
+        if key != prev_key:
+            entries.append([svtype, key, path.name, start, start])
+            prev_key = key
+        entries[-1][4] = end
+    return [tuple(i) for i in entries]
+
+
+def range_bytes(name: str, start: int, end: int) -> int:
+    """Uncompressed size of the range [start, end) of a shard.
+
+    The ranges of BGZF shards are virtual offsets. Their size is an estimate of the
+    uncompressed bytes: the compressed bytes between the blocks of start and end times
+    BGZF_RATIO, plus the difference of the offsets within the blocks.
+    """
+    if name.endswith(COMPRESSED_SUFFIX):
+        compressed = (end >> 16) - (start >> 16)
+        return max(compressed * BGZF_RATIO + (end & 0xFFFF) - (start & 0xFFFF), 0)
+    return end - start
+
+
+def shard_lines(path: Path, start: int, end: int) -> Iterator[str]:
+    "Generate the lines in range [start, end) of a shard"
+    if path.name.endswith(COMPRESSED_SUFFIX):
+        with BGZFile(str(path), "rb") as f:
+            f.seek(start)
+            while f.tell() < end:
+                line = f.readline()
+                if line == b"":
+                    raise EOFError("Shard %s ended before offset %d." % (str(path), end))
+                yield line.decode() + "\n"
+        return
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        for line in f:
+            if remaining <= 0:
+                break
+            remaining -= len(line)
+            yield line.decode()
+    if remaining > 0:
+        raise EOFError("Shard %s ended before byte %d." % (str(path), end))
@@ -1,14 +1,31 @@
 from collections import namedtuple
-from typing import List
-import cigar
+from functools import lru_cache
+import re
+from typing import List, Tuple, Union
 
 SplitRead = namedtuple(
     "SplitRead", ["read_start", "read_end", "ref_start", "ref_end", "chrom", "strand"]
 )
 
+SupplementaryAlignment = namedtuple(
+    "SupplementaryAlignment",
+    [
+        "chrom",
+        "start",  # 1-based, as in the SA tag
+        "strand",
+        "mapq",
+        "clip_left",  # soft clipped bases
+        "clip_right",
+        "ref_span",  # reference bases in M, D, = and X operations
+        "ref_length",  # reference bases in M, D, N, = and X operations
+    ],
+)
+
+CIGAR_PATTERN = re.compile(r"(\d+)([MIDNSHP=X])")
+
 
 def acquire_clip_pos(deal_cigar):
-    seq = list(cigar.Cigar(deal_cigar).items())
+    seq = [(int(length), op) for length, op in CIGAR_PATTERN.findall(deal_cigar)]
     if seq[0][1] == "S":
         first_pos = seq[0][0]
     else:
@@ -19,15 +36,45 @@ def acquire_clip_pos(deal_cigar):
         last_pos = 0
 
     ref_span = 0
-    for i in seq:
-        if i[1] == "M" or i[1] == "D" or i[1] == "=" or i[1] == "X":
-            ref_span += i[0]
-    return [first_pos, last_pos, ref_span]
+    ref_skip = 0
+    for length, op in seq:
+        if op == "M" or op == "D" or op == "=" or op == "X":
+            ref_span += length
+        elif op == "N":
+            ref_skip += length
+    return [first_pos, last_pos, ref_span, ref_span + ref_skip]
+
+
+@lru_cache(maxsize=16384)
+def decode_sa_entry(sa_entry: str) -> SupplementaryAlignment:
+    "Decode one 'rname,pos,strand,CIGAR,mapQ,NM' entry of an SA tag"
+    seq = sa_entry.split(",")
+    first_pos, last_pos, ref_span, ref_length = acquire_clip_pos(seq[3])
+    return SupplementaryAlignment(
+        seq[0],
+        int(seq[1]),
+        seq[2],
+        int(seq[4]),
+        first_pos,
+        last_pos,
+        ref_span,
+        ref_length,
+    )
+
+
+@lru_cache(maxsize=4096)
+def decode_sa_tag(sa_tag: str) -> Tuple[SupplementaryAlignment, ...]:
+    """Decode the SA tag of an alignment.
+
+    Segments of a chimeric read carry overlapping SA tags so both the whole tag and the
+    individual entries are cached. The trailing ';' of the tag is optional.
+    """
+    return tuple(decode_sa_entry(i) for i in sa_tag.rstrip(";").split(";") if i)
 
 
 def organize_split_signal(
     primary_info,
-    Supplementary_info,
+    Supplementary_info: List[Union[SupplementaryAlignment, str]],
     total_L,
     SV_size,
     min_mapq,
@@ -42,35 +89,30 @@ def organize_split_signal(
         split_read.append(SplitRead(*primary_info))
         min_mapq = 0
     for i in Supplementary_info:
-        seq = i.split(",")
-        local_chr = seq[0]
-        local_start = int(seq[1])
-        local_cigar = seq[3]
-        local_strand = seq[2]
-        local_mapq = int(seq[4])
-        if local_mapq >= min_mapq:
+        if isinstance(i, str):
+            i = decode_sa_entry(i)
+        if i.mapq >= min_mapq:
             # if local_mapq >= 0:
-            first_pos, last_pos, ref_span = acquire_clip_pos(local_cigar)
-            if local_strand == "+":
+            if i.strand == "+":
                 split_read.append(
                     SplitRead(
-                        first_pos,
-                        total_L - last_pos,
-                        local_start,
-                        local_start + ref_span - 1,
-                        local_chr,
-                        local_strand,
+                        i.clip_left,
+                        total_L - i.clip_right,
+                        i.start,
+                        i.start + i.ref_span - 1,
+                        i.chrom,
+                        i.strand,
                     )
                 )
             else:
                 split_read.append(
                     SplitRead(
-                        last_pos,
-                        total_L - first_pos,
-                        local_start,
-                        local_start + ref_span - 1,
-                        local_chr,
-                        local_strand,
+                        i.clip_right,
+                        total_L - i.clip_left,
+                        i.start,
+                        i.start + i.ref_span - 1,
+                        i.chrom,
+                        i.strand,
                     )
                 )
     if len(split_read) <= max_split_parts or max_split_parts == -1:
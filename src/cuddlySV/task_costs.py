@@ -0,0 +1,95 @@
+"""Estimated costs of the clustering tasks.
+
+main_ctrl submits the clustering tasks largest first (see worker_pool.run_largest_first)
+so that a large chromosome does not finish long after the rest. The cost of a task is
+the size of the signature lines of its chromosome, from the byte ranges of the work
+directory index, plus READ_COST for each alignment on the chromosome when the calls are
+genotyped from the reads. A piece of a chromosome (see cluster_arrays.clustering_pieces)
+gets the share of its signatures.
+
+The costs are in bytes of signature lines. After the stage the seconds per byte are
+fitted to the task times, and the predicted and actual times of the slowest tasks are
+logged, those of all tasks with --verbose.
+"""
+import logging
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from .metrics import SLOWEST_TASKS
+
+# Cost of genotyping with one alignment, in bytes of signature lines
+READ_COST = 32
+# Bytes of a line of reads.sigs, for work directories without the reads store
+READ_LINE_BYTES = 64
+
+ChromKey = Union[str, Tuple[str, str]]
+
+
+def read_counts(work_dir) -> Dict[str, float]:
+    "Number of alignments on each chromosome, estimated from reads.sigs without store"
+    if work_dir.reads_stored:
+        return work_dir.read_counts()
+    return {
+        chrom: work_dir.signature_bytes("reads", chrom) / READ_LINE_BYTES
+        for chrom in work_dir.idx.get("reads.sigs", {})
+    }
+
+
+def clustering_cost(
+    work_dir,
+    svtype: str,
+    key: ChromKey,
+    piece: Optional[Tuple[int, int]] = None,
+    reads: Optional[Dict[str, float]] = None,
+) -> float:
+    """Estimate the cost of clustering the signatures of a chromosome key.
+
+    Args:
+        piece (Optional[Tuple[int, int]]): Index range of the clustered signatures,
+            None for all.
+        reads (Optional[Dict[str, float]]): Alignments on each chromosome if the calls
+            are genotyped, see read_counts.
+    """
+    keys = key if isinstance(key, tuple) else (key,)
+    cost = float(work_dir.signature_bytes(svtype, *keys))
+    if reads is not None:
+        cost += READ_COST * reads.get(keys[0], 0)
+    if piece is not None:
+        count = work_dir.column_dir(svtype, *keys)[1]
+        cost *= (piece[1] - piece[0]) / max(count, 1)
+    return cost
+
+
+def task_label(svtype: str, key: ChromKey, piece: Optional[Tuple[int, int]]) -> str:
+    "Name of a clustering task in the log"
+    label = "%s %s" % (svtype, key if isinstance(key, str) else "-".join(key))
+    if piece is not None:
+        label += " [%d:%d]" % piece
+    return label
+
+
+def log_task_times(
+    labels: Sequence[str], costs: Sequence[float], seconds: Sequence[float]
+):
+    "Fit the seconds per cost to the task times and log predicted and actual times"
+    total = sum(seconds)
+    total_cost = sum(costs)
+    if total <= 0 or total_cost <= 0:
+        return
+    rate = total / total_cost
+    error = sum(abs(cost * rate - s) for cost, s in zip(costs, seconds))
+    logging.info(
+        "Clustering tasks took %.2f s of worker time, %.3g s per estimated cost. "
+        "The estimates were off by %.0f%% of the worker time.",
+        total,
+        rate,
+        100 * error / total,
+    )
+    slowest = sorted(range(len(seconds)), key=lambda i: -seconds[i])
+    for rank, i in enumerate(slowest):
+        logging.log(
+            logging.INFO if rank < SLOWEST_TASKS else logging.DEBUG,
+            "Task %s predicted %.2f s, took %.2f s.",
+            labels[i],
+            costs[i] * rate,
+            seconds[i],
+        )
@@ -0,0 +1,102 @@
+"""Splitting of the thread budget between workers and htslib decompression threads.
+
+Each stage that reads alignments runs workers, processes or threads, and each worker
+opens the alignment file with a pool of htslib threads decompressing it. A stage with a
+budget of threads runs budget // (1 + htslib threads) workers, at least one.
+
+The htslib threads of each worker are --htslib_threads, or chosen by the input format
+and the stage in the automatic mode. Only the stages that mostly read alignments get
+pools, and only with at least AUTO_MIN_THREADS threads. CRAM decoding is comparable to
+the parsing of the alignments in Python, so the workers get a pool of AUTO_POOL threads.
+BAM decompression is cheap compared to the parsing, except for the stages whose workers
+are threads of one process holding the GIL while parsing. SAM and streamed input get no
+pools.
+"""
+import argparse
+import logging
+from collections import namedtuple
+from typing import Dict, Union
+
+AUTO = "auto"
+AUTO_POOL = 2
+AUTO_MIN_THREADS = 6
+
+ThreadSplit = namedtuple("ThreadSplit", ("workers", "htslib_threads"))
+StageKind = namedtuple("StageKind", ("reads_mostly", "threaded"))
+# Stages reading alignments: whether reading the alignments is most of their work and
+# whether their workers are threads of one process
+STAGES: Dict[str, StageKind] = {
+    "signatures": StageKind(reads_mostly=True, threaded=False),
+    # Clustering, with genotyping of translocations from the alignments
+    "genotype": StageKind(reads_mostly=False, threaded=False),
+    "mapping_tags": StageKind(reads_mostly=True, threaded=True),
+}
+
+
+def htslib_threads_arg(value: str) -> Union[str, int]:
+    "Parse --htslib_threads: 'auto' or the size of the htslib thread pool"
+    if value == AUTO:
+        return AUTO
+    try:
+        threads = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected 'auto' or integer: %s" % value)
+    if threads < 0 or threads == 1:
+        # pysam decodes in the calling thread unless the pool has several threads
+        raise argparse.ArgumentTypeError("htslib thread pool is 0 or at least 2 threads")
+    return threads
+
+
+def alignment_format(path: str) -> str:
+    "Return CRAM, BAM or SAM by the magic bytes of the file, STREAM for standard input"
+    if path == "-":
+        return "STREAM"
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(4)
+    except OSError:
+        # Remote files
+        magic = path.lower().rsplit(".", 1)[-1].encode()
+    if magic.upper() == b"CRAM":
+        return "CRAM"
+    if magic[:2] == b"\x1f\x8b" or magic == b"bam":
+        # BGZF
+        return "BAM"
+    return "SAM"
+
+
+def auto_htslib_threads(input_format: str, stage: str, threads: int) -> int:
+    "Size of the htslib thread pool of each worker in the automatic mode"
+    kind = STAGES[stage]
+    if threads < AUTO_MIN_THREADS or not kind.reads_mostly:
+        return 0
+    if input_format == "CRAM" or (input_format == "BAM" and kind.threaded):
+        return AUTO_POOL
+    return 0
+
+
+def split_threads(
+    threads: int, htslib_threads: Union[str, int], path: str, stage: str
+) -> ThreadSplit:
+    """Split the threads of a stage to workers and the htslib threads of each.
+
+    Args:
+        threads (int): Threads of the stage, --threads.
+        htslib_threads (Union[str, int]): --htslib_threads, 'auto' or pool size.
+        path (str): Alignment file.
+        stage (str): One of STAGES.
+
+    Returns:
+        ThreadSplit: Number of workers and the htslib threads of each.
+    """
+    threads = max(int(threads), 1)
+    if htslib_threads == AUTO:
+        htslib_threads = auto_htslib_threads(alignment_format(path), stage, threads)
+    workers = max(threads // (1 + htslib_threads), 1)
+    logging.info(
+        "Using %d workers with %d htslib threads each for %s.",
+        workers,
+        htslib_threads,
+        stage,
+    )
+    return ThreadSplit(workers, htslib_threads)
@@ -0,0 +1,138 @@
+"""Worker pool shared by the stages of a run.
+
+main_ctrl starts one pool of worker processes for the whole run: signature collection,
+the columnar store, clustering and force calling submit their tasks to it. The workers
+are started by a fork server, or spawned where there is none, so that they do not
+inherit the heap of the main process. The fork server imports cuddlySV before forking,
+so starting a worker does not import it again.
+
+Each stage submits (function, argument) tasks with run_tasks, which keeps at most the
+workers of the stage busy, e.g. fewer than the pool has when the workers of the stage
+run htslib threads, and yields the results as the tasks finish. The arguments should
+be small: work directories are pickled by their path (see WorkDir.__reduce__).
+Stages with estimates of the costs of their tasks submit them largest first with
+run_largest_first, so that a large task is not left running alone at the end.
+"""
+import contextlib
+import logging
+import multiprocessing
+import queue
+import time
+from multiprocessing.pool import Pool
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Imported by the fork server before forking the workers
+PRELOAD = ["cuddlySV.cuddlySV"]
+
+Task = Tuple[Callable, Any]
+
+
+def start_pool(processes: int, verbose: bool = False) -> Pool:
+    "Start a pool of processes not forked from the main process"
+    # Description imports the columnar store, which runs its tasks in the pool
+    from .Description import setupLogging
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(PRELOAD)
+    else:
+        context = multiprocessing.get_context("spawn")
+    return context.Pool(
+        processes=max(int(processes), 1),
+        initializer=setupLogging,
+        initargs=(verbose,),
+    )
+
+
+@contextlib.contextmanager
+def task_pool(pool: Optional[Pool], processes: int, verbose: bool = False):
+    "Yield pool, or a pool started for the block if pool is None"
+    if pool is not None:
+        yield pool
+        return
+    with start_pool(processes, verbose) as own_pool:
+        yield own_pool
+
+
+def run_tasks(
+    pool: Pool, tasks: Iterable[Task], workers: Optional[int] = None
+) -> Iterator[Tuple[int, Any]]:
+    """Run tasks in the pool, yielding their results as they finish.
+
+    Args:
+        pool (Pool): The worker pool.
+        tasks (Iterable[Task]): Functions and their single arguments. The tasks are
+            submitted when there is a free worker, so they can be generated lazily.
+        workers (Optional[int]): Maximum number of tasks running at a time. None for
+            the size of the pool.
+
+    Raises:
+        Exception: The first exception raised by a task.
+
+    Yields:
+        Iterator[Tuple[int, Any]]: Index of the task and its result in order of
+            finishing.
+    """
+    if workers is None:
+        workers = pool._processes
+    workers = max(int(workers), 1)
+    finished: "queue.Queue[Tuple[int, Any, Optional[BaseException]]]" = queue.Queue()
+    running = 0
+    for i, (func, arg) in enumerate(tasks):
+        if running == workers:
+            yield _finished(finished.get())
+            running -= 1
+        pool.apply_async(
+            func,
+            (arg,),
+            callback=lambda result, i=i: finished.put((i, result, None)),
+            error_callback=lambda exc, i=i: finished.put((i, None, exc)),
+        )
+        running += 1
+    for _ in range(running):
+        yield _finished(finished.get())
+
+
+def timed_call(task: Task) -> Tuple[float, Any]:
+    "Run a task, returning its wall clock seconds and result"
+    func, arg = task
+    start = time.perf_counter()
+    result = func(arg)
+    return time.perf_counter() - start, result
+
+
+def run_largest_first(
+    pool: Pool,
+    tasks: List[Task],
+    costs: Sequence[float],
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[int, Any, float]]:
+    """Run tasks as run_tasks, submitting them in descending order of cost.
+
+    Args:
+        costs (Sequence[float]): Estimated cost of each task. Tasks of equal cost are
+            submitted in their order.
+
+    Yields:
+        Iterator[Tuple[int, Any, float]]: Index of the task in tasks, its result and
+            seconds in order of finishing.
+    """
+    order = sorted(range(len(tasks)), key=lambda i: -costs[i])
+    for k, (seconds, result) in run_tasks(
+        pool, ((timed_call, tasks[i]) for i in order), workers
+    ):
+        yield order[k], result, seconds
+
+
+def _finished(item: Tuple[int, Any, Optional[BaseException]]) -> Tuple[int, Any]:
+    i, result, exc = item
+    if exc is not None:
+        logging.error("Exception while multiprocessing! Exiting..")
+        raise exc
+    return i, result
+
+
+def ordered_results(results: Iterable[Tuple[int, Any]]) -> list:
+    "Collect the results of run_tasks in order of the tasks"
+    collected = dict(results)
+    return [collected[i] for i in range(len(collected))]
@@ -15,6 +15,9 @@ from typing import List, Tuple, Union
 import pysam
 from collections import namedtuple
 
+from cuddlySV.alignment_file import open_alignment_file
+from cuddlySV.thread_budget import AUTO, htslib_threads_arg, split_threads
+
 
 def parse_args(args: List[str]) -> Namespace:
     import argparse
@@ -46,6 +49,14 @@ def parse_args(args: List[str]) -> Namespace:
         default=7,
         type=int,
     )
+    parser.add_argument(
+        "--htslib_threads",
+        help="Size of the htslib thread pool decompressing alignments in each "
+        "worker, taken from --threads. 'auto' chooses by the input format "
+        "[default:%(default)s]",
+        default=AUTO,
+        type=htslib_threads_arg,
+    )
     parser.add_argument(
         "-s",
         "--min_support",
@@ -171,9 +182,17 @@ def main(argv: List[str] = sys.argv[1:]) -> int:
     tumor_name = vcf_writer.header.samples[0]
     read_group = get_read_group(input_bam)
 
-    with ThreadPoolExecutor(n_threads) as pool:
+    workers, htslib_threads = split_threads(
+        n_threads, args.htslib_threads, input_bam, "mapping_tags"
+    )
+    with ThreadPoolExecutor(workers) as pool:
         add_mq_chunk_part = partial(
-            add_mq_chunk, input_bam, input_vcf, read_group, min_support=args.min_support
+            add_mq_chunk,
+            input_bam,
+            input_vcf,
+            read_group,
+            min_support=args.min_support,
+            htslib_threads=htslib_threads,
         )
         out_records = pool.map(add_mq_chunk_part, chromosome_splits, chunksize=1)
         logging.info("Sent map")
@@ -389,6 +408,7 @@ def add_mq_chunk(
     read_group: str,
     csplit: Tuple[str, int, int],
     min_support: int = 0,
+    htslib_threads: int = 0,
 ):
     import pysam
     import logging
@@ -404,7 +424,7 @@ def add_mq_chunk(
     vcf_reader = pysam.VariantFile(input_vcf, "r")
     _add_MQ_header_info(vcf_reader)
     # Open the BAM file for reading
-    bam = pysam.AlignmentFile(input_bam, "rb")
+    bam = open_alignment_file(input_bam, htslib_threads=htslib_threads)
     mapq_fetch = None
     SLOP = 10
     contig_len = bam.header.get_reference_length(csplit.CHROM)
@@ -25,7 +25,6 @@ $0 -o OUTPATH/  -n INPATH2/ [INPATHx/..]
 
 }
 declare -a NORMALPATHS
-FIFTHofMEM=1G
 while getopts "o:hn:" flag; do
     case "$flag" in
     o)
@@ -42,41 +41,6 @@ done
 shift $((OPTIND - 1))
 OPTIND=1
 OUTPATH=$(readlink -f "$OUTPATH")
-test ! -e "${OUTPATH}" || (
-    echo "File ${OUTPATH} exist. Will not do anything!"
-    exit 1
-)
-# Make temporary directory which will be cleaned at script exit
-TEMPDIR=$(mktemp --directory -p "$(dirname "$OUTPATH")")
-function _cleanup {
-    rm -r "$TEMPDIR"
-}
-trap _cleanup EXIT
-
-# Merge (Can't remove duplicates because CuteSV)
-find "${NORMALPATHS[@]}" -maxdepth 1 -name DEL.sigs -print0 |
-    xargs -0 sort -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} >"${TEMPDIR}/DEL.sigs" &
-
-find "${NORMALPATHS[@]}" -maxdepth 1 -name INS.sigs -print0 |
-    xargs -0 sort -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} >"${TEMPDIR}/INS.sigs" &
-
-find "${NORMALPATHS[@]}" -maxdepth 1 -name INV.sigs -print0 |
-    xargs -0 sort -k 2,2 -k 3,3 -k 4,5n --unique -S ${FIFTHofMEM} >"${TEMPDIR}/INV.sigs" &
-
-find "${NORMALPATHS[@]}" -maxdepth 1 -name TRA.sigs -print0 |
-    xargs -0 sort -k 2,2 -k 5,5 -k 3,3 -k 4,4n -k 6,6n --unique -S ${FIFTHofMEM} >"${TEMPDIR}/TRA.sigs" &
-
-find "${NORMALPATHS[@]}" -maxdepth 1 -name DUP.sigs -print0 |
-    xargs -0 sort -k 1,1r -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} >"${TEMPDIR}/DUP.sigs" &
-
-wait
-
-echo "Verifying output!"
-test -s "${TEMPDIR}/DUP.sigs"
-test -s "${TEMPDIR}/TRA.sigs"
-test -s "${TEMPDIR}/INV.sigs"
-test -s "${TEMPDIR}/INS.sigs"
-test -s "${TEMPDIR}/DEL.sigs"
 
-mv "${TEMPDIR}" "${OUTPATH}"
-trap EXIT
+# Merge (Can't remove duplicates because CuteSV, only identical signature lines are merged)
+cuddlySV-merge --threads 5 --output "${OUTPATH}" "${NORMALPATHS[@]}"
@@ -15,18 +15,21 @@ set -o pipefail
 OUTPATH="panel_of_normals_wrk/"
 usage() {
     echo -e "usage:
-$0 -o OUTPATH/ -i input.tsv
+$0 [-p THREADS] [-m MEMORY] -o OUTPATH/ -i input.tsv
 
 -o OUTPATH/
 -i input.tsv   Tab separated list of normal sample \"workdir/\\\\tcalls_with_RNAMES.vcf\"
+-p threads     Number of parallel merges [5]
+-m memory      Memory budget of merging [5G]
 -h          Show this message and exit." >&2
     exit 1
 
 }
 trap usage EXIT
 
-FIFTHofMEM=1G
-while getopts "o:hn:i:" flag; do
+THREADS=5
+MEMORY=5G
+while getopts "o:hn:i:p:m:" flag; do
     case "$flag" in
     o)
         OUTPATH="$OPTARG"
@@ -34,6 +37,12 @@ while getopts "o:hn:i:" flag; do
     i)
         INPUTFILE="$OPTARG"
         ;;
+    p)
+        THREADS="$OPTARG"
+        ;;
+    m)
+        MEMORY="$OPTARG"
+        ;;
     h | *)
         usage
         ;;
@@ -53,38 +62,20 @@ function _cleanup {
 }
 trap _cleanup EXIT
 
-cat "$INPUTFILE" | while read -r NORMALPATH NORMALVCF; do
+NORMALPATHS=()
+while read -r NORMALPATH NORMALVCF; do
     echo Running $NORMALPATH $NORMALVCF
-    bcftools query -f "%RNAMES\n" "${NORMALVCF}" | tr "," '\n' | sort -u >"${TEMPDIR}/_reads.lst"
-    test -s "${TEMPDIR}/_reads.lst" || (
+    bcftools query -f "%RNAMES\n" "${NORMALVCF}" | tr "," '\n' | sort -u >"${TEMPDIR}/_vcf_reads.lst"
+    test -s "${TEMPDIR}/_vcf_reads.lst" || (
         echo "Couldn't find RNAMES from ${NORMALVCF}!"
         exit 1
     )
-    for SIG_TYPE in DEL INS INV TRA DUP; do
-        grep -Ff "${TEMPDIR}/_reads.lst" "${NORMALPATH}/${SIG_TYPE}.sigs" >>"${TEMPDIR}/${SIG_TYPE}.sigs" &
-    done
-    wait
-done
-mkdir "${OUTPATH}"
-
-# Merge (Can't remove duplicates because CuteSV)
-
-sort -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} "${TEMPDIR}/DEL.sigs" >"${OUTPATH}/DEL.sigs" &
-
-sort -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} "${TEMPDIR}/INS.sigs" >"${OUTPATH}/INS.sigs" &
-
-sort -k 2,2 -k 3,3 -k 4,5n --unique -S ${FIFTHofMEM} "${TEMPDIR}/INV.sigs" >"${OUTPATH}/INV.sigs" &
-
-sort -k 2,2 -k 5,5 -k 3,3 -k 4,4n -k 6,6n --unique -S ${FIFTHofMEM} "${TEMPDIR}/TRA.sigs" >"${OUTPATH}/TRA.sigs" &
-
-sort -k 1,1r -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} "${TEMPDIR}/DUP.sigs" >"${OUTPATH}/DUP.sigs" &
-
-wait
-
-echo "Verifying output!"
-test -s "${OUTPATH}/DUP.sigs"
-test -s "${OUTPATH}/TRA.sigs"
-test -s "${OUTPATH}/INV.sigs"
-test -s "${OUTPATH}/INS.sigs"
-test -s "${OUTPATH}/DEL.sigs"
+    cat "${TEMPDIR}/_vcf_reads.lst" >>"${TEMPDIR}/_reads.lst"
+    NORMALPATHS+=("${NORMALPATH}")
+done <"$INPUTFILE"
+
+# Merge (Can't remove duplicates because CuteSV, only identical signature lines are merged)
+cuddlySV-merge --threads "${THREADS}" --memory "${MEMORY}" \
+    --read_names "${TEMPDIR}/_reads.lst" --output "${OUTPATH}" \
+    "${NORMALPATHS[@]}"
 echo "Looks fine!."
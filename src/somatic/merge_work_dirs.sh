@@ -16,17 +16,23 @@ OUTPATH="merged_work/"
 
 usage() {
     echo -e "usage:
-$0 -o OUTPATH/ -t TUMORINPATH1/ -n PONINPATH/ [MORE_IN_PATH..]
+$0 [-p THREADS] [-m MEMORY] -o OUTPATH/ -t TUMORINPATH1/ -n PONINPATH/ [MORE_IN_PATH..]
+
+Merge the signatures of the tumor and normal work directories. Identical signature
+lines, the same signature of the same read in several inputs, are written only once.
 
 -o OUTPATH/
 -t tumor_work_dir
 -n panel_of_normals_dir
+-p threads  Number of parallel merges [5]
+-m memory   Memory budget of merging [5G]
 -h          Show this message and exit." >&2
     exit 1
 
 }
-FIFTHofMEM=1G
-while getopts "o:ht:n:" flag; do
+THREADS=5
+MEMORY=5G
+while getopts "o:ht:n:p:m:" flag; do
     case "$flag" in
     o)
         OUTPATH="$OPTARG"
@@ -37,6 +43,12 @@ while getopts "o:ht:n:" flag; do
     n)
         NORMALPATHS=("$OPTARG" "${@:$OPTIND}")
         ;;
+    p)
+        THREADS="$OPTARG"
+        ;;
+    m)
+        MEMORY="$OPTARG"
+        ;;
     h | *)
         usage
         ;;
@@ -45,36 +57,12 @@ done
 shift $((OPTIND - 1))
 OPTIND=1
 OUTPATH=$(readlink -f "$OUTPATH")
-test ! -e "${OUTPATH}"
-# Make temporary directory which will be cleaned at script exit
-TEMPDIR=$(mktemp --directory -p "$(dirname "$OUTPATH")")
-function _cleanup {
-    rm -r "$TEMPDIR"
-}
-trap _cleanup EXIT
 
 # Can not remove duplicate reads since we need to keep the 'normal' information
+# (only identical signature lines are merged)
 
 echo Will merge following paths: "${TUMORPATH}" "${NORMALPATHS[@]}"
 
-sort -k 2,2 -k 3,4n -S ${FIFTHofMEM} "${TUMORPATH}/DEL.sigs" "${NORMALPATHS[@]/%/\/DEL.sigs}" >"${TEMPDIR}/DEL.sigs" &
-
-sort -k 2,2 -k 3,4n -S ${FIFTHofMEM} "${TUMORPATH}/INS.sigs" "${NORMALPATHS[@]/%/\/INS.sigs}" >"${TEMPDIR}/INS.sigs" &
-
-sort -k 2,2 -k 3,3 -k 4,5n -S ${FIFTHofMEM} "${TUMORPATH}/INV.sigs" "${NORMALPATHS[@]/%/\/INV.sigs}" >"${TEMPDIR}/INV.sigs" &
-
-sort -k 2,2 -k 5,5 -k 3,3 -k 4,4n -k 6,6n -S ${FIFTHofMEM} "${TUMORPATH}/TRA.sigs" "${NORMALPATHS[@]/%/\/TRA.sigs}" >"${TEMPDIR}/TRA.sigs" &
-
-sort -k 1,1r -k 2,2 -k 3,4n -S ${FIFTHofMEM} "${TUMORPATH}/DUP.sigs" "${NORMALPATHS[@]/%/\/DUP.sigs}" >"${TEMPDIR}/DUP.sigs" &
-
-wait
-ln -s "${TUMORPATH}/reads.sigs" "${TEMPDIR}/"
-
-test -s "${TEMPDIR}/DUP.sigs"
-test -s "${TEMPDIR}/TRA.sigs"
-test -s "${TEMPDIR}/INV.sigs"
-test -s "${TEMPDIR}/INS.sigs"
-test -s "${TEMPDIR}/DEL.sigs"
-
-mv "${TEMPDIR}" "${OUTPATH}"
-trap EXIT
+cuddlySV-merge --threads "${THREADS}" --memory "${MEMORY}" \
+    --output "${OUTPATH}" --reads_from "${TUMORPATH}" \
+    "${TUMORPATH}" "${NORMALPATHS[@]}"
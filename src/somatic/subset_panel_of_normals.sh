@@ -18,6 +18,7 @@ $0 -o OUTPATH/ -i INPATH/
 
 
 Subset OUTPATH panel of normals to INPATH selecting only samples listed in samples.tsv
+Only the first signature of each type, chromosome and position is kept.
 
 -o OUTPATH/
 -i INPATH/
@@ -27,7 +28,6 @@ Subset OUTPATH panel of normals to INPATH selecting only samples listed in sampl
 
 }
 
-FIFTHofMEM=1G
 while getopts "o:hi:s:" flag; do
     case "$flag" in
     o)
@@ -57,26 +57,8 @@ test -s "${SAMPLES}" || (
     exit 1
 )
 
-mkdir "${OUTPATH}"
-
-# Merge. Remove duplicates for PoN
-
-grep -Fwf ${SAMPLES} "${INPATH}/DEL.sigs" | sort -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} >"${OUTPATH}/DEL.sigs" &
-
-grep -Fwf ${SAMPLES} "${INPATH}/INS.sigs" | sort -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} >"${OUTPATH}/INS.sigs" &
-
-grep -Fwf ${SAMPLES} "${INPATH}/INV.sigs" | sort -k 2,2 -k 3,3 -k 4,5n --unique -S ${FIFTHofMEM} >"${OUTPATH}/INV.sigs" &
-
-grep -Fwf ${SAMPLES} "${INPATH}/TRA.sigs" | sort -k 2,2 -k 5,5 -k 3,3 -k 4,4n -k 6,6n --unique -S ${FIFTHofMEM} >"${OUTPATH}/TRA.sigs" &
-
-grep -Fwf ${SAMPLES} "${INPATH}/DUP.sigs" | sort -k 1,1r -k 2,2 -k 3,4n --unique -S ${FIFTHofMEM} >"${OUTPATH}/DUP.sigs" &
-
-wait
-
-echo "Verifying output!"
-test -s "${OUTPATH}/DUP.sigs"
-test -s "${OUTPATH}/TRA.sigs"
-test -s "${OUTPATH}/INV.sigs"
-test -s "${OUTPATH}/INS.sigs"
-test -s "${OUTPATH}/DEL.sigs"
+# Merge. Remove duplicates for PoN: keep one signature per type, chromosome and
+# position like sort --unique with the sort keys of the signatures
+cuddlySV-merge --threads 5 --unique_keys --read_groups "${SAMPLES}" \
+    --output "${OUTPATH}" "${INPATH}"
 echo "Looks fine!."
@@ -0,0 +1,92 @@
+"""Helpers shared by the test modules."""
+import random
+from pathlib import Path
+
+import pysam
+import pytest
+from hypothesis import strategies as st
+
+# Signature lines of the work dir .sigs files
+chroms = st.sampled_from(["chr1", "chr10", "chr2", "chrX"])
+positions = st.integers(min_value=0, max_value=50)
+read_ids = st.sampled_from(["r1:", "r2:", "r10:RG"])
+
+del_lines = st.builds(
+    lambda t, c, p, l, r: "%s\t%s\t%d\t%d\t%s\n" % (t, c, p, l, r),
+    st.sampled_from(["DEL", "DUP"]),
+    chroms,
+    positions,
+    positions,
+    read_ids,
+)
+ins_lines = st.builds(
+    lambda c, p, l, r, s: "INS\t%s\t%d\t%d\t%s\t%s\n" % (c, p, l, r, s),
+    chroms,
+    positions,
+    positions,
+    read_ids,
+    st.sampled_from(["", "A", "AC", "{chr1,1,0,0,2,1}"]),
+)
+inv_lines = st.builds(
+    lambda c, s, p, e, r: "INV\t%s\t%s\t%d\t%d\t%s\n" % (c, s, p, e, r),
+    chroms,
+    st.sampled_from(["++", "--"]),
+    positions,
+    positions,
+    read_ids,
+)
+tra_lines = st.builds(
+    lambda c, t, p, c2, p2, r: "TRA\t%s\t%s\t%d\t%s\t%d\t%s\n" % (c, t, p, c2, p2, r),
+    chroms,
+    st.sampled_from(["A", "B", "C", "D"]),
+    positions,
+    chroms,
+    positions,
+    read_ids,
+)
+
+
+def write_alignments(path: Path, n_reads: int = 12, seed: int = 0):
+    """Write reference ref.fa and indexed in.bam of reads with deletions to path.
+
+    Returns:
+        Tuple[Path, Path]: The alignment file and the reference.
+    """
+    rng = random.Random(seed)
+    ref = {
+        chrom: "".join(rng.choice("ACGT") for _ in range(8000))
+        for chrom in ("chr1", "chr2")
+    }
+    ref_path = path / "ref.fa"
+    with open(ref_path, "wt") as f:
+        for chrom, seq in ref.items():
+            f.write(">%s\n%s\n" % (chrom, seq))
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": chrom, "LN": len(seq)} for chrom, seq in ref.items()],
+        "RG": [{"ID": "rg1", "SM": "sample"}],
+    }
+    bam_path = path / "in.bam"
+    with pysam.AlignmentFile(str(bam_path), "wb", header=header) as f:
+        for tid, (chrom, seq) in enumerate(ref.items()):
+            for i in range(n_reads):
+                start = 1000 + 20 * i
+                read = pysam.AlignedSegment(f.header)
+                read.query_name = "%s_read%d" % (chrom, i)
+                read.reference_id = tid
+                read.reference_start = start
+                read.mapping_quality = 60
+                read.cigarstring = "1500M200D1500M"
+                read.query_sequence = (
+                    seq[start : start + 1500] + seq[start + 1700 : start + 3200]
+                )
+                read.set_tag("RG", "rg1")
+                f.write(read)
+    pysam.index(str(bam_path))
+    return bam_path, ref_path
+
+
+@pytest.fixture(scope="session")
+def alignment_files(tmp_path_factory):
+    "Indexed in.bam and ref.fa of write_alignments, shared by the tests reading them"
+    return write_alignments(tmp_path_factory.mktemp("alignments"))
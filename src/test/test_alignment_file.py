@@ -0,0 +1,124 @@
+import random
+import tempfile
+from pathlib import Path
+
+import pysam
+from hypothesis import given, settings, strategies as st
+
+from cuddlySV.alignment_file import (
+    get_read_id,
+    open_alignment_file,
+    signature_fields,
+)
+from cuddlySV.cuddlySV import parse_read
+
+REF_LENGTH = 20000
+
+# Start, clip operation, left clip, aligned bases, indel operation and length, aligned
+# bases, right clip and whether the read has a supplementary alignment
+reads = st.lists(
+    st.tuples(
+        st.integers(0, 15000),
+        st.sampled_from("SH"),
+        st.integers(0, 300),
+        st.integers(200, 1500),
+        st.sampled_from("ID"),
+        st.integers(5, 400),
+        st.integers(200, 1500),
+        st.integers(0, 300),
+        st.booleans(),
+    ),
+    min_size=1,
+    max_size=12,
+).map(sorted)
+
+
+def write_cram(path: Path, reads, seed: int = 0):
+    "Write reference ref.fa and in.cram of the reads, with their sequences"
+    rng = random.Random(seed)
+    ref = "".join(rng.choice("ACGT") for _ in range(REF_LENGTH + 5000))
+    ref_path = path / "ref.fa"
+    with open(ref_path, "wt") as f:
+        f.write(">chr1\n%s\n" % ref)
+    pysam.faidx(str(ref_path))
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": "chr1", "LN": len(ref), "UR": "file://%s" % ref_path}],
+        "RG": [{"ID": "rg1", "SM": "sample"}],
+    }
+    cram_path = path / "in.cram"
+    with pysam.AlignmentFile(
+        str(cram_path), "wc", header=header, reference_filename=str(ref_path)
+    ) as f:
+        for i, read_spec in enumerate(reads):
+            start, clip_op, clip, m1, op, length, m2, clip2, sa = read_spec
+            seq = ref[start : start + m1]
+            if op == "I":
+                seq += "".join(rng.choice("ACGT") for _ in range(length))
+                seq += ref[start + m1 : start + m1 + m2]
+            else:
+                seq += ref[start + m1 + length : start + m1 + length + m2]
+            cigar = "%dM%d%s%dM" % (m1, length, op, m2)
+            if clip_op == "S":
+                seq = "".join(rng.choice("ACGT") for _ in range(clip)) + seq
+                seq += "".join(rng.choice("ACGT") for _ in range(clip2))
+            if clip > 0:
+                cigar = "%d%s%s" % (clip, clip_op, cigar)
+            if clip2 > 0:
+                cigar = "%s%d%s" % (cigar, clip2, clip_op)
+            read = pysam.AlignedSegment(f.header)
+            read.query_name = "read%d" % i
+            read.reference_id = 0
+            read.reference_start = start
+            read.mapping_quality = 60
+            read.cigarstring = cigar
+            read.query_sequence = seq
+            read.query_qualities = pysam.qualitystring_to_array("I" * len(seq))
+            read.set_tag("RG", "rg1")
+            if sa:
+                read.set_tag("SA", "chr1,%d,-,%dS%dM,60,0;" % (start + 3000, m1, m2))
+            f.write(read)
+    pysam.index(str(cram_path))
+    return cram_path, ref_path
+
+
+def read_signatures(cram_path, fields, with_sequence):
+    "Signatures and read lengths of the reads decoding only the fields"
+    signatures = list()
+    with open_alignment_file(str(cram_path), fields) as f:
+        for read in f.fetch(until_eof=True):
+            length = read.query_length if with_sequence else read.infer_query_length()
+            candidate = parse_read(
+                read,
+                "chr1",
+                30,
+                20,
+                7,
+                500,
+                10,
+                0,
+                0,
+                100000,
+                get_read_id(read),
+                with_sequence,
+            )
+            signatures.append((length, [list(i) for i in candidate]))
+    return signatures
+
+
+@settings(deadline=None, max_examples=20)
+@given(reads=reads)
+def test_signature_fields(reads):
+    "The signature fields give the signatures of a full decode"
+    with tempfile.TemporaryDirectory() as tmp:
+        cram_path, _ref_path = write_cram(Path(tmp), reads)
+        with open_alignment_file(str(cram_path), signature_fields(False)) as f:
+            # The length is inferred from CIGAR, including for hard clipped reads
+            assert all(read.query_length == 0 for read in f.fetch(until_eof=True))
+        for need_sequence in (True, False):
+            full = read_signatures(cram_path, None, need_sequence)
+            fields = signature_fields(need_sequence)
+            assert read_signatures(cram_path, fields, need_sequence) == full
+        # The length from CIGAR is the one of the decoded sequence
+        full_lengths = [i[0] for i in read_signatures(cram_path, None, True)]
+        assert [i[0] for i in full] == full_lengths
@@ -0,0 +1,120 @@
+import tempfile
+from pathlib import Path
+
+import pysam
+from hypothesis import given, settings, strategies as st
+
+from cuddlySV.alignment_stream import (
+    load_stream_header,
+    parse_alignments,
+    stream_tasks,
+    write_stream_header,
+)
+from cuddlySV.Description import WorkDir
+from cuddlySV.reads_store import READS_STORE, read_columns, write_reads_store
+from cuddlySV.resolveTRA import call_gt
+
+HEADER = {
+    "HD": {"VN": "1.6", "SO": "coordinate"},
+    "SQ": [{"SN": "chr1", "LN": 5000}, {"SN": "chr2", "LN": 3000}],
+}
+
+alignments = st.lists(
+    st.tuples(st.integers(0, 1), st.integers(0, 2999), st.integers(1, 200)),
+    max_size=40,
+).map(sorted)
+
+
+@settings(deadline=None)
+@given(
+    positions=alignments,
+    batch_length=st.integers(100, 6000),
+    task_bytes=st.integers(1, 2000),
+)
+def test_stream_tasks(positions, batch_length, task_bytes):
+    "Each alignment is in the one task containing its start"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "in.bam"
+        with pysam.AlignmentFile(str(path), "wb", header=HEADER) as f:
+            header = f.header
+            for i, (tid, pos, length) in enumerate(positions):
+                read = pysam.AlignedSegment(header)
+                read.query_name = "read%d" % i
+                read.reference_id = tid
+                read.reference_start = pos
+                read.cigarstring = "%dM" % length
+                read.query_sequence = "A" * length
+                f.write(read)
+        write_stream_header(Path(tmp) / "header.sam", header)
+        saved_header = load_stream_header(Path(tmp) / "header.sam")
+
+        with pysam.AlignmentFile(str(path), "rb") as f:
+            tasks = list(stream_tasks(f, batch_length, task_bytes))
+        names = list()
+        prev_end = dict()
+        for (chrom, start, end), lines in tasks:
+            assert start < end
+            assert start >= prev_end.get(chrom, 0)
+            prev_end[chrom] = end
+            assert len(lines) > 0
+            for read in parse_alignments(saved_header, lines):
+                assert read.reference_name == chrom
+                assert start <= read.reference_start < end
+                names.append(read.query_name)
+        assert names == ["read%d" % i for i in range(len(positions))]
+
+
+@settings(deadline=None)
+@given(
+    positions=st.lists(
+        st.tuples(
+            st.integers(0, 1), st.integers(0, 2999), st.integers(1, 2000), st.booleans()
+        ),
+        max_size=40,
+    ).map(sorted),
+    pos_1=st.integers(0, 5000),
+    pos_2=st.integers(0, 3000),
+    gt_round=st.integers(1, 20),
+)
+def test_stream_translocation_genotype(positions, pos_1, pos_2, gt_round):
+    "Translocations of a stream are genotyped from the reads store like from the file"
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        path = tmp / "in.bam"
+        stored = {"chr1": list(), "chr2": list()}
+        with pysam.AlignmentFile(str(path), "wb", header=HEADER) as f:
+            for i, (tid, pos, length, primary) in enumerate(positions):
+                read = pysam.AlignedSegment(f.header)
+                read.query_name = "read%d" % i
+                read.reference_id = tid
+                read.reference_start = pos
+                read.mapping_quality = 60
+                read.flag = 0 if primary else pysam.FSUPPLEMENTARY
+                read.cigarstring = "%dM" % length
+                read.query_sequence = "A" * length
+                f.write(read)
+                stored[read.reference_name].append(
+                    (pos, read.reference_end, int(primary), i)
+                )
+        pysam.index(str(path))
+        write_reads_store(
+            tmp / READS_STORE,
+            {chrom: [read_columns(reads)] for chrom, reads in stored.items()},
+        )
+        # Supporting reads, not among the counted ones
+        read_ids = {"sup1", "sup2", "sup3"}
+        genotypes = [
+            call_gt(
+                WorkDir(str(tmp)),
+                bam_path,
+                pos_1,
+                pos_2,
+                "chr1",
+                "chr2",
+                read_ids,
+                50,
+                gt_round,
+            )
+            for bam_path in (str(path), "-")
+        ]
+        assert genotypes[0] == genotypes[1]
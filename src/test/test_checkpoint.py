@@ -0,0 +1,115 @@
+import os
+import tempfile
+from pathlib import Path
+
+from hypothesis import given, strategies as st
+
+from cuddlySV.checkpoint import (
+    TASK_MANIFEST,
+    load_task_record,
+    read_manifest,
+    remove_task_outputs,
+    task_prefix,
+    write_manifest,
+    write_task_record,
+)
+from cuddlySV.cuddlySV import extraction_params, process_bam_file
+from cuddlySV.Description import parseArgs
+from cuddlySV.read_names import READ_GROUPS, READ_NAMES
+from cuddlySV.signatures import SHARD_INDEX, write_shards
+
+from conftest import del_lines, tra_lines
+
+
+@given(
+    chrom=st.sampled_from(["chr1", "GL000192.1", "HLA-A*01:01"]),
+    lines=st.lists(st.one_of(del_lines, tra_lines)),
+)
+def test_task_record(chrom, lines):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp)
+        task = [chrom, 0, 1000]
+        other = [chrom, 1000, 2000]
+        for t in (task, other):
+            entries = write_shards(path, task_prefix(t), lines)
+            with open(path / (task_prefix(t) + ".names"), "wt") as f:
+                f.write("1\tread1\trg1\n")
+            record = write_task_record(
+                path,
+                t,
+                "a",
+                entries,
+                [task_prefix(t) + ".names", "missing"],
+                probed={("read1", "rg1"): 1},
+            )
+        assert load_task_record(path, other, "a") == record
+        assert record["probed"] == {("read1", "rg1"): 1}
+        assert set(record["files"]) == set(
+            [i[2] for i in entries] + [task_prefix(other) + ".names"]
+        )
+        assert load_task_record(path, other, "b") is None
+        with open(path / (task_prefix(other) + ".names"), "at") as f:
+            f.write("2\tread2\trg1\n")
+        assert load_task_record(path, other, "a") is None
+
+        remove_task_outputs(path, {task_prefix(task)})
+        assert load_task_record(path, task, "a") is None
+        assert all(name.startswith(task_prefix(other)) for name in os.listdir(path))
+
+
+def test_manifest():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "tasks.manifest"
+        assert read_manifest(path, {"batches": 10}) is None
+        batches = [[["chr1", 0, 10]], [["chr2", 0, 5], ["chr3", 0, 5]]]
+        write_manifest(path, {"batches": 10}, batches)
+        assert read_manifest(path, {"batches": 10}) == batches
+        assert read_manifest(path, {"batches": 20}) is None
+
+
+def collection_args(alignment_files, work_dir):
+    bam_path, ref_path = alignment_files
+    return parseArgs(
+        [str(bam_path), str(ref_path), str(work_dir.parent / "out.vcf"), str(work_dir)]
+        + ["--threads", "1"]
+    )
+
+
+def test_collect_to_missing_work_dir(alignment_files, tmp_path):
+    work_dir = tmp_path / "missing" / "wd"
+    args = collection_args(alignment_files, work_dir)
+    contigs, read_group = process_bam_file(args, work_dir)
+    assert contigs == [["chr1", 8000], ["chr2", 8000]]
+    assert read_group == "rg1"
+    assert (work_dir / READ_GROUPS).exists()
+    with open(work_dir / READ_NAMES, "rt") as f:
+        assert len(f.readlines()) == 24
+
+
+def test_resume_collection(alignment_files, tmp_path):
+    "An interrupted run into a new work dir runs only the unfinished tasks again"
+    work_dir = tmp_path / "missing" / "wd"
+    args = collection_args(alignment_files, work_dir)
+    process_bam_file(args, work_dir)
+    batches = read_manifest(work_dir / TASK_MANIFEST, extraction_params(args))
+    tasks = sorted(task for batch in batches for task in batch)
+    assert [task[0] for task in tasks] == ["chr1", "chr2"]
+    signatures_path = work_dir / "signatures"
+    with open(work_dir / SHARD_INDEX, "rt") as f:
+        shard_index = f.read()
+
+    # Interrupted before the second task was recorded
+    os.unlink(work_dir / SHARD_INDEX)
+    os.unlink(signatures_path / (task_prefix(tasks[1]) + ".task"))
+    finished = {
+        name: os.stat(signatures_path / name).st_mtime_ns
+        for name in os.listdir(signatures_path)
+        if name.startswith(task_prefix(tasks[0]))
+    }
+    process_bam_file(args, work_dir)
+    assert finished == {
+        name: os.stat(signatures_path / name).st_mtime_ns for name in finished
+    }
+    assert (signatures_path / (task_prefix(tasks[1]) + ".task")).exists()
+    with open(work_dir / SHARD_INDEX, "rt") as f:
+        assert f.read() == shard_index
@@ -0,0 +1,110 @@
+import numpy as np
+from hypothesis import given, strategies as st
+from pysam import CSOFT_CLIP, CHARD_CLIP, CMATCH, CINS, CDEL, CEQUAL, CDIFF, CREF_SKIP
+
+import cuddlySV.cuddlySV
+
+
+def reference_indel_sigs(cigar, pos_start, min_siglength):
+    "Per operation CIGAR walk as done before vectorization of parse_read"
+    dels, inss = [], []
+    shift_ref = 0
+    shift_ins_read = 0
+    for op, length in cigar:
+        if op == CDEL and length >= min_siglength:
+            dels.append([pos_start + shift_ref, length])
+        if op != CDEL:
+            shift_ins_read += length
+        if op == CINS and length >= min_siglength:
+            inss.append([pos_start + shift_ref, length, shift_ins_read])
+        if op in (CMATCH, CDEL, CEQUAL, CDIFF):
+            shift_ref += length
+    return dels, inss
+
+
+def reference_combine(sigs, svtype, merge_dis):
+    "Signal merging of the former generate_combine_sigs()"
+    if len(sigs) < 2:
+        return [list(i[:2]) for i in sigs]
+    combined = []
+    temp_sig = list(sigs[0][:2])
+    if svtype == "INS":
+        temp_sig += [sigs[0][0]]
+        for i in sigs[1:]:
+            if i[0] - temp_sig[2] <= merge_dis:
+                temp_sig[1] += i[1]
+                temp_sig[2] = i[0]
+            else:
+                combined.append(temp_sig[:2])
+                temp_sig = [i[0], i[1], i[0]]
+    else:
+        temp_sig += [sum(sigs[0][:2])]
+        for i in sigs[1:]:
+            if i[0] - temp_sig[2] <= merge_dis:
+                temp_sig[1] += i[1]
+                temp_sig[2] = i[0] + i[1]
+            else:
+                combined.append(temp_sig[:2])
+                temp_sig = [i[0], i[1], i[0]]
+    combined.append(temp_sig[:2])
+    return combined
+
+
+@st.composite
+def cigars(draw: st.DrawFn):
+    "Generate cigartuples with optional clips and interleaved indels"
+    cigar = []
+    clip = draw(st.sampled_from([None, CSOFT_CLIP, CHARD_CLIP]))
+    if clip is not None:
+        cigar.append((clip, draw(st.integers(min_value=1, max_value=1000))))
+    cigar.append((CMATCH, draw(st.integers(min_value=1, max_value=1000))))
+    for _ in range(draw(st.integers(min_value=0, max_value=30))):
+        op = draw(st.sampled_from([CINS, CDEL, CDEL, CREF_SKIP]))
+        cigar.append((op, draw(st.integers(min_value=1, max_value=200))))
+        cigar.append(
+            (
+                draw(st.sampled_from([CMATCH, CEQUAL, CDIFF])),
+                draw(st.integers(min_value=0, max_value=300)),
+            )
+        )
+    if clip is not None:
+        cigar.append((clip, draw(st.integers(min_value=1, max_value=1000))))
+    return cigar
+
+
+@given(
+    cigar=cigars(),
+    pos_start=st.integers(min_value=0, max_value=int(1e9)),
+    min_siglength=st.integers(min_value=1, max_value=100),
+    merge_dis=st.integers(min_value=0, max_value=500),
+)
+def test_scan_cigar_indels_equivalent(cigar, pos_start, min_siglength, merge_dis):
+    cigar_array = np.array(cigar, dtype=np.int64)
+    del_pos, del_len, ins_pos, ins_len, ins_query_end = (
+        cuddlySV.cuddlySV.scan_cigar_indels(
+            cigar_array[:, 0], cigar_array[:, 1], pos_start, min_siglength
+        )
+    )
+    dels, inss = reference_indel_sigs(cigar, pos_start, min_siglength)
+
+    assert [list(x) for x in zip(del_pos.tolist(), del_len.tolist())] == dels
+    assert [
+        list(x)
+        for x in zip(ins_pos.tolist(), ins_len.tolist(), ins_query_end.tolist())
+    ] == inss
+
+    starts = cuddlySV.cuddlySV.combine_del_sigs(del_pos, del_len, merge_dis)
+    combined = (
+        [list(x) for x in zip(del_pos[starts].tolist(), np.add.reduceat(del_len, starts).tolist())]
+        if len(starts)
+        else []
+    )
+    assert combined == reference_combine(dels, "DEL", merge_dis)
+
+    starts = cuddlySV.cuddlySV.combine_ins_sigs(ins_pos, merge_dis)
+    combined = (
+        [list(x) for x in zip(ins_pos[starts].tolist(), np.add.reduceat(ins_len, starts).tolist())]
+        if len(starts)
+        else []
+    )
+    assert combined == reference_combine(inss, "INS", merge_dis)
@@ -0,0 +1,286 @@
+import numpy as np
+from hypothesis import given, strategies as st
+
+from cuddlySV.cluster_arrays import (
+    closest_mean,
+    dup_segments,
+    first_occurrences,
+    indel_alleles,
+    inv_segments,
+    split_pieces,
+    tra_segments,
+)
+from cuddlySV.genotype import cal_CI
+
+
+def list_alleles(
+    sigs, read_count, max_cluster_bias, threshold_gloab, min_support, ratio
+):
+    "Alleles of (pos, len, read) signatures clustered with lists, as resolveINDEL did"
+    clusters = [[sigs[0]]] if sigs else []
+    for sig in sigs[1:]:
+        if sig[0] - clusters[-1][-1][0] > max_cluster_bias:
+            clusters.append([])
+        clusters[-1].append(sig)
+    alleles = list()
+    for cluster in clusters:
+        read_tag = dict()
+        for element in cluster:
+            if element[2] not in read_tag or element[1] > read_tag[element[2]][1]:
+                read_tag[element[2]] = element
+        if len(read_tag) < read_count:
+            continue
+        elements = sorted(read_tag.values(), key=lambda x: x[1])
+        threshold = threshold_gloab * np.mean([i[1] for i in elements])
+        collect = [[elements[0]]]
+        for element in elements[1:]:
+            if element[1] - collect[-1][-1][1] > threshold:
+                collect.append([])
+            collect[-1].append(element)
+        for allele in sorted(collect, key=len):
+            if len(allele) < min_support:
+                continue
+            pos_median, CIPOS, _ = cal_CI([i[0] for i in allele])
+            nearest = sorted((i[0] for i in allele), key=lambda x: abs(x - pos_median))
+            nearest = nearest[: max(int(ratio * len(allele)), 1)]
+            len_median, CILEN, _ = cal_CI([i[1] for i in allele])
+            alleles.append(
+                (
+                    [i[2] for i in allele],
+                    CIPOS,
+                    len_median,
+                    CILEN,
+                    int(np.mean(nearest)),
+                    nearest[0],
+                )
+            )
+    return alleles
+
+
+@given(
+    sigs=st.lists(
+        st.tuples(st.integers(0, 3000), st.integers(30, 200), st.integers(0, 6)),
+        max_size=60,
+    ).map(lambda x: sorted(x, key=lambda i: i[0])),
+    read_count=st.integers(1, 4),
+    max_cluster_bias=st.integers(0, 300),
+    threshold_gloab=st.sampled_from([0.0, 0.2, 0.3, 0.65]),
+    min_support=st.integers(1, 4),
+    ratio=st.sampled_from([0.0, 0.5, 0.98, 1.0]),
+)
+def test_indel_alleles(
+    sigs, read_count, max_cluster_bias, threshold_gloab, min_support, ratio
+):
+    pos, lens, reads = np.array(sigs, dtype=np.int64).reshape(-1, 3).T
+    alleles = indel_alleles(
+        pos, lens, reads, read_count, max_cluster_bias, threshold_gloab, min_support
+    )
+    found = list()
+    for i in range(len(alleles.pos_median)):
+        members = alleles.members[alleles.bounds[i] : alleles.bounds[i + 1]]
+        k = max(int(ratio * len(members)), 1)
+        mean, closest = closest_mean(pos[members], alleles.pos_median[i], k)
+        found.append(
+            (
+                reads[members].tolist(),
+                "%d,%d" % (alleles.pos_low[i], alleles.pos_high[i]),
+                alleles.len_median[i],
+                "%d,%d" % (alleles.len_low[i], alleles.len_high[i]),
+                int(mean),
+                closest,
+            )
+        )
+    assert found == list_alleles(
+        sigs, read_count, max_cluster_bias, threshold_gloab, min_support, ratio
+    )
+
+
+def list_segments(clusters, read_count, max_cluster_bias, min_count, breakpoints):
+    "Segments of (bp_1, bp_2, read) clusters split by bp_2, as resolveINV/DUP did"
+    segments = list()
+    for cluster in clusters:
+        if len(cluster) < read_count:
+            continue
+        cluster = sorted(cluster, key=lambda x: x[1])
+        split = [[cluster[0]]]
+        for sig in cluster[1:]:
+            if sig[1] - split[-1][-1][1] > max_cluster_bias:
+                split.append([])
+            split[-1].append(sig)
+        for segment in split:
+            reads = list(dict.fromkeys(i[2] for i in segment))
+            if len(segment) >= min_count and len(reads) >= read_count:
+                segments.append((reads, *breakpoints(segment)))
+    return segments
+
+
+def inv_breakpoints(segment):
+    return tuple(round(sum(i[k] for i in segment) / len(segment)) for k in (0, 1))
+
+
+def dup_breakpoints(segment):
+    low, up = int(len(segment) * 0.4), int(len(segment) * 0.6)
+    if low == up:
+        return segment[low][:2]
+    return tuple(int(sum(i[k] for i in segment[low:up]) / (up - low)) for k in (0, 1))
+
+
+def found_segments(segments, reads):
+    return [
+        (
+            first_occurrences(
+                reads[segments.members[segments.bounds[i] : segments.bounds[i + 1]]]
+            ).tolist(),
+            segments.bp_1[i],
+            segments.bp_2[i],
+        )
+        for i in range(len(segments.bp_1))
+    ]
+
+
+breakpoint_sigs = st.lists(
+    st.tuples(st.integers(0, 2000), st.integers(0, 2000), st.integers(0, 6)),
+    max_size=60,
+)
+
+
+@given(
+    sigs=st.lists(
+        st.tuples(
+            st.integers(0, 2000),
+            st.integers(0, 2000),
+            st.integers(0, 6),
+            st.sampled_from(["FF", "RR"]),
+        ),
+        max_size=60,
+    ).map(lambda x: sorted(x, key=lambda i: (i[3], i[0]))),
+    read_count=st.integers(1, 4),
+    max_cluster_bias=st.integers(0, 300),
+)
+def test_inv_segments(sigs, read_count, max_cluster_bias):
+    clusters = list()
+    for sig in sigs:
+        prev = clusters[-1][-1] if clusters else None
+        if (
+            prev is None
+            or sig[0] - prev[0] > max_cluster_bias
+            or sig[1] - prev[1] > max_cluster_bias
+            or sig[3] != prev[3]
+        ):
+            clusters.append([])
+        clusters[-1].append(sig)
+    strand = np.array([i[3].encode() for i in sigs], "S")
+    bp_1, bp_2, reads = np.array([i[:3] for i in sigs], dtype=np.int64).reshape(-1, 3).T
+    segments = inv_segments(strand, bp_1, bp_2, reads, read_count, max_cluster_bias)
+    assert found_segments(segments, reads) == list_segments(
+        clusters, read_count, max_cluster_bias, read_count, inv_breakpoints
+    )
+
+
+@given(
+    sigs=breakpoint_sigs.map(sorted),
+    read_count=st.integers(1, 4),
+    max_cluster_bias=st.integers(0, 300),
+)
+def test_dup_segments(sigs, read_count, max_cluster_bias):
+    clusters = list()
+    for sig in sigs:
+        if not clusters or sig[0] - clusters[-1][-1][0] > max_cluster_bias:
+            clusters.append([])
+        clusters[-1].append(sig)
+    pos_1, pos_2, reads = np.array(sigs, dtype=np.int64).reshape(-1, 3).T
+    segments = dup_segments(pos_1, pos_2, reads, read_count, max_cluster_bias)
+    assert found_segments(segments, reads) == list_segments(
+        clusters, read_count, max_cluster_bias, 0, dup_breakpoints
+    )
+
+
+@given(
+    sigs=st.lists(
+        st.tuples(
+            st.integers(0, 2000),
+            st.integers(0, 2000),
+            st.integers(0, 8),
+            st.sampled_from(["A", "B"]),
+        ),
+        max_size=80,
+    ).map(lambda x: sorted(x, key=lambda i: (i[3], i[0]))),
+    read_count=st.integers(1, 4),
+    max_cluster_bias=st.integers(0, 300),
+    overlap_size=st.sampled_from([0.2, 0.6, 0.9]),
+)
+def test_tra_segments(sigs, read_count, max_cluster_bias, overlap_size):
+    expected = list()
+    clusters = list()
+    for sig in sigs:
+        prev = clusters[-1][-1] if clusters else None
+        if prev is None or sig[0] - prev[0] > max_cluster_bias or sig[3] != prev[3]:
+            clusters.append([])
+        clusters[-1].append(sig)
+    for cluster in clusters:
+        if len(cluster) < read_count or len(set(i[2] for i in cluster)) < read_count:
+            continue
+        cluster = sorted(cluster, key=lambda x: x[1])
+        # The first signature is counted twice
+        split = [[cluster[0], cluster[0]]]
+        for sig in cluster[1:]:
+            if sig[1] - split[-1][-1][1] > max_cluster_bias:
+                split.append([])
+            split[-1].append(sig)
+        split.sort(key=lambda x: -len(set(i[2] for i in x)))
+        distinct = [len(set(i[2] for i in x)) for x in split[:2]]
+        if len(split) > 1 and distinct[1] >= 0.5 * read_count:
+            called = split[:2] if sum(distinct) >= len(cluster) * overlap_size else []
+        else:
+            called = split[:1] if distinct[0] >= len(cluster) * overlap_size else []
+        for segment in called:
+            expected.append(
+                (
+                    list(dict.fromkeys(i[2] for i in segment)),
+                    *(int(sum(i[k] for i in segment) / len(segment)) for k in (0, 1)),
+                )
+            )
+
+    bnd_type = np.array([i[3].encode() for i in sigs], "S")
+    pos_1, pos_2, reads = np.array([i[:3] for i in sigs], dtype=np.int64).reshape(-1, 3).T
+    segments = tra_segments(
+        bnd_type, pos_1, pos_2, reads, read_count, max_cluster_bias, overlap_size
+    )
+    assert found_segments(segments, reads) == expected
+
+
+@given(
+    sigs=st.lists(
+        st.tuples(
+            st.integers(0, 2000),
+            st.integers(0, 2000),
+            st.integers(0, 6),
+            st.sampled_from(["FF", "RR"]),
+        ),
+        max_size=60,
+    ).map(lambda x: sorted(x, key=lambda i: (i[3], i[0]))),
+    read_count=st.integers(1, 4),
+    max_cluster_bias=st.integers(0, 300),
+    piece_size=st.integers(1, 30),
+)
+def test_split_pieces(sigs, read_count, max_cluster_bias, piece_size):
+    strand = np.array([i[3].encode() for i in sigs], "S")
+    bp_1, bp_2, reads = np.array([i[:3] for i in sigs], dtype=np.int64).reshape(-1, 3).T
+    columns = {"strand": strand, "bp_1": bp_1, "bp_2": bp_2}
+    pieces = split_pieces("INV", columns, max_cluster_bias, piece_size)
+    assert pieces[0][0] == 0 and pieces[-1][1] == len(sigs)
+    assert all(a[1] == b[0] for a, b in zip(pieces, pieces[1:]))
+    assert all(end - start >= piece_size for start, end in pieces[:-1])
+    found = list()
+    for start, end in pieces:
+        segments = inv_segments(
+            strand[start:end],
+            bp_1[start:end],
+            bp_2[start:end],
+            reads[start:end],
+            read_count,
+            max_cluster_bias,
+        )
+        found.extend(found_segments(segments, reads[start:end]))
+    segments = inv_segments(strand, bp_1, bp_2, reads, read_count, max_cluster_bias)
+    assert found == found_segments(segments, reads)
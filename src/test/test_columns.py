@@ -0,0 +1,38 @@
+import tempfile
+from pathlib import Path
+
+from hypothesis import given, strategies as st
+
+from cuddlySV.columns import (
+    COLUMNS,
+    column_records,
+    load_columns,
+    parse_record,
+    write_key_columns,
+)
+
+from conftest import del_lines, ins_lines, inv_lines, tra_lines
+
+
+@given(
+    svtype_lines=st.one_of(
+        st.lists(del_lines, min_size=1).map(
+            lambda x: [i for i in x if i.startswith(x[0][:3])]
+        ),
+        st.lists(ins_lines, min_size=1),
+        st.lists(inv_lines, min_size=1),
+        st.lists(tra_lines, min_size=1),
+    )
+)
+def test_columns_roundtrip(svtype_lines):
+    svtype = svtype_lines[0].split("\t", 1)[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cols"
+        assert write_key_columns(path, svtype, iter(svtype_lines)) == len(svtype_lines)
+        columns = load_columns(path, svtype)
+        for name, _, kind in COLUMNS[svtype]:
+            if kind in ("int", "read"):
+                assert len(columns[name]) == len(svtype_lines)
+        assert list(column_records(svtype, columns)) == [
+            parse_record(svtype, line) for line in svtype_lines
+        ]
@@ -0,0 +1,44 @@
+from hypothesis import given, strategies as st
+
+from cuddlySV.genotype import IntervalIndex
+
+intervals = st.lists(
+    st.tuples(
+        st.integers(min_value=-1000, max_value=10000),
+        st.integers(min_value=1, max_value=3000),
+    ).map(lambda x: (x[0], x[0] + x[1])),
+    max_size=50,
+)
+
+
+@given(
+    regions=intervals,
+    task=st.tuples(
+        st.integers(min_value=0, max_value=10000), st.integers(min_value=1, max_value=5000)
+    ),
+    reads=st.lists(
+        st.tuples(
+            st.integers(min_value=0, max_value=15000),
+            st.integers(min_value=1, max_value=3000),
+        ),
+        max_size=20,
+    ),
+)
+def test_interval_index_matches_linear_scan(regions, task, reads):
+    "Reads starting within the task overlap the same regions as with the former region scan"
+    task_start, task_end = task[0], task[0] + task[1]
+    task_regions = [
+        item
+        for item in sorted(regions)
+        if (task_start <= item[0] < task_end) or item[0] <= task_start < item[1]
+    ]
+    index = IntervalIndex(regions).subset(task_start, task_end)
+    assert (len(index) == 0) == (len(task_regions) == 0)
+    for read_start, read_len in reads:
+        read_start += task_start
+        read_end = read_start + read_len
+        expected = any(
+            not (read_end <= region[0] or read_start >= region[1])
+            for region in task_regions
+        )
+        assert index.overlaps(read_start, read_end) == expected
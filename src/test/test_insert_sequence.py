@@ -0,0 +1,45 @@
+from hypothesis import given, strategies as st
+
+from cuddlySV.insert_sequence import DeferredQuery, DeferredSequence, take
+
+
+class QueryStore(object):
+    "Fetcher stand-in returning the query sequence of the only alignment"
+
+    def __init__(self, query):
+        self.query = query
+
+    def query_sequence(self, locator, read_name):
+        return self.query
+
+
+slices = st.tuples(
+    st.one_of(st.none(), st.integers(min_value=-50, max_value=250)),
+    st.one_of(st.none(), st.integers(min_value=-50, max_value=250)),
+    st.sampled_from([None, 1, -1]),
+).map(lambda x: slice(*x))
+
+
+@given(
+    query=st.text(alphabet="ACGT", max_size=200),
+    operations=st.lists(slices, max_size=4),
+    truncate=st.integers(min_value=0, max_value=250),
+)
+def test_deferred_query_slices_like_str(query, operations, truncate):
+    deferred = DeferredQuery("chr1", 100, 0, len(query))
+    expected = query
+    for operation in operations:
+        deferred = deferred[operation]
+        expected = expected[operation]
+    assert len(deferred) == len(expected)
+    assert take(query, deferred.indices) == expected
+
+    # Merged signals concatenate the tokens
+    tokens = DeferredSequence.parse(str(deferred) + str(deferred))
+    if len(expected) == 0:
+        assert tokens == ""
+        return
+    assert len(tokens) == 2 * len(expected)
+    assert tokens[0:truncate].resolve(QueryStore(query), "read") == (expected * 2)[
+        0:truncate
+    ]
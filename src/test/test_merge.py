@@ -0,0 +1,160 @@
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from hypothesis import given, settings, strategies as st
+
+from conftest import del_lines, ins_lines, inv_lines, tra_lines
+from cuddlySV.Description import WorkDir
+from cuddlySV.merge import RUN_MEMORY, merge_work_dirs
+from cuddlySV.read_names import PROBED_NAMES, READ_NAMES, iter_names, write_names
+from cuddlySV.signatures import (
+    SHARD_INDEX,
+    SIGNATURE_TYPES,
+    SORT_KEYS,
+    write_shard,
+    write_shard_index,
+    write_shards,
+)
+
+# Keys of the sort --unique of the old subset_panel_of_normals.sh
+UNIQUE_SORTS = {
+    "DEL": ["-k", "2,2", "-k", "3,4n"],
+    "INS": ["-k", "2,2", "-k", "3,4n"],
+    "DUP": ["-k", "1,1r", "-k", "2,2", "-k", "3,4n"],
+    "INV": ["-k", "2,2", "-k", "3,3", "-k", "4,5n"],
+    "TRA": ["-k", "2,2", "-k", "5,5", "-k", "3,3", "-k", "4,4n", "-k", "6,6n"],
+}
+
+TUMOR = [
+    "DEL\tchr1\t100\t50\tr1:T\n",
+    "DEL\tchr1\t90\t50\tr2:T\n",
+    "INS\tchr2\t10\t30\tr1:T\tACGT\n",
+    "TRA\tchr1\tA\t10\tchr2\t20\tr3:T\n",
+]
+NORMAL = [
+    "DEL\tchr1\t100\t50\tr4:N\n",
+    "DEL\tchr1\t100\t50\tr1:T\n",
+    "INV\tchr1\t++\t10\t400\tr4:N\n",
+    "TRA\tchr1\tA\t10\tchr2\t20\tr5:N\n",
+]
+
+
+def make_work_dir(path: Path, tasks):
+    (path / "signatures").mkdir(parents=True)
+    entries = list()
+    for i, lines in enumerate(tasks):
+        prefix = "_chr1_%d_%d" % (i, i + 1)
+        entries += write_shards(path / "signatures", prefix, lines)
+        reads_path = path / "signatures" / (prefix + ".reads")
+        entries += write_shard(
+            reads_path, "reads", ["chr1\t%d\t%d\t1\tr%d:T\n" % (i, i + 1, i)]
+        )
+    write_shard_index(path / SHARD_INDEX, entries)
+
+
+def test_merge_work_dirs():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        make_work_dir(tmp / "tumor", [TUMOR[:2], TUMOR[2:], TUMOR[:1]])
+        make_work_dir(tmp / "normal", [NORMAL])
+        # Two runs per merge
+        merge_work_dirs(
+            tmp / "merged",
+            [tmp / "tumor", tmp / "normal"],
+            reads_from=tmp / "tumor",
+            threads=1,
+            memory=2 * RUN_MEMORY,
+        )
+        merged = WorkDir(str(tmp / "merged"))
+        assert list(merged.lines("DEL", "chr1")) == [
+            "DEL\tchr1\t90\t50\tr2:T\n",
+            "DEL\tchr1\t100\t50\tr1:T\n",
+            "DEL\tchr1\t100\t50\tr4:N\n",
+        ]
+        assert list(merged.lines("TRA", "chr1", "chr2")) == [TUMOR[3], NORMAL[3]]
+        assert list(merged.lines("reads", "chr1")) == list(
+            WorkDir(str(tmp / "tumor")).lines("reads", "chr1")
+        )
+
+        merge_work_dirs(
+            tmp / "pon", [tmp / "normal"], read_names={"r4"}, read_groups={"N"}
+        )
+        pon = WorkDir(str(tmp / "pon"))
+        assert pon.load_valuable_chr() == {"DEL": ["chr1"], "INV": ["chr1"]}
+        assert list(pon.lines("DEL", "chr1")) == [NORMAL[0]]
+
+
+def test_merge_read_id_collision():
+    "Reads of different inputs with the same ID are merged with distinct IDs"
+    with tempfile.TemporaryDirectory() as tmp, mock.patch(
+        "cuddlySV.read_names.read_id", lambda query_name, read_group: 1
+    ):
+        tmp = Path(tmp)
+        for name, read in [("tumor", ("r1", "T")), ("normal", ("r2", "N"))]:
+            make_work_dir(tmp / name, [["DEL\tchr1\t100\t50\t1\n"]])
+            write_names(tmp / name / READ_NAMES, {1: read})
+        merge_work_dirs(tmp / "merged", [tmp / "normal", tmp / "tumor"])
+        merged = WorkDir(str(tmp / "merged"))
+        assert list(merged.lines("DEL", "chr1")) == [
+            "DEL\tchr1\t100\t50\t1\n",
+            "DEL\tchr1\t100\t50\t2\n",
+        ]
+        assert list(iter_names(tmp / "merged" / READ_NAMES)) == [
+            (1, "r1", "T"),
+            (2, "r2", "N"),
+        ]
+        assert list(iter_names(tmp / "merged" / PROBED_NAMES)) == [(2, "r2", "N")]
+
+        # The probed IDs of an input are probed again
+        make_work_dir(tmp / "other", [["DEL\tchr1\t90\t50\t1\n"]])
+        write_names(tmp / "other" / READ_NAMES, {1: ("r0", "N")})
+        merge_work_dirs(
+            tmp / "pon", [tmp / "merged", tmp / "other"], read_names={"r2", "r0"}
+        )
+        pon = WorkDir(str(tmp / "pon"))
+        assert list(pon.lines("DEL", "chr1")) == [
+            "DEL\tchr1\t90\t50\t1\n",
+            "DEL\tchr1\t100\t50\t3\n",
+        ]
+        assert list(iter_names(tmp / "pon" / READ_NAMES)) == [
+            (1, "r0", "N"),
+            (3, "r2", "N"),
+        ]
+
+
+@settings(deadline=None, max_examples=30)
+@given(
+    lines=st.lists(st.one_of(del_lines, ins_lines, inv_lines, tra_lines), max_size=60),
+    split=st.integers(0, 60),
+)
+def test_merge_unique_keys(lines, split):
+    "unique_keys keeps the lines of sort --unique of the merged lines"
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        make_work_dir(tmp / "a", [lines[:split]])
+        make_work_dir(tmp / "b", [lines[split:]])
+        merge_work_dirs(tmp / "all", [tmp / "a", tmp / "b"], threads=1)
+        merge_work_dirs(
+            tmp / "unique", [tmp / "a", tmp / "b"], threads=1, unique_keys=True
+        )
+        merged = WorkDir(str(tmp / "all"))
+        unique = WorkDir(str(tmp / "unique"))
+        for svtype in SIGNATURE_TYPES:
+            keys = merged.idx.get(f"{svtype}.sigs", {})
+            assert list(keys) == list(unique.idx.get(f"{svtype}.sigs", {}))
+            for key in keys:
+                key = key if isinstance(key, tuple) else (key,)
+                expected = subprocess.run(
+                    ["sort"] + UNIQUE_SORTS[svtype] + ["--unique"],
+                    input="".join(merged.lines(svtype, *key)),
+                    env=dict(os.environ, LC_ALL="C"),
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.splitlines(keepends=True)
+                # In the order of the shards, by the whole line after the TRA position
+                expected.sort(key=SORT_KEYS[svtype])
+                assert list(unique.lines(svtype, *key)) == expected
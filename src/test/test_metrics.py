@@ -0,0 +1,39 @@
+from hypothesis import given, strategies as st
+
+from cuddlySV.metrics import SKIP_REASONS, summarize_metrics, task_metrics
+
+
+@given(
+    counts=st.lists(
+        st.tuples(
+            st.sampled_from(SKIP_REASONS),
+            st.integers(0, 100),
+            st.sampled_from(["DEL", "INS", "TRA"]),
+            st.floats(0, 10),
+            st.integers(0, 1 << 20),
+        ),
+        max_size=20,
+    )
+)
+def test_summarize_metrics(counts):
+    tasks = list()
+    for i, (reason, n, svtype, seconds, rss) in enumerate(counts):
+        metrics = task_metrics(["chr1", i, i + 1])
+        metrics["reads"]["fetched"] = n
+        metrics["reads"][reason] = n
+        metrics["signatures"][svtype] = n
+        metrics["seconds"]["parse"] = seconds
+        metrics["peak_rss_kb"] = rss
+        tasks.append(metrics)
+    summary = summarize_metrics(tasks)
+    assert summary["tasks"] == len(counts)
+    assert summary["reads"].get("fetched", 0) == sum(i[1] for i in counts)
+    for reason in SKIP_REASONS:
+        assert summary["reads"].get(reason, 0) == sum(
+            i[1] for i in counts if i[0] == reason
+        )
+    assert sum(summary["signatures"].values()) == sum(i[1] for i in counts)
+    assert summary["peak_rss_kb"]["task"] == max((i[4] for i in counts), default=0)
+    assert len(summary["slowest_tasks"]) == min(len(counts), 10)
+    slowest = [i["seconds"] for i in summary["slowest_tasks"]]
+    assert slowest == sorted(slowest, reverse=True)
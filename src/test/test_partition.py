@@ -0,0 +1,68 @@
+import numpy as np
+from hypothesis import given, strategies as st
+
+from cuddlySV.partition import (
+    LINEAR_WINDOW,
+    SMALL_TASK_FRACTION,
+    coalesce_tasks,
+    partition_tasks,
+    split_contig,
+)
+
+
+@given(
+    contig_len=st.integers(min_value=1, max_value=200 * LINEAR_WINDOW),
+    window_bytes=st.lists(st.integers(min_value=0, max_value=10000), max_size=250),
+    target_bytes=st.floats(min_value=1.0, max_value=1e6),
+    min_windows=st.integers(min_value=1, max_value=10),
+    max_windows=st.integers(min_value=10, max_value=100),
+)
+def test_split_contig_covers_contig(
+    contig_len, window_bytes, target_bytes, min_windows, max_windows
+):
+    window_bytes = np.array(window_bytes, dtype=np.float64)
+    max_len = max_windows * LINEAR_WINDOW
+    intervals = split_contig(
+        contig_len, window_bytes, target_bytes, min_windows * LINEAR_WINDOW, max_len
+    )
+    assert intervals[0][0] == 0
+    assert intervals[-1][1] == contig_len
+    for (_, prev_end, _), (start, end, _) in zip(intervals, intervals[1:]):
+        assert prev_end == start
+    assert all(0 < end - start <= max_len for start, end, _ in intervals)
+    assert np.isclose(sum(i[2] for i in intervals), window_bytes.sum())
+
+
+@given(
+    costs=st.lists(st.floats(min_value=0.0, max_value=1e4), max_size=100),
+    target_cost=st.floats(min_value=1.0, max_value=1e4),
+)
+def test_coalesce_tasks_keeps_tasks(costs, target_cost):
+    tasks = [(["chr%d" % i, 0, 1], cost) for i, cost in enumerate(costs)]
+    batches = coalesce_tasks(tasks, target_cost)
+    assert sorted(task[0] for batch, _ in batches for task in batch) == sorted(
+        task[0][0] for task in tasks
+    )
+    cost_of = {task[0]: cost for task, cost in tasks}
+    for batch, batch_cost in batches:
+        assert np.isclose(batch_cost, sum(cost_of[task[0]] for task in batch))
+        if len(batch) > 1:
+            assert all(
+                cost_of[task[0]] < target_cost * SMALL_TASK_FRACTION for task in batch
+            )
+    assert [i[1] for i in batches] == sorted((i[1] for i in batches), reverse=True)
+
+
+@given(batches=st.integers(min_value=1000, max_value=40000))
+def test_partition_tasks_batches(alignment_files, batches):
+    "Tasks are at most --batches long, also below the resolution of the index"
+    bam_path, _ref_path = alignment_files
+    contigs = [("chr1", 8000), ("chr2", 8000)]
+    task_batches = partition_tasks(str(bam_path), ["chr1", "chr2"], contigs, batches, 2)
+    tasks = sorted(task for batch, _cost in task_batches for task in batch)
+    for chrom, length in contigs:
+        starts = [task[1] for task in tasks if task[0] == chrom]
+        ends = [task[2] for task in tasks if task[0] == chrom]
+        assert starts[0] == 0 and ends[-1] == length
+        assert starts[1:] == ends[:-1]
+    assert all(task[2] - task[1] <= batches for task in tasks)
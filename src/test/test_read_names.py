@@ -0,0 +1,120 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from hypothesis import given, strategies as st
+
+from cuddlySV.merge import read_kept
+from cuddlySV.read_names import (
+    NamesWriter,
+    ReadIdCollision,
+    iter_names,
+    lookup_names,
+    merge_names,
+    parse_read_id,
+    probe_collisions,
+    probed_read_id,
+    read_id,
+    resolve_rnames,
+    rnames_ids,
+    write_names,
+)
+
+names = st.tuples(
+    st.text("abcdef0123456789_/", min_size=1, max_size=12),
+    st.sampled_from(["rg1", "rg2", "NA"]),
+)
+
+
+@given(
+    tasks=st.lists(st.lists(names, max_size=10), min_size=1, max_size=4),
+    spill_names=st.integers(1, 4),
+)
+def test_merge_names(tasks, spill_names):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        inputs = list()
+        for i, task in enumerate(tasks):
+            inputs.append(tmp / ("_%d.names" % i))
+            if i % 2 == 0:
+                write_names(inputs[-1], {read_id(*name): name for name in task})
+            else:
+                writer = NamesWriter(inputs[-1], spill_names)
+                for name in task:
+                    writer.add(read_id(*name), *name)
+                writer.close()
+        all_names = {read_id(*name): name for task in tasks for name in task}
+        assert sorted(i.name for i in tmp.iterdir()) == sorted(i.name for i in inputs)
+        merged = merge_names(tmp / "read_names.tsv", [(i, {}) for i in inputs])
+        assert merged.count == len(all_names)
+        assert merged.remaps == [{} for _ in inputs] and merged.probed == {}
+
+        rnames = ",".join([str(i) for i in sorted(all_names)] + ["legacy:rg1"])
+        looked_up = lookup_names(tmp / "read_names.tsv", rnames_ids(rnames))
+        assert resolve_rnames(rnames, looked_up) == ",".join(
+            ["%s:%s" % all_names[i] for i in sorted(all_names)] + ["legacy:rg1"]
+        )
+
+
+def weak_read_id(query_name, read_group):
+    # Few IDs, so that reads collide
+    return len(query_name) % 3
+
+
+def collect_names(path, task, spill_names):
+    "Write the names of a task like region_signatures, again until IDs are distinct"
+    probed = dict()
+    while True:
+        writer = NamesWriter(path, spill_names, probed=probed)
+        try:
+            for name in task:
+                writer.add(writer.read_id(*name), *name)
+            writer.close()
+            return probed
+        except ReadIdCollision as exc:
+            assert len(exc.names) > 1
+            probed.update(probe_collisions(exc.names))
+
+
+@given(
+    tasks=st.lists(st.lists(names, max_size=10), min_size=1, max_size=4),
+    spill_names=st.integers(1, 4),
+)
+def test_merge_names_collision(tasks, spill_names):
+    with tempfile.TemporaryDirectory() as tmp, mock.patch(
+        "cuddlySV.read_names.read_id", weak_read_id
+    ):
+        tmp = Path(tmp)
+        sources = list()
+        for i, task in enumerate(tasks):
+            path = tmp / ("_%d.names" % i)
+            sources.append((path, collect_names(path, task, spill_names)))
+            task_ids = [rid for rid, _, _ in iter_names(path)]
+            assert task_ids == sorted(set(task_ids))
+        merged = merge_names(tmp / "read_names.tsv", sources)
+
+        final = {(q, rg): rid for rid, q, rg in iter_names(tmp / "read_names.tsv")}
+        assert merged.count == len(final) == len(set(final.values()))
+        assert set(final) == set(name for task in tasks for name in task)
+        # The outputs of the tasks are remapped to the merged IDs
+        for task, (_, probed), remap in zip(tasks, sources, merged.remaps):
+            for name in task:
+                rid = probed_read_id(*name, probed)
+                assert remap.get(rid, rid) == final[name]
+        assert merged.probed == {
+            name: rid for name, rid in final.items() if rid != weak_read_id(*name)
+        }
+
+
+@given(name=names)
+def test_read_kept(name):
+    rid = read_id(*name)
+    assert parse_read_id(str(rid)) == rid
+    line = "DEL\tchr1\t100\t50\t%d\n" % rid
+    assert read_kept("DEL", line, None, None)
+    assert read_kept("DEL", line, {"other"}, None, kept_ids={rid})
+    assert not read_kept("DEL", line, {"%s:%s" % name}, None, kept_ids=set())
+    legacy = "DEL\tchr1\t100\t50\t%s:%s\n" % name
+    assert read_kept("DEL", legacy, {name[0]}, {name[1]}, kept_ids=set())
+    assert not read_kept("DEL", legacy, None, {"other"})
+
@@ -0,0 +1,69 @@
+import tempfile
+from pathlib import Path
+
+from hypothesis import given, strategies as st
+
+from cuddlySV.Description import WorkDir
+from cuddlySV.reads_store import (
+    READS_STORE,
+    ReadsWriter,
+    merge_reads_parts,
+    read_columns,
+    remap_reads_store,
+    write_reads_store,
+)
+
+reads = st.tuples(
+    st.integers(0, 2**31 - 1),
+    st.integers(0, 2**31 - 1),
+    st.integers(0, 1),
+    st.integers(0, 2**63 - 1),
+)
+tasks = st.lists(
+    st.tuples(st.sampled_from(["chr1", "chr2", "chrX"]), st.lists(reads)), max_size=5
+)
+
+
+@given(tasks=tasks, spill_reads=st.integers(1, 4))
+def test_reads_store_roundtrip(tasks, spill_reads):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        parts = list()
+        remaps = list()
+        expected = dict()
+        for i, (chrom, task_reads) in enumerate(tasks):
+            parts.append(tmp / ("_%d.reads.bin" % i))
+            if i % 2 == 0:
+                write_reads_store(parts[-1], {chrom: [read_columns(task_reads)]})
+            else:
+                writer = ReadsWriter(parts[-1], chrom, spill_reads)
+                for read in task_reads:
+                    writer.add(*read)
+                assert writer.close() == len(task_reads)
+            # New IDs for every other read of the part
+            remaps.append({read[3]: i for read in task_reads[::2]})
+            expected.setdefault(chrom, list()).extend(
+                read[:3] + (remaps[-1].get(read[3], read[3]),) for read in task_reads
+            )
+        assert sorted(tmp.iterdir()) == sorted(parts)
+        n_reads = merge_reads_parts(tmp / READS_STORE, parts, remaps)
+        assert n_reads == sum(len(i) for i in expected.values())
+
+        work_dir = WorkDir(str(tmp))
+        assert work_dir.reads_stored
+        assert work_dir.read_counts() == {k: len(v) for k, v in expected.items()}
+        for chrom in ["chr1", "chr2", "chrX", "chrY"]:
+            assert list(work_dir.reads(chrom)) == expected.get(chrom, [])
+        assert list(work_dir.all_reads()) == [
+            "%s\t%d\t%d\t%d\t%d\n" % ((chrom,) + read)
+            for chrom, chrom_reads in expected.items()
+            for read in chrom_reads
+        ]
+
+        remap = {read[3]: read[3] // 2 for reads in expected.values() for read in reads}
+        remap_reads_store(tmp / READS_STORE, remap)
+        work_dir = WorkDir(str(tmp))
+        for chrom, chrom_reads in expected.items():
+            assert list(work_dir.reads(chrom)) == [
+                read[:3] + (read[3] // 2,) for read in chrom_reads
+            ]
@@ -0,0 +1,175 @@
+import tempfile
+from pathlib import Path
+
+from hypothesis import given, strategies as st
+
+from cuddlySV.Description import WorkDir
+from cuddlySV.signatures import (
+    READ_ID_FIELD,
+    SHARD_INDEX,
+    SORT_KEYS,
+    ShardWriter,
+    remap_shard,
+    write_shard,
+    write_shard_index,
+    write_shards,
+)
+
+from conftest import del_lines, ins_lines, inv_lines, tra_lines
+
+
+@given(
+    tasks=st.lists(
+        st.lists(st.one_of(del_lines, ins_lines, inv_lines, tra_lines), max_size=30),
+        min_size=1,
+        max_size=4,
+    ),
+    compress=st.booleans(),
+)
+def test_shards_merge_like_sort_unique(tasks, compress):
+    "Merged shards equal the signatures sorted as by sort -u | sort -k.."
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        (work_dir / "signatures").mkdir()
+        entries = list()
+        for i, task_lines in enumerate(tasks):
+            prefix = "_chr1_%d_%d" % (i, i + 1)
+            entries += write_shards(
+                work_dir / "signatures", prefix, task_lines, compress
+            )
+            reads_path = work_dir / "signatures" / (prefix + ".reads")
+            entries += write_shard(
+                reads_path, "reads", ["chr1\t%d\t%d\t1\tr%d:\n" % (i, i + 1, i)]
+            )
+        write_shard_index(work_dir / SHARD_INDEX, entries)
+
+        wrk = WorkDir(tmp)
+        assert not wrk.temp_dir_empty()
+        all_lines = set(line for task_lines in tasks for line in task_lines)
+        valuable_chr = wrk.load_valuable_chr()
+        for svtype in ("DEL", "DUP", "INS", "INV"):
+            expected = sorted(
+                (line for line in all_lines if line.startswith(svtype + "\t")),
+                key=SORT_KEYS[svtype],
+            )
+            merged = [
+                line
+                for chrom in valuable_chr.get(svtype, [])
+                for line in wrk.lines(svtype, chrom)
+            ]
+            assert sorted(merged, key=SORT_KEYS[svtype]) == expected
+            for chrom in valuable_chr.get(svtype, []):
+                chrom_lines = list(wrk.lines(svtype, chrom))
+                assert chrom_lines == [x for x in expected if x.split("\t")[1] == chrom]
+        expected = sorted(
+            (line for line in all_lines if line.startswith("TRA\t")),
+            key=SORT_KEYS["TRA"],
+        )
+        for chrom, chrom2_list in valuable_chr.get("TRA", {}).items():
+            for chrom2 in chrom2_list:
+                assert list(wrk.lines("TRA", chrom, chrom2)) == [
+                    x
+                    for x in expected
+                    if x.split("\t")[1] == chrom and x.split("\t")[4] == chrom2
+                ]
+        assert len(list(wrk.lines("reads", "chr1"))) == len(tasks)
+
+
+@given(
+    lines=st.lists(st.one_of(del_lines, ins_lines, inv_lines, tra_lines), max_size=60),
+    compress=st.booleans(),
+)
+def test_merged_sigs_sidecar_index(lines, compress):
+    "Merged TYPE.sigs(.gz) files are read by chromosome through the sidecar index"
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        suffix = ".gz" if compress else ""
+        expected = dict()
+        for svtype in ("DEL", "DUP", "INS", "INV", "TRA", "reads"):
+            type_lines = sorted(
+                set(line for line in lines if line.startswith(svtype + "\t")),
+                key=SORT_KEYS.get(svtype),
+            )
+            write_shard(work_dir / f"{svtype}.sigs{suffix}", svtype, type_lines)
+            for line in type_lines:
+                seq = line.split("\t")
+                key = (seq[1], seq[4]) if svtype == "TRA" else (seq[1],)
+                expected.setdefault((svtype,) + key, list()).append(line)
+        reads = ["chr2\t0\t1\t1\tr1:\n", "chr1\t0\t1\t1\tr2:\n"]
+        write_shard(work_dir / f"reads.sigs{suffix}", "reads", reads)
+
+        for _ in range(2):
+            # Scanned and then loaded from the sidecar
+            wrk = WorkDir(tmp)
+            for (svtype, *key), key_lines in expected.items():
+                assert list(wrk.lines(svtype, *key)) == key_lines
+            assert list(wrk.lines("reads", "chr1")) == ["chr1\t0\t1\t1\tr2:\n"]
+            assert list(wrk.all_reads()) == reads
+            assert (work_dir / f"DEL.sigs{suffix}.idx").exists()
+
+        if not compress:
+            with (work_dir / "reads.sigs").open("at") as f:
+                f.write("chr1\t5\t6\t1\tr3:\n")
+            assert len(list(WorkDir(tmp).lines("reads", "chr1"))) == 2
+
+
+@given(
+    lines=st.lists(st.one_of(del_lines, ins_lines, inv_lines, tra_lines), max_size=40),
+    spill_lines=st.integers(1, 8),
+    compress=st.booleans(),
+)
+def test_shard_writer_spills(lines, spill_lines, compress):
+    "Shards written through spilled runs equal the shards written at once"
+    with tempfile.TemporaryDirectory() as tmp:
+        at_once = Path(tmp) / "at_once"
+        spilled = Path(tmp) / "spilled"
+        at_once.mkdir()
+        spilled.mkdir()
+        entries = write_shards(at_once, "_chr1_0_1", lines, compress)
+        writer = ShardWriter(spilled, "_chr1_0_1", compress, spill_lines)
+        for line in lines:
+            writer.add(line)
+        assert writer.close() == entries
+        assert sorted(i.name for i in spilled.iterdir()) == sorted(
+            i.name for i in at_once.iterdir()
+        )
+        for shard in at_once.iterdir():
+            with open(shard, "rb") as a, open(spilled / shard.name, "rb") as b:
+                assert a.read() == b.read()
+
+
+def with_read_id(line, rid):
+    seq = line.rstrip("\n").split("\t")
+    seq[READ_ID_FIELD[seq[0]]] = str(rid)
+    return "\t".join(seq) + "\n"
+
+
+@given(
+    lines=st.lists(
+        st.builds(
+            with_read_id,
+            st.one_of(del_lines, ins_lines, inv_lines, tra_lines),
+            st.integers(0, 20),
+        ),
+        max_size=40,
+    ),
+    remap=st.dictionaries(st.integers(0, 20), st.integers(0, 20)),
+)
+def test_remap_shard(lines, remap):
+    "Remapped shards equal the shards of the lines with the new read IDs"
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        entries = write_shards(tmp, "_chr1_0_1", lines)
+        for name in set(entry[2] for entry in entries):
+            shard_entries = [entry for entry in entries if entry[2] == name]
+            svtype = shard_entries[0][0]
+            remapped = [
+                with_read_id(line, remap.get(int(rid), int(rid)))
+                for line in lines
+                if line.startswith(svtype + "\t")
+                for rid in [line.rstrip("\n").split("\t")[READ_ID_FIELD[svtype]]]
+            ]
+            remap_shard(tmp / name, tmp / ("remapped" + name), shard_entries, remap)
+            with open(tmp / ("remapped" + name), "rt") as f:
+                assert f.readlines() == sorted(set(remapped), key=SORT_KEYS[svtype])
+
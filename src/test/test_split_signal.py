@@ -0,0 +1,100 @@
+import pysam
+from hypothesis import given, strategies as st
+
+from cuddlySV.cuddlySV import is_1d2_read
+from cuddlySV.split_signal import (
+    decode_sa_entry,
+    decode_sa_tag,
+    organize_split_signal,
+)
+
+cigars = st.tuples(
+    st.integers(0, 2000),
+    st.integers(100, 3000),
+    st.lists(
+        st.tuples(st.integers(1, 3000), st.sampled_from("MIDN=X")),
+        max_size=5,
+    ),
+    st.integers(0, 2000),
+    st.sampled_from("SH"),
+).map(
+    lambda x: "".join(
+        ["%d%s" % (x[0], x[4])] * (x[0] > 0)
+        + ["%dM" % x[1]]
+        + ["%d%s" % i for i in x[2]]
+        + ["%d%s" % (x[3], x[4])] * (x[3] > 0)
+    )
+)
+
+sa_entries = st.builds(
+    "{},{},{},{},{},{}".format,
+    st.sampled_from(["chr1", "chr2", "chrX"]),
+    st.integers(1, 100000),
+    st.sampled_from("+-"),
+    cigars,
+    st.integers(0, 60),
+    st.integers(0, 100),
+)
+
+
+@given(entries=st.lists(sa_entries, max_size=8))
+def test_decode_sa_tag(entries):
+    tag = "".join(i + ";" for i in entries)
+    decoded = decode_sa_tag(tag)
+    assert decoded == tuple(decode_sa_entry(i) for i in entries)
+    # Without the trailing ';' the last entry is kept
+    assert decode_sa_tag(";".join(entries)) == decoded
+
+    hits = decode_sa_tag.cache_info().hits
+    assert decode_sa_tag(tag) is decoded
+    assert decode_sa_tag.cache_info().hits == hits + 1
+
+
+@given(
+    entries=st.lists(sa_entries, min_size=1, max_size=8),
+    primary=st.tuples(
+        st.integers(0, 1000),
+        st.integers(100, 20000),
+        st.integers(0, 100000),
+        st.integers(100, 20000),
+        st.sampled_from(["chr1", "chr2", "chrX"]),
+        st.sampled_from("+-"),
+    ).map(lambda x: (x[0], x[0] + x[1], x[2], x[2] + x[3], x[4], x[5])),
+    min_mapq=st.integers(0, 60),
+    max_split_parts=st.sampled_from([-1, 2, 7]),
+)
+def test_organize_split_signal(entries, primary, min_mapq, max_split_parts):
+    "Decoded SA entries give the same signatures as the entries of the tag"
+    total_L = primary[1] + 5000
+    candidates = list()
+    for supplementary in (entries, decode_sa_tag(";".join(entries))):
+        candidate = list()
+        organize_split_signal(
+            primary,
+            list(supplementary),
+            total_L,
+            30,
+            min_mapq,
+            max_split_parts,
+            "read",
+            candidate,
+            -1,
+            "A" * total_L,
+        )
+        candidates.append(candidate)
+    assert candidates[0] == candidates[1]
+
+
+def test_is_1d2_read_without_trailing_semicolon():
+    header = pysam.AlignmentHeader.from_dict({"SQ": [{"SN": "chr1", "LN": 10000}]})
+    read = pysam.AlignedSegment(header)
+    read.query_name = "read"
+    read.reference_id = 0
+    read.reference_start = 1000
+    read.cigarstring = "1000M"
+    # The opposite strand part overlapping the alignment is the last entry
+    other = "chr1,5001,+,1000M,60,0"
+    reverse = "chr1,1001,-,1000M,60,0"
+    for tag in (other + ";" + reverse + ";", other + ";" + reverse):
+        read.set_tag("SA", tag)
+        assert is_1d2_read(read)
@@ -0,0 +1,36 @@
+import argparse
+
+import pytest
+from hypothesis import given, strategies as st
+
+from cuddlySV.thread_budget import (
+    AUTO,
+    STAGES,
+    htslib_threads_arg,
+    split_threads,
+)
+
+
+@given(
+    threads=st.integers(1, 64),
+    htslib_threads=st.one_of(st.just(AUTO), st.just(0), st.integers(2, 8)),
+    stage=st.sampled_from(sorted(STAGES)),
+)
+def test_split_threads(threads, htslib_threads, stage):
+    split = split_threads(threads, htslib_threads, "-", stage)
+    assert split.workers >= 1
+    if htslib_threads == AUTO:
+        # Streamed input gets no pools
+        assert split == (threads, 0)
+    else:
+        assert split.htslib_threads == htslib_threads
+        assert split.workers * (1 + htslib_threads) <= max(threads, 1 + htslib_threads)
+
+
+def test_htslib_threads_arg():
+    assert htslib_threads_arg("auto") == AUTO
+    assert htslib_threads_arg("0") == 0
+    assert htslib_threads_arg("4") == 4
+    for value in ("1", "-2", "x"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            htslib_threads_arg(value)
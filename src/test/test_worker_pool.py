@@ -0,0 +1,61 @@
+import operator
+import pickle
+import tempfile
+
+import pytest
+from hypothesis import given, settings, strategies as st
+
+from cuddlySV.Description import WorkDir
+from cuddlySV.worker_pool import (
+    ordered_results,
+    run_largest_first,
+    run_tasks,
+    start_pool,
+)
+
+pool = None
+
+
+def setup_module():
+    global pool
+    pool = start_pool(2)
+
+
+def teardown_module():
+    pool.terminate()
+
+
+@settings(deadline=None, max_examples=20)
+@given(values=st.lists(st.integers(-100, 100), max_size=20), workers=st.integers(1, 3))
+def test_run_tasks(values, workers):
+    tasks = [(operator.neg, value) for value in values]
+    results = list(run_tasks(pool, iter(tasks), workers))
+    assert sorted(i for i, _ in results) == list(range(len(values)))
+    assert ordered_results(results) == [-value for value in values]
+
+
+@settings(deadline=None, max_examples=20)
+@given(costs=st.lists(st.integers(0, 5), max_size=20))
+def test_run_largest_first(costs):
+    tasks = [(operator.neg, i) for i in range(len(costs))]
+    results = list(run_largest_first(pool, tasks, costs, 1))
+    # One worker finishes the tasks in the order they are submitted
+    assert [i for i, _, _ in results] == sorted(
+        range(len(costs)), key=lambda i: -costs[i]
+    )
+    assert all(result == -i and seconds >= 0 for i, result, seconds in results)
+
+
+def test_run_tasks_raises():
+    with pytest.raises(ValueError):
+        list(run_tasks(pool, [(operator.neg, 1), (int, "x"), (operator.neg, 2)], 1))
+
+
+def test_work_dir_pickled_by_path():
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = WorkDir(tmp)
+        work_dir._index = {"DEL.sigs": {"chr1": [("x" * 1000, 0, 1)]}}
+        data = pickle.dumps(work_dir)
+        assert len(data) < 1000
+        assert pickle.loads(data) is pickle.loads(data)
+        assert pickle.loads(data).path == work_dir.path